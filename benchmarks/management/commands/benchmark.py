@@ -0,0 +1,60 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import suite
+
+
+class Command(BaseCommand):
+    help = ('Benchmark trip-time and equipment calculations, list queries, API endpoints and bulk '
+            'import on synthetic fleets, and compare the results with a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100_000],
+                            help='Fleet sizes to run (default: 1000 100000)')
+        parser.add_argument('--only', nargs='+', choices=list(suite.BENCHMARKS),
+                            help='Run only these benchmarks')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per benchmark; the fastest is kept (default 3)')
+        parser.add_argument('--max-objects', type=int, default=100_000,
+                            help='Largest number of in-memory instances for calculation benchmarks '
+                                 '(default 100000)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic fleets')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+                            help='Baseline JSON file (default: benchmarks/baseline.json)')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write the results to the baseline file instead of comparing')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown before a result counts as a regression (default 0.2)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when a regression is found')
+
+    def handle(self, *args, **options):
+        results = suite.run(
+            options['sizes'], names=options['only'], repeat=options['repeat'],
+            max_objects=options['max_objects'], seed=options['seed'], progress=self._progress)
+
+        if options['output']:
+            suite.save(results, options['output'])
+        if options['save_baseline']:
+            suite.save(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one")
+            return
+        regressions = suite.compare(results, suite.load(options['baseline']), options['threshold'])
+        for key, message in regressions:
+            self.stderr.write(self.style.ERROR(f'Regression in {key}: {message}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regression(s) against the baseline')
+
+    def _progress(self, name, size, result):
+        rate = f"{result['rate']:,.0f}/s" if result['rate'] else '-'
+        self.stdout.write(f"{name:<24} {size:>9,} {result['items']:>11,} items "
+                          f"{result['seconds']:>9.4f} s {rate:>16} {result['queries']:>5} queries")
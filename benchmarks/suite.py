@@ -0,0 +1,385 @@
+"""
+Benchmarks for the calculation hot paths, API endpoints and bulk import.
+
+Each benchmark runs against a synthetic fleet of a given size (relays,
+transformers and lines with random but realistic ratings, generated from a
+fixed seed).  The fleet is written to the database inside a transaction
+that is rolled back afterwards, so a run leaves the database unchanged.
+
+Calculation benchmarks start from model instances held in memory, so they
+run on at most ``max_objects`` items of the fleet; compare them by their
+per-item rate.  Query, endpoint and import benchmarks use the whole fleet
+in the database.
+
+A result records the best of ``repeat`` runs in seconds, the item rate and
+the number of database queries.  ``compare`` flags results that are slower
+than a baseline by more than a threshold, or that make more queries.
+"""
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from relay.curves import RelayCurveSet
+from relay.models import Relay
+from substation_equipment.bulk import import_rows
+from substation_equipment.calculations import (
+    line_arrays, line_ratings, transformer_arrays, transformer_ratings,
+)
+from substation_equipment.models import Transformer, TransmissionLine
+
+
+BENCHMARKS = {}
+
+KVA_RATINGS = (500, 1000, 2500, 5000, 10000, 20000, 40000, 100000)
+VOLTAGES = (400, 11000, 33000, 66000, 132000)
+CURVES = (
+    ('iec', 'standard_inverse'), ('iec', 'very_inverse'), ('iec', 'extremely_inverse'),
+    ('ieee', 'moderately_inverse'), ('ieee', 'very_inverse'), ('ieee', 'extremely_inverse'),
+)
+
+# Fault currents evaluated against every relay
+FAULT_CURRENTS = np.geomspace(100, 20000, 16)
+
+PAGE_SIZE = 100
+API_BATCH = 1000
+
+
+def benchmark(name, uses_database=False):
+    """Register a benchmark function taking (fleet, context) and returning an item count."""
+    def decorator(function):
+        BENCHMARKS[name] = (function, uses_database)
+        return function
+    return decorator
+
+
+class _Rollback(Exception):
+    pass
+
+
+class SyntheticFleet:
+    """
+    Random relays, transformers and lines.
+
+    Instances are generated on demand in chunks, so a million-row fleet is
+    never held in memory at once.
+    """
+
+    def __init__(self, size, seed=0, max_objects=100_000, prefix='bench'):
+        self.size = size
+        self.seed = seed
+        self.max_objects = max_objects
+        self.prefix = prefix
+
+    def _generator(self, stream):
+        return np.random.default_rng([self.seed, stream])
+
+    def transformer_rows(self, count=None, start=0):
+        count = self.size if count is None else count
+        generator = self._generator(1 + start)
+        kva = generator.choice(KVA_RATINGS, count)
+        secondary = generator.choice(VOLTAGES[:-1], count)
+        primary = secondary * generator.choice((3, 6, 12), count)
+        impedance = np.round(generator.uniform(4, 14, count), 2)
+        taps = generator.choice((0, 5, 10, 15), count)
+        for index in range(count):
+            yield {
+                'name': f'{self.prefix}-T{start + index}',
+                'kva_rating': int(kva[index]),
+                'primary_voltage': float(primary[index]),
+                'secondary_voltage': float(secondary[index]),
+                'impedance': float(impedance[index]),
+                'phase_type': 'three',
+                'tap_min': -float(taps[index]),
+                'tap_max': float(taps[index]),
+            }
+
+    def transformers(self, count=None, start=0):
+        return [Transformer(**row) for row in self.transformer_rows(count, start)]
+
+    def lines(self, count=None, start=0):
+        count = self.size if count is None else count
+        generator = self._generator(1_000_000 + start)
+        kva = generator.choice(KVA_RATINGS, count)
+        voltage = generator.choice(VOLTAGES[1:], count)
+        length = np.round(generator.uniform(1, 100, count), 1)
+        return [
+            TransmissionLine(
+                name=f'{self.prefix}-L{start + index}', kva_rating=int(kva[index]),
+                voltage_rating=float(voltage[index]), impedance=float(np.round(length[index] / 10, 2)),
+                length=float(length[index]), r_per_km=0.05, x_per_km=0.4)
+            for index in range(count)
+        ]
+
+    def relays(self, count=None, start=0, transformer_ids=None):
+        count = self.size if count is None else count
+        generator = self._generator(2_000_000 + start)
+        curve = generator.integers(0, len(CURVES), count)
+        tds = np.round(generator.uniform(0.05, 1.0, count), 2)
+        pickup = np.round(generator.uniform(50, 2000, count))
+        relays = []
+        for index in range(count):
+            standard, curve_type = CURVES[curve[index]]
+            relays.append(Relay(
+                name=f'{self.prefix}-R{start + index}', type='oc', protected_equipment='tra',
+                standard=standard, curve_type=curve_type, tds=float(tds[index]),
+                current_setting=float(pickup[index]),
+                transformer_id=transformer_ids[index] if transformer_ids is not None else None))
+        return relays
+
+    def capped(self):
+        return min(self.size, self.max_objects)
+
+    def save(self, batch_size=5000):
+        """Write transformers, lines and relays (one per transformer) to the database."""
+        for start in range(0, self.size, batch_size):
+            count = min(batch_size, self.size - start)
+            transformers = self.transformers(count, start)
+            for transformer in transformers:
+                transformer.update_computed_fields()
+            Transformer.objects.bulk_create(transformers, batch_size=batch_size)
+            ids = list(Transformer.objects.filter(name__in=[item.name for item in transformers])
+                       .order_by('pk').values_list('pk', flat=True))
+            Relay.objects.bulk_create(self.relays(count, start, ids), batch_size=batch_size)
+            lines = self.lines(count, start)
+            for line in lines:
+                line.update_computed_fields()
+            TransmissionLine.objects.bulk_create(lines, batch_size=batch_size)
+
+
+# Calculations --------------------------------------------------------------
+
+def _instances(context, fleet, kind):
+    """Instances shared by the benchmarks of one fleet, built once."""
+    if kind not in context:
+        context[kind] = getattr(fleet, kind)(fleet.capped())
+    return context[kind]
+
+
+@benchmark('trip_time_scalar')
+def trip_time_scalar(fleet, context):
+    relays = _instances(context, fleet, 'relays')
+    currents = FAULT_CURRENTS.tolist()
+    context['start']()
+    for relay in relays:
+        for current in currents:
+            relay.calculate_trip_time(current)
+    return len(relays) * len(currents)
+
+
+@benchmark('trip_time_batch')
+def trip_time_batch(fleet, context):
+    relays = _instances(context, fleet, 'relays')
+    context['start']()
+    RelayCurveSet(relays).trip_times(FAULT_CURRENTS)
+    return len(relays) * len(FAULT_CURRENTS)
+
+
+@benchmark('transformer_scalar')
+def transformer_scalar(fleet, context):
+    transformers = _instances(context, fleet, 'transformers')
+    context['start']()
+    for transformer in transformers:
+        transformer.update_computed_fields()
+    return len(transformers)
+
+
+@benchmark('transformer_batch')
+def transformer_batch(fleet, context):
+    transformers = _instances(context, fleet, 'transformers')
+    context['start']()
+    transformer_ratings(**transformer_arrays(transformers))
+    return len(transformers)
+
+
+@benchmark('line_batch')
+def line_batch(fleet, context):
+    lines = _instances(context, fleet, 'lines')
+    context['start']()
+    line_ratings(**line_arrays(lines))
+    return len(lines)
+
+
+# Queries and endpoints -----------------------------------------------------
+
+@benchmark('relay_list_page', uses_database=True)
+def relay_list_page(fleet, context):
+    context['start']()
+    relays = list(Relay.objects.with_equipment().order_by('-pk')[:PAGE_SIZE])
+    [relay.equipment.name for relay in relays]
+    return len(relays)
+
+
+@benchmark('transformer_list_page', uses_database=True)
+def transformer_list_page(fleet, context):
+    context['start']()
+    transformers = list(Transformer.objects.prefetch_related('relays')
+                        .filter(primary_fault_current__gte=1000).order_by('-pk')[:PAGE_SIZE])
+    for transformer in transformers:
+        len(transformer.relays.all())
+    return len(transformers)
+
+
+def _post(path, data):
+    request = RequestFactory().post(path, json.dumps(data), content_type='application/json')
+    match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} returned {response.status_code}: {response.content[:200]}')
+    return response
+
+
+@benchmark('api_trip_times', uses_database=True)
+def api_trip_times(fleet, context):
+    ids = list(Relay.objects.order_by('pk').values_list('pk', flat=True)[:API_BATCH])
+    context['start']()
+    _post('/api/relays/trip-times/', {'relays': ids, 'fault_currents': FAULT_CURRENTS.tolist()})
+    return len(ids) * len(FAULT_CURRENTS)
+
+
+@benchmark('api_transformer_batch', uses_database=True)
+def api_transformer_batch(fleet, context):
+    ids = list(Transformer.objects.order_by('pk').values_list('pk', flat=True)[:API_BATCH])
+    context['start']()
+    _post('/api/equipment/transformers/batch/', {'ids': ids})
+    return len(ids)
+
+
+@benchmark('import_transformers', uses_database=True)
+def import_transformers(fleet, context):
+    import csv
+
+    path = os.path.join(context['directory'], 'transformers.csv')
+    if not os.path.exists(path):
+        rows = fleet.transformer_rows(fleet.size, start=fleet.size)
+        first = next(rows)
+        with open(path, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(first))
+            writer.writeheader()
+            writer.writerow(first)
+            writer.writerows(rows)
+    context['start']()
+    result = import_rows(Transformer, path, 'csv', batch_size=1000)
+    return result.written
+
+
+# Runner --------------------------------------------------------------------
+
+def run(sizes, names=None, repeat=3, max_objects=100_000, seed=0, progress=None):
+    """
+    Run benchmarks on fleets of each size.
+
+    Returns:
+        Dictionary with 'environment' and 'results'; results are keyed
+        '<benchmark>/<size>'
+    """
+    names = list(BENCHMARKS) if names is None else names
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise KeyError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for size in sizes:
+        fleet = SyntheticFleet(size, seed=seed, max_objects=max_objects)
+        context = {}
+        memory = [name for name in names if not BENCHMARKS[name][1]]
+        database = [name for name in names if BENCHMARKS[name][1]]
+        for name in memory:
+            results[f'{name}/{size}'] = _measure(name, fleet, context, repeat)
+            if progress is not None:
+                progress(name, size, results[f'{name}/{size}'])
+        context.clear()
+
+        if database:
+            with tempfile.TemporaryDirectory() as directory:
+                try:
+                    with transaction.atomic():
+                        fleet.save()
+                        context['directory'] = directory
+                        for name in database:
+                            results[f'{name}/{size}'] = _measure(
+                                name, fleet, context, repeat, rollback=name.startswith('import_'))
+                            if progress is not None:
+                                progress(name, size, results[f'{name}/{size}'])
+                        raise _Rollback
+                except _Rollback:
+                    pass
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'database': connection.vendor,
+        },
+        'results': results,
+    }
+
+
+def _measure(name, fleet, context, repeat, rollback=False):
+    function = BENCHMARKS[name][0]
+    best = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = []
+            # Setup done before start() is neither timed nor counted
+            context['start'] = lambda: started.append((time.perf_counter(), len(queries)))
+            if rollback:
+                # Each import run starts from the same table
+                savepoint = transaction.savepoint()
+            count = function(fleet, context)
+            elapsed = time.perf_counter() - started[-1][0]
+            if rollback:
+                transaction.savepoint_rollback(savepoint)
+        query_count = sum(1 for query in queries.captured_queries[started[-1][1]:]
+                          if 'SAVEPOINT' not in query['sql'])
+        if best is None or elapsed < best['seconds']:
+            best = {'items': count, 'seconds': elapsed}
+    # Queries of the last, warm run (the first may fill caches)
+    best['queries'] = query_count
+    best['rate'] = best['items'] / best['seconds'] if best['seconds'] else None
+    return best
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Regressions of results against a baseline.
+
+    A benchmark regresses when it takes more than (1 + threshold) times the
+    baseline time, or makes more database queries.
+
+    Returns:
+        List of (key, message)
+    """
+    regressions = []
+    for key, result in results['results'].items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        if result['seconds'] > previous['seconds'] * (1 + threshold):
+            regressions.append((key, f"{result['seconds']:.4g} s vs {previous['seconds']:.4g} s "
+                                     f"(+{result['seconds'] / previous['seconds'] - 1:.0%})"))
+        if result['queries'] > previous['queries']:
+            regressions.append((key, f"{result['queries']} queries vs {previous['queries']}"))
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from relay.models import Relay
+from substation_equipment.models import Transformer
+
+from . import suite
+
+
+class SuiteTests(TestCase):
+    def test_run_leaves_the_database_unchanged(self):
+        results = suite.run([20], repeat=1)
+        self.assertEqual(set(results['results']), {f'{name}/20' for name in suite.BENCHMARKS})
+        self.assertEqual(results['results']['trip_time_batch/20']['items'], 20 * len(suite.FAULT_CURRENTS))
+        self.assertEqual(results['results']['import_transformers/20']['items'], 20)
+        # Relays and their transformers in one query; relays prefetched in a second
+        self.assertEqual(results['results']['relay_list_page/20']['queries'], 1)
+        self.assertEqual(results['results']['transformer_list_page/20']['queries'], 2)
+        self.assertFalse(Transformer.objects.exists())
+        self.assertFalse(Relay.objects.exists())
+
+    def test_unknown_benchmark(self):
+        with self.assertRaises(KeyError):
+            suite.run([10], names=['missing'])
+
+    def test_command_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            options = ['--sizes', '10', '--repeat', '1', '--only', 'trip_time_batch', '--baseline', baseline]
+            call_command('benchmark', *options, '--save-baseline', stdout=StringIO())
+            self.assertIn('trip_time_batch/10', suite.load(baseline)['results'])
+
+            output = StringIO()
+            call_command('benchmark', *options, '--threshold', '1000', stdout=output)
+            self.assertIn('No regressions', output.getvalue())
+
+            faster = suite.load(baseline)
+            faster['results']['trip_time_batch/10']['seconds'] = 1e-9
+            suite.save(faster, baseline)
+            with self.assertRaises(CommandError):
+                call_command('benchmark', *options, '--fail-on-regression', stdout=StringIO(), stderr=StringIO())
+
+
+class CompareTests(SimpleTestCase):
+    def test_regressions(self):
+        baseline = {'results': {'a/10': {'seconds': 1.0, 'queries': 2}, 'b/10': {'seconds': 1.0, 'queries': 2}}}
+        results = {'results': {
+            'a/10': {'seconds': 1.1, 'queries': 2},
+            'b/10': {'seconds': 1.5, 'queries': 3},
+            'c/10': {'seconds': 9.0, 'queries': 9},
+        }}
+        regressions = suite.compare(results, baseline, threshold=0.2)
+        self.assertEqual([key for key, _ in regressions], ['b/10', 'b/10'])
+
+    def test_synthetic_fleet_is_reproducible(self):
+        first = list(suite.SyntheticFleet(5, seed=3).transformer_rows())
+        self.assertEqual(first, list(suite.SyntheticFleet(5, seed=3).transformer_rows()))
+        self.assertNotEqual(first, list(suite.SyntheticFleet(5, seed=4).transformer_rows()))
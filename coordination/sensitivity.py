@@ -0,0 +1,300 @@
+"""
+Monte Carlo sensitivity study of fault currents and trip times.
+
+Transformer impedance tolerance, line length and per-km parameter errors and
+CT errors all move the fault current a relay measures, and with it the trip
+time.  A ``SensitivityStudy`` samples those errors and evaluates the whole
+sample matrix (samples × cases) with NumPy.
+
+Cases are split into fixed-size chunks, each with its own random stream
+spawned from the study seed, and chunks run in the shared process pool.
+Results therefore depend only on the seed and the chunk size, not on the
+number of workers.
+
+Relays are packed as the coefficients of the standard curve formula, so
+relays on function curves (registered in code) can't be packed: their trip
+times and probabilities come out as NaN.
+"""
+import math
+import warnings
+
+import numpy as np
+
+from relay.curves import get_curve, standard_trip_times
+
+from .solver import equipment_fault_current
+
+
+PERCENTILES = (5, 50, 95)
+
+
+class SensitivityCase:
+    """
+    One fault studied for sensitivity.
+
+    Args:
+        equipment: Transformer or TransmissionLine where the fault occurs
+        relay: relay that should clear the fault (optional)
+        backup: upstream relay that must stay slower by the CTI (optional)
+        side: transformer side of the fault
+    """
+
+    def __init__(self, equipment, relay=None, backup=None, side='primary'):
+        self.equipment = equipment
+        self.relay = relay
+        self.backup = backup
+        self.side = side
+
+    def __repr__(self):
+        return f'SensitivityCase({self.equipment}, {self.relay}, {self.backup})'
+
+
+def cases_from_nodes(nodes):
+    """
+    One case per CoordinationNode with protected equipment, backed up by
+    the relay of its parent node.
+    """
+    return [
+        SensitivityCase(node.equipment, node.relay,
+                        node.parent.relay if node.parent is not None else None, node.side)
+        for node in nodes
+        if node.equipment is not None
+    ]
+
+
+def _relay_parameters(relay):
+    """
+    (k, alpha, b, tds, pickup) of a relay; all NaN if it can't trip or its
+    curve has no standard-formula coefficients (a function curve).
+    """
+    if relay is None or relay.type != 'oc' or relay.tds is None or relay.current_setting is None:
+        return (np.nan,) * 5
+    curve = get_curve(relay.standard, relay.curve_type)
+    if curve is None or curve.function is not None:
+        return (np.nan,) * 5
+    return (curve.k, curve.alpha, curve.b, relay.tds, relay.current_setting)
+
+
+def _fault_parameters(case):
+    """
+    Nominal fault current of a case and the fields its tolerance applies to.
+
+    Returns:
+        (fault current, is transformer, length, r_per_km, x_per_km)
+    """
+    equipment = case.equipment
+    fault_current = equipment_fault_current(equipment, case.side)
+    if hasattr(equipment, 'secondary_voltage'):
+        return (fault_current, True, 0.0, 0.0, 0.0)
+    return (fault_current, False, equipment.length, equipment.r_per_km, equipment.x_per_km)
+
+
+def pack_cases(cases):
+    """Pack cases into a dictionary of arrays that can be sent to workers."""
+    cases = list(cases)
+    faults = np.array([_fault_parameters(case) for case in cases], dtype=float).reshape(-1, 5)
+    primary = np.array([_relay_parameters(case.relay) for case in cases], dtype=float).reshape(-1, 5)
+    backup = np.array([_relay_parameters(case.backup) for case in cases], dtype=float).reshape(-1, 5)
+    return {
+        'fault_current': faults[:, 0],
+        'transformer': faults[:, 1].astype(bool),
+        'length': faults[:, 2],
+        'r_per_km': faults[:, 3],
+        'x_per_km': faults[:, 4],
+        'primary': primary,
+        'backup': backup,
+    }
+
+
+def _slice(packed, start, stop):
+    return {key: values[start:stop] for key, values in packed.items()}
+
+
+def _errors(generator, shape, tolerance, distribution):
+    """Relative errors within ±tolerance."""
+    if tolerance == 0:
+        return np.zeros(shape)
+    if distribution == 'normal':
+        # Tolerance taken as 3 sigma, clipped to the tolerance band
+        return np.clip(generator.normal(0, tolerance / 3, shape), -tolerance, tolerance)
+    return generator.uniform(-tolerance, tolerance, shape)
+
+
+def _trip_times(parameters, currents):
+    """Trip times for (samples × cases) currents; NaN where no trip."""
+    k, alpha, b, tds, pickup = parameters.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_in_pu = currents / pickup
+    return standard_trip_times(tds, current_in_pu, k, alpha, b)
+
+
+def run_chunk(packed, seed, samples, options):
+    """
+    Evaluate one chunk of cases for every sample.
+
+    Module-level so it can run in a worker process.
+
+    Returns:
+        Dictionary of per-case statistics for the chunk
+    """
+    generator = np.random.default_rng(seed)
+    count = packed['fault_current'].size
+    shape = (samples, count)
+    distribution = options['distribution']
+
+    # Transformer fault current is inversely proportional to the impedance;
+    # line fault current to the magnitude of L × (r + jx)
+    impedance_factor = 1 + _errors(generator, shape, options['impedance_tolerance'], distribution)
+    length_factor = 1 + _errors(generator, shape, options['length_tolerance'], distribution)
+    r_factor = 1 + _errors(generator, shape, options['parameter_tolerance'], distribution)
+    x_factor = 1 + _errors(generator, shape, options['parameter_tolerance'], distribution)
+
+    r_total = packed['r_per_km'] * packed['length']
+    x_total = packed['x_per_km'] * packed['length']
+    nominal = np.hypot(r_total, x_total)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        line_factor = length_factor * np.hypot(r_total * r_factor, x_total * x_factor) / nominal
+    # Lines without per-km parameters use the percentage impedance tolerance
+    line_factor = np.where(nominal > 0, line_factor, impedance_factor)
+    factor = np.where(packed['transformer'], impedance_factor, line_factor)
+    fault_current = packed['fault_current'] / factor
+
+    # Independent CT errors for the primary and backup relay
+    primary_current = fault_current * (1 + _errors(generator, shape, options['ct_error'], distribution))
+    backup_current = fault_current * (1 + _errors(generator, shape, options['ct_error'], distribution))
+    primary_time = _trip_times(packed['primary'], primary_current)
+    backup_time = _trip_times(packed['backup'], backup_current)
+
+    both_trip = ~np.isnan(primary_time) & ~np.isnan(backup_time)
+    with np.errstate(invalid='ignore'):
+        miscoordinated = both_trip & (backup_time - primary_time < options['cti'])
+    has_primary = np.isfinite(packed['primary']).all(axis=1)
+    has_backup = np.isfinite(packed['backup']).all(axis=1)
+
+    percentiles = options['percentiles']
+    with warnings.catch_warnings():
+        # nanpercentile warns for relays that never trip (all-NaN columns)
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'fault_current': np.percentile(fault_current, percentiles, axis=0),
+            'primary_time': np.nanpercentile(primary_time, percentiles, axis=0),
+            'backup_time': np.nanpercentile(backup_time, percentiles, axis=0),
+            'no_trip_probability': np.where(has_primary, np.isnan(primary_time).mean(axis=0), np.nan),
+            'miscoordination_probability': np.where(has_primary & has_backup,
+                                                    miscoordinated.mean(axis=0), np.nan),
+        }
+
+
+class SensitivityStudy:
+    """
+    Monte Carlo study over a list of SensitivityCase.
+
+    Args:
+        samples: number of samples per case
+        seed: seed for reproducible runs (None for a random seed)
+        impedance_tolerance: transformer (and percentage line) impedance
+            tolerance, e.g. 0.075 for ±7.5 %
+        length_tolerance: line length tolerance
+        parameter_tolerance: line r_per_km and x_per_km tolerance
+        ct_error: CT ratio error
+        distribution: 'uniform' within the tolerance, or 'normal' with the
+            tolerance as 3 sigma
+        cti: coordination time interval used for the miscoordination test
+        workers: process pool use; None uses the shared pool when there is
+            more than one chunk, 0 runs everything in this process
+        chunk_elements: samples × cases evaluated per chunk
+    """
+
+    def __init__(self, samples=10000, seed=None, impedance_tolerance=0.075, length_tolerance=0.02,
+                 parameter_tolerance=0.05, ct_error=0.05, distribution='uniform', cti=0.3,
+                 workers=None, chunk_elements=2_000_000, percentiles=PERCENTILES):
+        if distribution not in ('uniform', 'normal'):
+            raise ValueError("distribution must be 'uniform' or 'normal'")
+        if samples < 1:
+            raise ValueError('samples must be at least 1')
+        self.samples = samples
+        self.seed = seed
+        self.workers = workers
+        self.chunk_elements = chunk_elements
+        self.options = {
+            'impedance_tolerance': impedance_tolerance,
+            'length_tolerance': length_tolerance,
+            'parameter_tolerance': parameter_tolerance,
+            'ct_error': ct_error,
+            'distribution': distribution,
+            'cti': cti,
+            'percentiles': list(percentiles),
+        }
+
+    def run(self, cases):
+        """
+        Run the study.
+
+        Returns:
+            SensitivityResult
+        """
+        cases = list(cases)
+        packed = pack_cases(cases)
+        chunk_size = max(1, self.chunk_elements // self.samples)
+        bounds = [(start, min(start + chunk_size, len(cases)))
+                  for start in range(0, len(cases), chunk_size)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(bounds))
+        jobs = [(_slice(packed, start, stop), seed, self.samples, self.options)
+                for (start, stop), seed in zip(bounds, seeds)]
+
+        if self.workers == 0 or len(jobs) <= 1:
+            parts = [run_chunk(*job) for job in jobs]
+        else:
+            from protectioncalculator.workers import get_executor
+            executor = get_executor()
+            parts = list(executor.map(run_chunk, *zip(*jobs)))
+
+        statistics = {}
+        for key in ('fault_current', 'primary_time', 'backup_time'):
+            statistics[key] = (np.concatenate([part[key] for part in parts], axis=1) if parts
+                               else np.empty((len(self.options['percentiles']), 0)))
+        for key in ('no_trip_probability', 'miscoordination_probability'):
+            statistics[key] = np.concatenate([part[key] for part in parts]) if parts else np.empty(0)
+        return SensitivityResult(cases, statistics, self.options['percentiles'], self.samples)
+
+
+class SensitivityResult:
+    """
+    Per-case statistics of a sensitivity study.
+
+    ``fault_current``, ``primary_time`` and ``backup_time`` are arrays of
+    shape (percentiles, cases); the probabilities have one value per case.
+    """
+
+    def __init__(self, cases, statistics, percentiles, samples):
+        self.cases = cases
+        self.percentiles = list(percentiles)
+        self.samples = samples
+        self.fault_current = statistics['fault_current']
+        self.primary_time = statistics['primary_time']
+        self.backup_time = statistics['backup_time']
+        self.no_trip_probability = statistics['no_trip_probability']
+        self.miscoordination_probability = statistics['miscoordination_probability']
+
+    def rows(self):
+        rows = []
+        for index, case in enumerate(self.cases):
+            row = {
+                'equipment': str(case.equipment),
+                'relay': str(case.relay) if case.relay is not None else None,
+                'backup': str(case.backup) if case.backup is not None else None,
+                'no_trip_probability': _number(self.no_trip_probability[index]),
+                'miscoordination_probability': _number(self.miscoordination_probability[index]),
+            }
+            for position, percentile in enumerate(self.percentiles):
+                row[f'fault_current_p{percentile}'] = _number(self.fault_current[position, index])
+                row[f'primary_time_p{percentile}'] = _number(self.primary_time[position, index])
+                row[f'backup_time_p{percentile}'] = _number(self.backup_time[position, index])
+            rows.append(row)
+        return rows
+
+
+def _number(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
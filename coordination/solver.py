@@ -0,0 +1,341 @@
+"""
+Overcurrent coordination solver for radial networks.
+
+Relays are arranged as a tree of ``CoordinationNode`` objects, each pointing
+at its upstream (backup) relay.  The solver grades the tree from the load end
+towards the source: every relay gets the smallest time dial setting (TDS)
+that keeps it at least one coordination time interval (CTI) slower than each
+downstream relay at that relay's maximum fault current.
+
+When a relay has no fixed current setting, a set of candidate pickups is
+derived from the full load current of its protected equipment.  All
+candidates of a relay are graded against all of its downstream relays in one
+NumPy evaluation; candidates that cannot see a grading fault or need a TDS
+above the allowed range are pruned, and the remaining candidate with the
+fastest operating time at the relay's own maximum fault current is chosen.
+"""
+import numpy as np
+from django.utils import timezone
+
+from relay.curves import get_curve
+
+
+class CoordinationError(Exception):
+    """Raised when a relay cannot be graded."""
+
+
+class CoordinationNode:
+    """
+    One relay in the network being coordinated.
+
+    Args:
+        relay: overcurrent Relay with standard and curve_type set
+        max_fault_current: maximum fault current at the relay location in
+            amperes; taken from the equipment when omitted
+        equipment: protected Transformer or TransmissionLine; defaults to
+            the equipment linked to the relay (load relays with
+            Relay.objects.with_equipment() to avoid a query per node)
+        parent: upstream CoordinationNode that backs this relay up
+        side: transformer side used for load and fault currents
+        pickup_candidates: pickup currents to choose from; defaults to the
+            relay's current setting, or to multiples of the equipment's
+            full load current when the relay has none
+    """
+
+    def __init__(self, relay, max_fault_current=None, equipment=None, parent=None,
+                 side='primary', pickup_candidates=None):
+        if equipment is None:
+            equipment = getattr(relay, 'equipment', None)
+        self.relay = relay
+        self.equipment = equipment
+        self.parent = parent
+        self.side = side
+        self.pickup_candidates = pickup_candidates
+
+        if max_fault_current is None:
+            if equipment is None:
+                raise CoordinationError(
+                    f'{relay}: a maximum fault current or protected equipment is required')
+            max_fault_current = equipment_fault_current(equipment, side)
+        self.max_fault_current = float(max_fault_current)
+
+    def __repr__(self):
+        return f'CoordinationNode({self.relay})'
+
+    @property
+    def name(self):
+        return str(self.relay)
+
+
+def chain(relays, fault_currents=None, equipment=None, **kwargs):
+    """
+    Build the nodes of a single radial feeder.
+
+    Args:
+        relays: relays ordered from the source outwards, so each relay backs
+            up the next one
+        fault_currents: maximum fault current at each relay (optional)
+        equipment: protected equipment of each relay (optional)
+        **kwargs: passed to every CoordinationNode
+
+    Returns:
+        List of CoordinationNode in the same order
+    """
+    relays = list(relays)
+    fault_currents = fault_currents if fault_currents is not None else [None] * len(relays)
+    equipment = equipment if equipment is not None else [None] * len(relays)
+
+    nodes = []
+    parent = None
+    for relay, current, item in zip(relays, fault_currents, equipment):
+        node = CoordinationNode(relay, current, item, parent=parent, **kwargs)
+        nodes.append(node)
+        parent = node
+    return nodes
+
+
+def equipment_fault_current(equipment, side='primary'):
+    """Fault current of a Transformer (at side) or TransmissionLine in amperes."""
+    if hasattr(equipment, 'secondary_voltage'):
+        return equipment.calculate_fault_current(side)
+    return equipment.calculate_fault_current()
+
+
+def _equipment_full_load_current(equipment, side):
+    current = equipment.calculate_full_load_current()
+    if isinstance(current, dict):
+        return current[side]
+    return current
+
+
+class CoordinationSolver:
+    """
+    Grades a radial tree of overcurrent relays.
+
+    Args:
+        cti: coordination time interval in seconds
+        tds_step: TDS resolution of the relays; results are rounded up to it
+        tds_min: smallest TDS a relay may use
+        tds_max: largest TDS a relay may use
+        pickup_multiples: multiples of full load current tried as pickup for
+            relays without a current setting
+    """
+
+    def __init__(self, cti=0.3, tds_step=0.01, tds_min=0.05, tds_max=10.0,
+                 pickup_multiples=None):
+        self.cti = cti
+        self.tds_step = tds_step
+        self.tds_min = tds_min
+        self.tds_max = tds_max
+        if pickup_multiples is None:
+            pickup_multiples = np.arange(1.25, 2.0 + 1e-9, 0.05)
+        self.pickup_multiples = np.asarray(pickup_multiples, dtype=float)
+
+    def solve(self, nodes):
+        """
+        Grade every relay in the tree.
+
+        Relay instances are not modified; call ``apply()`` on the result to
+        copy the settings onto them.
+
+        Returns:
+            GradingReport
+        """
+        nodes = list(nodes)
+        children = {id(node): [] for node in nodes}
+        for node in nodes:
+            if node.parent is not None:
+                if id(node.parent) not in children:
+                    raise CoordinationError(f'{node}: parent {node.parent} is not part of the study')
+                children[id(node.parent)].append(node)
+
+        settings = {}
+        for node in self._leaves_first(nodes):
+            settings[id(node)] = self._grade(node, children[id(node)], settings)
+
+        return GradingReport(nodes, children, settings, self.cti)
+
+    def _leaves_first(self, nodes):
+        """Order nodes so that every node comes after all of its children."""
+        depth = {}
+        for node in nodes:
+            path = []
+            seen = set()
+            current = node
+            while current is not None and id(current) not in depth:
+                if id(current) in seen:
+                    raise CoordinationError(f'{current}: the relay tree contains a loop')
+                seen.add(id(current))
+                path.append(current)
+                current = current.parent
+            base = depth[id(current)] if current is not None else -1
+            for item in reversed(path):
+                base += 1
+                depth[id(item)] = base
+        return sorted(nodes, key=lambda item: depth[id(item)], reverse=True)
+
+    def _pickup_candidates(self, node):
+        if node.pickup_candidates is not None:
+            return np.asarray(node.pickup_candidates, dtype=float)
+        if node.relay.current_setting is not None:
+            return np.array([node.relay.current_setting], dtype=float)
+        if node.equipment is None:
+            raise CoordinationError(
+                f'{node}: no current setting, pickup candidates or protected equipment')
+        full_load = _equipment_full_load_current(node.equipment, node.side)
+        return np.round(full_load * self.pickup_multiples, 1)
+
+    def _grade(self, node, downstream, settings):
+        relay = node.relay
+        curve = get_curve(relay.standard, relay.curve_type)
+        if relay.type != 'oc' or curve is None:
+            raise CoordinationError(f'{node}: not an overcurrent relay with a known curve')
+
+        pickups = self._pickup_candidates(node)
+
+        # Grading points: (fault current, time the upstream relay must exceed)
+        grading_currents = np.array([child.max_fault_current for child in downstream])
+        grading_times = np.array([settings[id(child)].operating_time + self.cti
+                                  for child in downstream])
+
+        # Prune candidates that do not pick up for the relay's own fault or
+        # for every grading fault.
+        lowest_fault = min([node.max_fault_current, *grading_currents])
+        pickups = pickups[pickups < lowest_fault]
+        if pickups.size == 0:
+            raise CoordinationError(f'{node}: every pickup candidate is above the fault current')
+
+        # TDS needed by each candidate (rows) at each grading point (columns)
+        required = np.full(pickups.shape, self.tds_min)
+        if downstream:
+            unit_times = curve.trip_time(1.0, grading_currents[np.newaxis, :] / pickups[:, np.newaxis])
+            required = np.maximum(required, (grading_times / unit_times).max(axis=1))
+
+        required = np.ceil(np.round(required / self.tds_step, 9)) * self.tds_step
+        feasible = required <= self.tds_max + 1e-12
+        if not feasible.any():
+            raise CoordinationError(f'{node}: no setting within TDS {self.tds_max} meets the CTI')
+        pickups = pickups[feasible]
+        required = required[feasible]
+
+        operating_times = curve.trip_time(required, node.max_fault_current / pickups)
+        best = np.lexsort((required, operating_times))[0]
+        return RelaySetting(
+            pickup=float(pickups[best]),
+            tds=round(float(required[best]), 6),
+            operating_time=float(operating_times[best]),
+        )
+
+
+class RelaySetting:
+    """Settings chosen for one relay."""
+
+    __slots__ = ('pickup', 'tds', 'operating_time')
+
+    def __init__(self, pickup, tds, operating_time):
+        self.pickup = pickup
+        self.tds = tds
+        self.operating_time = operating_time
+
+    def __repr__(self):
+        return (f'RelaySetting(pickup={self.pickup}, tds={self.tds}, '
+                f'operating_time={self.operating_time:.3f})')
+
+
+class GradingReport:
+    """
+    Result of a coordination study.
+
+    ``rows()`` gives one dictionary per relay/downstream-relay pair with the
+    operating times and the achieved margin at the downstream fault current.
+    """
+
+    def __init__(self, nodes, children, settings, cti):
+        self.nodes = nodes
+        self.cti = cti
+        self._children = children
+        self._settings = settings
+
+    def setting(self, node):
+        return self._settings[id(node)]
+
+    def apply(self, save=False):
+        """
+        Copy the solved TDS and pickup onto the Relay instances.
+
+        Args:
+            save: also write them to the database in one bulk update
+        """
+        relays = []
+        for node in self.nodes:
+            setting = self.setting(node)
+            node.relay.tds = setting.tds
+            node.relay.current_setting = setting.pickup
+            relays.append(node.relay)
+        if save:
+            from relay.models import Relay
+            # bulk_update skips save(): set the change marker read by fleet
+            # tables in other processes
+            now = timezone.now()
+            for relay in relays:
+                relay.updated_at = now
+            Relay.objects.bulk_update(relays, ['tds', 'current_setting', 'updated_at'])
+        return relays
+
+    def rows(self):
+        rows = []
+        for node in self.nodes:
+            setting = self.setting(node)
+            curve = get_curve(node.relay.standard, node.relay.curve_type)
+            row = {
+                'relay': node.name,
+                'equipment': str(node.equipment) if node.equipment is not None else None,
+                'pickup': setting.pickup,
+                'tds': setting.tds,
+                'fault_current': node.max_fault_current,
+                'operating_time': setting.operating_time,
+                'downstream': None,
+                'backup_time': None,
+                'margin': None,
+            }
+            downstream = self._children[id(node)]
+            if not downstream:
+                rows.append(row)
+            for child in downstream:
+                backup_time = float(curve.trip_time(setting.tds, child.max_fault_current / setting.pickup))
+                margin = backup_time - self.setting(child).operating_time
+                rows.append({
+                    **row,
+                    'downstream': child.name,
+                    'backup_time': backup_time,
+                    'margin': margin,
+                })
+        return rows
+
+    @property
+    def coordinated(self):
+        """True if every relay pair keeps at least the CTI."""
+        return all(row['margin'] is None or row['margin'] >= self.cti - 1e-9
+                   for row in self.rows())
+
+    def as_text(self):
+        header = (f"{'Relay':<20} {'Pickup (A)':>11} {'TDS':>6} {'Fault (A)':>10} "
+                  f"{'Time (s)':>9} {'Downstream':<20} {'Margin (s)':>10}")
+        lines = [header, '-' * len(header)]
+        for row in self.rows():
+            margin = '' if row['margin'] is None else f"{row['margin']:.3f}"
+            lines.append(
+                f"{row['relay']:<20} {row['pickup']:>11.1f} {row['tds']:>6.2f} "
+                f"{row['fault_current']:>10.0f} {row['operating_time']:>9.3f} "
+                f"{row['downstream'] or '':<20} {margin:>10}"
+            )
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.as_text()
+
+
+def coordinate(nodes, **kwargs):
+    """Grade a tree of CoordinationNode with a CoordinationSolver built from kwargs."""
+    return CoordinationSolver(**kwargs).solve(nodes)
+
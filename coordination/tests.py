@@ -0,0 +1,113 @@
+import numpy as np
+from django.test import TestCase
+
+from relay.models import Relay
+from substation_equipment.models import Transformer
+
+from .sensitivity import SensitivityCase, SensitivityStudy
+from .solver import CoordinationError, CoordinationNode, CoordinationSolver, chain
+
+
+def overcurrent_relay(name, current_setting):
+    return Relay(name=name, type='oc', protected_equipment='line', standard='iec',
+                 curve_type='standard_inverse', current_setting=current_setting)
+
+
+class CoordinationSolverTests(TestCase):
+    def setUp(self):
+        # Source relay first: R1 (400 A pickup, 4 kA fault) backs up R2
+        # (200 A pickup, 2 kA fault)
+        self.relays = [overcurrent_relay('R1', 400), overcurrent_relay('R2', 200)]
+        self.nodes = chain(self.relays, fault_currents=[4000, 2000])
+
+    def test_two_relay_chain(self):
+        report = CoordinationSolver(cti=0.3).solve(self.nodes)
+        upstream, downstream = (report.setting(node) for node in self.nodes)
+
+        # IEC standard inverse, t = TDS * 0.14 / (M^0.02 - 1):
+        # R2 at M = 10 only needs the minimum TDS, 0.05 * 2.9706 = 0.1485 s.
+        # R1 must take 0.1485 + 0.3 s at R2's 2 kA (M = 5, 4.2802 s per
+        # unit TDS): TDS 0.1048, rounded up to 0.11.
+        self.assertEqual(downstream.tds, 0.05)
+        self.assertAlmostEqual(downstream.operating_time, 0.1485, places=4)
+        self.assertEqual(upstream.tds, 0.11)
+        self.assertAlmostEqual(upstream.operating_time, 0.11 * 2.9706, places=3)
+
+        row = next(row for row in report.rows() if row['downstream'] == 'R2')
+        self.assertAlmostEqual(row['backup_time'], 0.11 * 4.2802, places=3)
+        self.assertAlmostEqual(row['margin'], 0.3223, places=3)
+        self.assertTrue(report.coordinated)
+
+    def test_apply_copies_settings(self):
+        report = CoordinationSolver(cti=0.3).solve(self.nodes)
+        report.apply()
+        self.assertEqual([relay.tds for relay in self.relays], [0.11, 0.05])
+        self.assertEqual([relay.current_setting for relay in self.relays], [400, 200])
+
+    def test_tds_limit(self):
+        with self.assertRaises(CoordinationError):
+            CoordinationSolver(cti=0.3, tds_max=0.1).solve(self.nodes)
+
+    def test_parent_outside_study(self):
+        node = CoordinationNode(overcurrent_relay('R3', 100), 1000, parent=self.nodes[1])
+        with self.assertRaises(CoordinationError):
+            CoordinationSolver().solve([node])
+
+
+class SensitivityStudyTests(TestCase):
+    def setUp(self):
+        self.transformer = Transformer(name='T1', kva_rating=1000, primary_voltage=11000,
+                                       secondary_voltage=415, impedance=5)
+        self.nominal = self.transformer.calculate_fault_current('secondary')
+        primary = overcurrent_relay('R1', 2000)
+        primary.tds = 0.1
+        backup = overcurrent_relay('R2', 2000)
+        backup.tds = 0.5
+        self.cases = [SensitivityCase(self.transformer, primary, backup, side='secondary')]
+
+    def test_without_tolerances_matches_nominal(self):
+        study = SensitivityStudy(samples=10, seed=1, impedance_tolerance=0, ct_error=0)
+        result = study.run(self.cases)
+        np.testing.assert_allclose(result.fault_current[:, 0], self.nominal)
+        np.testing.assert_allclose(result.primary_time[:, 0], self.cases[0].relay.calculate_trip_time(self.nominal))
+        self.assertEqual(result.no_trip_probability[0], 0)
+        self.assertEqual(result.miscoordination_probability[0], 0)
+
+    def test_tolerances(self):
+        result = SensitivityStudy(samples=5000, seed=1).run(self.cases)
+        low, middle, high = result.fault_current[:, 0]
+        # Fault current is inversely proportional to the ±7.5 % impedance
+        self.assertGreater(low, self.nominal / 1.075)
+        self.assertLess(high, self.nominal / 0.925)
+        self.assertAlmostEqual(middle / self.nominal, 1, delta=0.01)
+        row = result.rows()[0]
+        self.assertEqual(row['backup'], 'R2')
+        self.assertEqual(row['fault_current_p50'], middle)
+
+    def test_no_trip_probability(self):
+        relay = overcurrent_relay('R1', self.nominal)
+        relay.tds = 0.1
+        never = overcurrent_relay('R2', 10 * self.nominal)
+        never.tds = 0.1
+        cases = [SensitivityCase(self.transformer, relay, side='secondary'),
+                 SensitivityCase(self.transformer, never, side='secondary')]
+        result = SensitivityStudy(samples=2000, seed=1).run(cases)
+        self.assertGreater(result.no_trip_probability[0], 0.2)
+        self.assertLess(result.no_trip_probability[0], 0.8)
+        self.assertEqual(result.no_trip_probability[1], 1)
+        # No backup relay
+        self.assertTrue(np.isnan(result.miscoordination_probability).all())
+
+    def test_seed_and_chunks(self):
+        cases = self.cases * 5
+        first = SensitivityStudy(samples=100, seed=7, workers=0, chunk_elements=200).run(cases)
+        second = SensitivityStudy(samples=100, seed=7, workers=0, chunk_elements=200).run(cases)
+        np.testing.assert_array_equal(first.fault_current, second.fault_current)
+        other = SensitivityStudy(samples=100, seed=8, workers=0, chunk_elements=200).run(cases)
+        self.assertFalse(np.array_equal(first.fault_current, other.fault_current))
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            SensitivityStudy(samples=0)
+        with self.assertRaises(ValueError):
+            SensitivityStudy(distribution='triangular')
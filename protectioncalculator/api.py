@@ -0,0 +1,127 @@
+"""
+Small helpers shared by the JSON calculation views.
+"""
+import functools
+import json
+import math
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+
+class ApiError(Exception):
+    """An error reported to the client as {"error": message} with a status code."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_view(*methods):
+    """
+    Turn a function returning a dict into a JSON endpoint.
+
+    Only the given HTTP methods are accepted, CSRF checks are skipped (the
+    endpoints are called by study tools, not browsers) and ApiError is
+    rendered as a JSON error response.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'error': f'Method {request.method} not allowed'}, status=405)
+            try:
+                return JsonResponse(view(request, *args, **kwargs))
+            except ApiError as error:
+                return JsonResponse({'error': error.message}, status=error.status)
+        return wrapper
+    return decorator
+
+
+def async_api_view(*methods):
+    """Async counterpart of api_view for ``async def`` views."""
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'error': f'Method {request.method} not allowed'}, status=405)
+            try:
+                return JsonResponse(await view(request, *args, **kwargs))
+            except ApiError as error:
+                return JsonResponse({'error': error.message}, status=error.status)
+        return wrapper
+    return decorator
+
+
+def json_body(request):
+    """Parse the request body as a JSON object."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Request body is not valid JSON')
+    if not isinstance(data, dict):
+        raise ApiError('Request body must be a JSON object')
+    return data
+
+
+def id_list(data, key):
+    """Read a non-empty list of integer ids from a request dict."""
+    values = data.get(key)
+    if not isinstance(values, list) or not values:
+        raise ApiError(f"'{key}' must be a non-empty list of ids")
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ApiError(f"'{key}' must be a list of integer ids")
+
+
+def number_list(data, key):
+    """Read a non-empty list of finite numbers from a request dict."""
+    values = data.get(key)
+    if not isinstance(values, list):
+        values = [values] if values is not None else []
+    if not values:
+        raise ApiError(f"'{key}' must be a number or a non-empty list of numbers")
+    try:
+        numbers = [float(value) for value in values]
+    except (TypeError, ValueError):
+        raise ApiError(f"'{key}' must contain only numbers")
+    # float() also accepts 'nan' and 'inf'
+    if not all(math.isfinite(number) for number in numbers):
+        raise ApiError(f"'{key}' must contain only finite numbers")
+    return numbers
+
+
+def clean_number(value):
+    """Convert NaN/inf to None so the value can be written as JSON."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def clean_numbers(values):
+    """clean_number for every item of an array or nested list."""
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    if isinstance(values, list):
+        return [clean_numbers(value) for value in values]
+    return clean_number(values)
+
+
+def fetch_in_bulk(model, ids):
+    """Load rows with one in_bulk query; 404 if any id is missing."""
+    return _ordered(model, ids, model.objects.in_bulk(ids))
+
+
+async def afetch_in_bulk(model, ids):
+    """Async version of fetch_in_bulk."""
+    return _ordered(model, ids, await model.objects.ain_bulk(ids))
+
+
+def _ordered(model, ids, rows):
+    missing = [pk for pk in ids if pk not in rows]
+    if missing:
+        raise ApiError(f'{model._meta.verbose_name} not found: {missing}', status=404)
+    return [rows[pk] for pk in ids]
@@ -0,0 +1,510 @@
+"""
+Compact read-only copy of the equipment and relay tables.
+
+``FleetTable`` holds one model's editable fields as NumPy columns
+(struct of arrays), loaded with one ``values_list`` query streamed in
+chunks, so calculation workers can read a million rows without building a
+model instance per row:
+
+    unique CharFields (name)      UTF-8 bytes, one byte per ASCII character
+    other CharFields (choices,    category codes (int8/int16) + category list
+      curve type, vector group)
+    foreign keys                  related id, -1 for NULL
+    integer fields                smallest of int32/int64 that fits
+    float fields                  float64, NaN for NULL
+    booleans                      bool
+
+A transformer row takes about 70 bytes, so a million-asset fleet needs tens
+of MB.  Rows are kept sorted by primary key; ``positions(names)`` looks
+names up with a binary search in a sorted index built on first use.
+
+``refresh()`` brings a table up to date incrementally (a table that was
+never loaded is loaded by its first refresh):
+
+- rows saved or deleted in this process are marked by the
+  post_save/post_delete receivers (see the apps' signals.py) and re-read by
+  primary key on every refresh, as are the rows passed in ``pks``;
+
+At most once per ``interval`` seconds a refresh also checks for changes made
+by other processes:
+
+- rows saved by other processes are found through the indexed
+  ``updated_at`` column (``auto_now``): the (pk, updated_at) pairs of rows
+  updated within ``overlap`` of the newest ``updated_at`` of this copy are
+  read from the index and compared with the copy, and only rows that
+  differ are re-read.  The overlap covers transactions that commit after
+  rows with later timestamps, and clock skew between servers;
+- rows inserted or deleted elsewhere are found by comparing the row count
+  and the largest primary key in one aggregate query.
+
+Between checks a table may lag other processes by up to ``interval``
+seconds; callers that need particular rows can pass their keys to
+``refresh(pks)``.
+
+Changes that don't set ``updated_at`` (``QuerySet.update`` or
+``bulk_update`` without it) need ``refresh(pks)`` or ``load()``.
+"""
+import datetime
+import threading
+import time
+import weakref
+
+import numpy as np
+from django.apps import apps
+from django.db import models
+from django.db.models import Count, Max, Q
+
+
+_INT32 = np.iinfo(np.int32)
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+# Every live table, so signal receivers can mark changed rows
+_tables = weakref.WeakSet()
+
+
+def _int_dtype(values):
+    if not len(values) or (values.min() >= _INT32.min and values.max() <= _INT32.max):
+        return np.int32
+    return np.int64
+
+
+def _find(sorted_values, values):
+    """Positions of values in a sorted array, -1 where missing."""
+    if not len(sorted_values):
+        return np.full(len(values), -1)
+    found = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return np.where(sorted_values[found] == values, found, -1)
+
+
+def _microseconds(value):
+    """Aware or naive UTC datetime as integer microseconds since the epoch."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _datetime(microseconds):
+    return _EPOCH + datetime.timedelta(microseconds=int(microseconds))
+
+
+def _code_dtype(count):
+    if count <= np.iinfo(np.int8).max:
+        return np.int8
+    if count <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+class Column:
+    """
+    Encoding of one model field; see the module docstring.
+
+    encode() extends the category list, so it is only called by its
+    FleetTable while holding the table lock.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.name = field.attname
+        internal = field.get_internal_type()
+        if isinstance(field, models.ForeignKey):
+            self.kind = 'id'
+        elif internal in ('CharField', 'TextField', 'SlugField'):
+            self.kind = 'bytes' if field.unique else 'category'
+        elif internal == 'BooleanField':
+            self.kind = 'bool'
+        elif 'Integer' in internal or internal == 'AutoField':
+            self.kind = 'float' if field.null else 'int'
+        else:
+            self.kind = 'float'
+        self.categories = []
+        self._codes = {}
+
+    def encode(self, values):
+        """Array for a list of Python values."""
+        if self.kind == 'id':
+            values = np.array([-1 if value is None else value for value in values], dtype=np.int64)
+            return values.astype(_int_dtype(values))
+        if self.kind == 'bytes':
+            return np.array([b'' if value is None else value.encode() for value in values], dtype=bytes)
+        if self.kind == 'category':
+            codes = [self._code(value) for value in values]
+            return np.array(codes, dtype=_code_dtype(len(self.categories)))
+        if self.kind == 'bool':
+            return np.array(values, dtype=bool)
+        if self.kind == 'int':
+            values = np.array(values, dtype=np.int64)
+            return values.astype(_int_dtype(values))
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+    def _code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def decode(self, values):
+        """Python-friendly array: str for text columns, None ids as -1."""
+        if self.kind == 'bytes':
+            return np.char.decode(values, 'utf-8')
+        if self.kind == 'category':
+            categories = np.array(['' if value is None else value for value in self.categories] or [''])
+            return categories[values]
+        return values
+
+    def python(self, value):
+        """One stored value as the Python value of the field."""
+        if self.kind == 'bytes':
+            return value.decode()
+        if self.kind == 'category':
+            return self.categories[value]
+        if self.kind == 'id':
+            return None if value < 0 else int(value)
+        if self.kind == 'float':
+            return None if value != value else float(value)
+        return value.item()
+
+
+class FleetTable:
+    """
+    Read-only struct-of-arrays copy of one model's table.
+
+    Args:
+        model: model class or 'app_label.Model'
+        fields: field names to keep (default: every editable field);
+            foreign keys are stored as ids under their attname
+        stored: non-editable fields (stored results) kept besides the
+            default fields
+        key: unique field used by positions() (default 'name')
+        batch_size: rows fetched per database round trip
+        overlap: seconds before the newest ``updated_at`` of this copy that
+            refresh() checks for rows saved elsewhere; must exceed the
+            longest transaction and the clock skew between servers
+        interval: smallest number of seconds between two checks for
+            changes made by other processes
+    """
+
+    MARKER = 'updated_at'
+
+    def __init__(self, model, fields=None, stored=(), key='name', batch_size=10000, overlap=300,
+                 interval=2.0):
+        self.model = apps.get_model(model) if isinstance(model, str) else model
+        if fields is None:
+            fields = [field.name for field in self.model._meta.concrete_fields
+                      if field.editable and not field.primary_key]
+            fields += list(stored)
+        # Keyed by attname, so foreign key columns are e.g. 'transformer_id'
+        columns = [Column(self.model._meta.get_field(name)) for name in fields]
+        self.columns = {column.name: column for column in columns}
+        self.key = key
+        self.batch_size = batch_size
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.interval = interval
+        field_names = {field.name for field in self.model._meta.concrete_fields}
+        self.marker = self.MARKER if self.MARKER in field_names else None
+        self.pk = np.zeros(0, dtype=np.int32)
+        self.arrays = {}
+        # updated_at of every row in microseconds, when the model has it
+        self.updated = np.zeros(0, dtype=np.int64)
+        self._index = None
+        # time.monotonic() of the last load or check, None before the load
+        self._checked = None
+        self._changed = set()
+        self._deleted = set()
+        self._lock = threading.Lock()
+        _tables.add(self)
+
+    def __len__(self):
+        return len(self.pk)
+
+    @property
+    def nbytes(self):
+        return self.pk.nbytes + self.updated.nbytes + sum(array.nbytes for array in self.arrays.values())
+
+    def _read(self, queryset):
+        """pk, column arrays and updated_at of a queryset's rows, in primary key order."""
+        parts = {name: [] for name in ['pk', 'updated', *self.columns]}
+        batch = []
+        fields = ['pk', self.marker or 'pk', *self.columns]
+        rows = queryset.order_by('pk').values_list(*fields).iterator(chunk_size=self.batch_size)
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._encode(batch, parts)
+                batch = []
+        self._encode(batch, parts)
+        pk = np.concatenate(parts.pop('pk'))
+        updated = np.concatenate(parts.pop('updated'))
+        arrays = {name: np.concatenate(values) for name, values in parts.items()}
+        return pk.astype(_int_dtype(pk)), arrays, updated
+
+    def _encode(self, batch, parts):
+        values = list(zip(*batch)) if batch else [()] * (len(self.columns) + 2)
+        parts['pk'].append(np.array(values[0], dtype=np.int64))
+        if self.marker:
+            parts['updated'].append(np.array([_microseconds(value) for value in values[1]], dtype=np.int64))
+        else:
+            parts['updated'].append(np.zeros(len(values[0]), dtype=np.int64))
+        for (name, column), column_values in zip(self.columns.items(), values[2:]):
+            parts[name].append(column.encode(list(column_values)))
+
+    def load(self):
+        """Read the whole table in one query."""
+        with self._lock:
+            self._load()
+        return self
+
+    def _load(self):
+        self.pk, self.arrays, self.updated = self._read(self.model._default_manager.all())
+        self._changed.clear()
+        self._deleted.clear()
+        self._index = None
+        self._checked = time.monotonic()
+
+    # Lookups ---------------------------------------------------------------
+
+    def _key_index(self):
+        index = self._index
+        if index is None:
+            keys = self.arrays[self.key]
+            order = np.argsort(keys, kind='stable')
+            index = self._index = (keys[order], order)
+        return index
+
+    def positions(self, keys):
+        """Row positions of key values (e.g. names), -1 where missing."""
+        sorted_keys, order = self._key_index()
+        if self.columns[self.key].kind == 'bytes':
+            keys = [key.encode() for key in keys]
+        found = _find(sorted_keys, np.atleast_1d(np.asarray(keys)))
+        return np.where(found >= 0, order[found], -1)
+
+    def position(self, key):
+        position = int(self.positions([key])[0])
+        if position < 0:
+            raise KeyError(key)
+        return position
+
+    def pk_positions(self, pks):
+        """Row positions of primary keys, -1 where missing."""
+        return _find(self.pk, np.atleast_1d(np.asarray(pks, dtype=np.int64)))
+
+    def get(self, key):
+        """One row as a dictionary of field values, by key (e.g. name)."""
+        position = self.position(key)
+        row = {'pk': int(self.pk[position])}
+        for name, column in self.columns.items():
+            row[name] = column.python(self.arrays[name][position])
+        return row
+
+    def select(self, pks, names=None):
+        """
+        Columns of rows by primary key, from one version of the table even
+        while another thread refreshes it.
+
+        Args:
+            pks: primary keys
+            names: columns to return (default: all), text decoded to str
+
+        Returns:
+            (bool array of the pks found, dictionary of column arrays of the
+            found rows in the order of pks)
+        """
+        with self._lock:
+            pk, arrays = self.pk, self.arrays
+        positions = _find(pk, np.atleast_1d(np.asarray(pks, dtype=np.int64)))
+        found = positions >= 0
+        return found, {name: self.columns[name].decode(arrays[name][positions[found]])
+                       for name in (names or self.columns)}
+
+    def values(self, name, positions=None):
+        """
+        A column as an array, text decoded to str.
+
+        Args:
+            positions: row positions to take (default: all rows)
+        """
+        values = self.arrays[name] if positions is None else self.arrays[name][positions]
+        return self.columns[name].decode(values)
+
+    # Incremental refresh ---------------------------------------------------
+
+    def mark_changed(self, pk):
+        with self._lock:
+            self._changed.add(pk)
+            self._deleted.discard(pk)
+
+    def mark_deleted(self, pk):
+        with self._lock:
+            self._deleted.add(pk)
+            self._changed.discard(pk)
+
+    def refresh(self, pks=(), force=False):
+        """
+        Re-read rows marked as changed and rows in pks (or load the table on
+        first use); when the last check is more than ``interval`` seconds
+        old, or with force, also pick up rows saved, inserted or deleted by
+        other processes.
+
+        The whole refresh holds the table lock, so concurrent refreshes and
+        marks from signal receivers are applied one after the other.
+
+        Returns:
+            Number of rows re-read or removed
+        """
+        with self._lock:
+            if self._checked is None:
+                self._load()
+                return len(self.pk)
+
+            changed = self._changed | set(pks)
+            deleted = set(self._deleted)
+            self._changed.clear()
+            self._deleted.clear()
+
+            manager = self.model._default_manager
+            largest = int(self.pk[-1]) if len(self.pk) else 0
+            new = False
+            now = time.monotonic()
+            if force or now - self._checked >= self.interval:
+                self._checked = now
+                stats = manager.aggregate(count=Count('pk', filter=Q(pk__lte=largest)), largest=Max('pk'))
+                # Rows added by other processes have larger primary keys
+                new = (stats['largest'] or 0) > largest
+                marked = np.fromiter(deleted, dtype=np.int64, count=len(deleted))
+                if stats['count'] != len(self.pk) - int(np.isin(marked, self.pk).sum()):
+                    # Rows removed elsewhere: compare the primary keys
+                    stored = np.fromiter(manager.filter(pk__lte=largest).values_list('pk', flat=True).iterator(),
+                                         dtype=np.int64)
+                    deleted.update(np.setdiff1d(self.pk, stored).tolist())
+                if self.marker and len(self.updated):
+                    changed |= self._saved_elsewhere(manager, largest)
+
+            pk, arrays, updated = self.pk, dict(self.arrays), self.updated
+            if deleted:
+                keep = ~np.isin(pk, np.fromiter(deleted, dtype=np.int64))
+                pk, updated = pk[keep], updated[keep]
+                arrays = {name: values[keep] for name, values in arrays.items()}
+
+            read = 0
+            changed -= deleted
+            if changed or new:
+                query = manager.filter(pk__in=sorted(changed)) if changed else manager.none()
+                if new:
+                    query = query | manager.filter(pk__gt=largest)
+                read_pk, read_arrays, read_updated = self._read(query)
+                read = len(read_pk)
+                pk, arrays, updated = self._merge(pk, arrays, updated, read_pk, read_arrays, read_updated)
+
+            self.pk, self.arrays, self.updated = pk, arrays, updated
+            if deleted or read:
+                self._index = None
+        return read + len(deleted)
+
+    def _saved_elsewhere(self, manager, largest):
+        """Primary keys of known rows whose updated_at differs from this copy."""
+        cutoff = int(self.updated.max()) - self.overlap // _MICROSECOND
+        recent = manager.filter(**{f'{self.marker}__gte': _datetime(cutoff), 'pk__lte': largest})
+        pairs = list(recent.values_list('pk', self.marker).iterator(chunk_size=self.batch_size))
+        if not pairs:
+            return set()
+        pks = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        times = np.array([_microseconds(pair[1]) for pair in pairs], dtype=np.int64)
+        positions = _find(self.pk, pks)
+        stale = (positions < 0) | (self.updated[np.maximum(positions, 0)] != times)
+        return set(pks[stale].tolist())
+
+    def _merge(self, pk, arrays, updated, read_pk, read, read_updated):
+        """Overwrite existing rows and append new ones, keeping pk order."""
+        arrays = {**arrays, None: updated}
+        read = {**read, None: read_updated}
+        positions = _find(pk, read_pk)
+        existing = positions >= 0
+        arrays = {name: self._widen(arrays[name], read[name]).copy() for name in arrays}
+        for name, values in read.items():
+            arrays[name][positions[existing]] = values[existing]
+        if not existing.all():
+            pk = np.concatenate([pk, read_pk[~existing]])
+            arrays = {name: np.concatenate([arrays[name], read[name][~existing].astype(arrays[name].dtype)])
+                      for name in arrays}
+            order = np.argsort(pk, kind='stable')
+            pk = pk[order].astype(_int_dtype(pk))
+            arrays = {name: values[order] for name, values in arrays.items()}
+        updated = arrays.pop(None)
+        return pk, arrays, updated
+
+    @staticmethod
+    def _widen(current, update):
+        """current with a dtype that can also hold update's values."""
+        dtype = np.promote_types(current.dtype, update.dtype)
+        return current if dtype == current.dtype else current.astype(dtype)
+
+
+class Fleet:
+    """FleetTables of the buses, transformers, lines and relays."""
+
+    TABLES = {
+        'buses': 'substation_equipment.Bus',
+        'transformers': 'substation_equipment.Transformer',
+        'lines': 'substation_equipment.TransmissionLine',
+        'relays': 'relay.Relay',
+    }
+    # Stored results kept besides the editable fields
+    STORED = {
+        'buses': ['fault_current'],
+    }
+
+    def __init__(self, batch_size=10000, interval=2.0):
+        self.tables = {name: FleetTable(label, stored=self.STORED.get(name, ()), batch_size=batch_size,
+                                        interval=interval)
+                       for name, label in self.TABLES.items()}
+
+    def __getattr__(self, name):
+        tables = self.__dict__.get('tables', {})
+        if name in tables:
+            return tables[name]
+        raise AttributeError(name)
+
+    def load(self):
+        for table in self.tables.values():
+            table.load()
+        return self
+
+    def refresh(self, *names, force=False):
+        """Refresh the named tables (default: all); see FleetTable.refresh."""
+        return sum(self.tables[name].refresh(force=force) for name in names or self.tables)
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+
+_fleet = None
+_fleet_lock = threading.Lock()
+
+
+def get_fleet(*names):
+    """
+    This process's Fleet, with the named tables (default: all) refreshed.
+
+    Each table is loaded by its first refresh, and checks for changes made
+    by other processes at most once per interval.
+    """
+    global _fleet
+    with _fleet_lock:
+        if _fleet is None:
+            _fleet = Fleet()
+        fleet = _fleet
+    fleet.refresh(*names)
+    return fleet
+
+
+def row_changed(instance, deleted=False):
+    """Mark a saved or deleted row in every table of its model."""
+    for table in list(_tables):
+        if isinstance(instance, table.model):
+            if deleted:
+                table.mark_deleted(instance.pk)
+            else:
+                table.mark_changed(instance.pk)
@@ -0,0 +1,295 @@
+"""
+Opt-in instrumentation of calculations, database queries and cache use.
+
+Calculation functions and methods are wrapped with ``instrumented`` and
+ad-hoc blocks with ``measure``.  While instrumentation is enabled they
+record call counts and cumulative time:
+
+- per process, exported in the Prometheus text format by the ``metrics``
+  view and, optionally, written to a local file
+- per request, sent back in a ``Server-Timing`` header by
+  InstrumentationMiddleware, together with the request's database queries
+  and calculation cache hit rate
+
+When disabled, a wrapped call costs one flag check, the middleware removes
+itself at startup and no query wrapper is installed.
+
+Settings:
+    INSTRUMENTATION_ENABLED: turn instrumentation on (default False)
+    INSTRUMENTATION_EXPORT_PATH: file the Prometheus text is written to
+        (default: no file)
+    INSTRUMENTATION_EXPORT_INTERVAL: seconds between file exports, checked
+        after each request (default 60)
+
+The per-request cache hit rate is the change of the process-wide cache
+counters during the request, so concurrent requests share their hits.
+"""
+import atexit
+import contextvars
+import functools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+_enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+_lock = threading.Lock()
+# name -> [calls, seconds]
+_calculations = {}
+# view route -> [requests, seconds, queries, query seconds]
+_requests = {}
+_current = contextvars.ContextVar('instrumentation_request', default=None)
+_last_export = time.monotonic()
+
+
+class RequestMetrics:
+    """Calculations and queries of the request being handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calculations = {}
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache = _cache_counters()
+        self.token = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    """Turn instrumentation on for this process."""
+    global _enabled
+    _enabled = True
+    connection_created.connect(_on_connection_created, dispatch_uid='instrumentation')
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    connection_created.disconnect(dispatch_uid='instrumentation')
+
+
+def reset():
+    """Clear the process-wide counters."""
+    with _lock:
+        _calculations.clear()
+        _requests.clear()
+
+
+def _record(name, elapsed):
+    with _lock:
+        totals = _calculations.get(name)
+        if totals is None:
+            totals = _calculations[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+    request = _current.get()
+    if request is not None:
+        totals = request.calculations.get(name)
+        if totals is None:
+            totals = request.calculations[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+
+
+def instrumented(name=None):
+    """
+    Record calls and time of a function while instrumentation is enabled.
+
+    Usable as ``@instrumented`` or ``@instrumented('metric name')``; the
+    default name is the function's qualified name, e.g.
+    'Transformer.calculate_fault_current'.
+    """
+    def decorator(function):
+        metric = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(metric, time.perf_counter() - start)
+
+        return wrapper
+
+    if callable(name):
+        function, name = name, None
+        return decorator(function)
+    return decorator
+
+
+@contextmanager
+def measure(name):
+    """Record a block of code as one call of the named calculation."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+# Queries -------------------------------------------------------------------
+
+def _count_query(execute, sql, params, many, context):
+    request = _current.get()
+    if request is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request.queries += 1
+        request.query_time += time.perf_counter() - start
+
+
+def install_query_wrapper(connection):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_wrapper(connection)
+
+
+if _enabled:
+    connection_created.connect(_on_connection_created, dispatch_uid='instrumentation')
+
+
+# Requests ------------------------------------------------------------------
+
+def _cache_counters():
+    from substation_equipment.cache import calculation_cache
+
+    stats = calculation_cache.stats()
+    return stats['hits'], stats['misses']
+
+
+def start_request():
+    """Start collecting metrics for a request in the current context."""
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+    request = RequestMetrics()
+    request.token = _current.set(request)
+    return request
+
+
+def finish_request(metrics, request, response):
+    """Stop collecting, update the process totals and add Server-Timing."""
+    _current.reset(metrics.token)
+    elapsed = time.perf_counter() - metrics.started
+    hits, misses = _cache_counters()
+    hits -= metrics.cache[0]
+    misses -= metrics.cache[1]
+
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unresolved'
+    with _lock:
+        totals = _requests.get(route)
+        if totals is None:
+            totals = _requests[route] = [0, 0.0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] += metrics.queries
+        totals[3] += metrics.query_time
+
+    entries = [
+        f'{name};dur={seconds * 1000:.3f};desc="{calls} calls"'
+        for name, (calls, seconds) in sorted(metrics.calculations.items())
+    ]
+    entries.append(f'db;dur={metrics.query_time * 1000:.3f};desc="{metrics.queries} queries"')
+    if hits or misses:
+        entries.append(f'cache;desc="hit rate {hits / (hits + misses):.2f} ({hits}/{hits + misses})"')
+    entries.append(f'total;dur={elapsed * 1000:.3f}')
+    response['Server-Timing'] = ', '.join(entries)
+
+    _export_if_due()
+
+
+# Export --------------------------------------------------------------------
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_label(label)}"' for key, label in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+
+def prometheus_text():
+    """Process-wide metrics in the Prometheus text exposition format."""
+    from substation_equipment.cache import calculation_cache
+
+    with _lock:
+        calculations = {name: list(totals) for name, totals in _calculations.items()}
+        requests = {route: list(totals) for route, totals in _requests.items()}
+    cache = calculation_cache.stats()
+
+    lines = []
+    _metric(lines, 'protection_calculation_calls_total', 'counter', 'Calls of instrumented calculations.',
+            [({'name': name}, calls) for name, (calls, _) in sorted(calculations.items())])
+    _metric(lines, 'protection_calculation_seconds_total', 'counter', 'Time spent in instrumented calculations.',
+            [({'name': name}, f'{seconds:.9f}') for name, (_, seconds) in sorted(calculations.items())])
+    _metric(lines, 'protection_requests_total', 'counter', 'Requests handled, by URL route.',
+            [({'route': route}, totals[0]) for route, totals in sorted(requests.items())])
+    _metric(lines, 'protection_request_seconds_total', 'counter', 'Time spent handling requests, by URL route.',
+            [({'route': route}, f'{totals[1]:.9f}') for route, totals in sorted(requests.items())])
+    _metric(lines, 'protection_request_queries_total', 'counter', 'Database queries made by requests, by URL route.',
+            [({'route': route}, totals[2]) for route, totals in sorted(requests.items())])
+    _metric(lines, 'protection_request_query_seconds_total', 'counter', 'Time spent in database queries, by URL route.',
+            [({'route': route}, f'{totals[3]:.9f}') for route, totals in sorted(requests.items())])
+    _metric(lines, 'protection_calculation_cache_hits_total', 'counter', 'Calculation cache hits.',
+            [({'level': 'local'}, cache['local_hits']), ({'level': 'shared'}, cache['shared_hits'])])
+    _metric(lines, 'protection_calculation_cache_misses_total', 'counter', 'Calculation cache misses.',
+            [({}, cache['misses'])])
+    _metric(lines, 'protection_calculation_cache_hit_ratio', 'gauge', 'Calculation cache hit rate.',
+            [({}, f"{cache['hit_rate']:.6f}")])
+    return '\n'.join(lines) + '\n'
+
+
+def export(path=None):
+    """Write prometheus_text() to a file, replacing it atomically."""
+    path = path or getattr(settings, 'INSTRUMENTATION_EXPORT_PATH', None)
+    if not path:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(handle, 'w', encoding='utf-8') as output:
+        output.write(prometheus_text())
+    os.replace(temporary, path)
+
+
+def _export_if_due():
+    global _last_export
+    if not getattr(settings, 'INSTRUMENTATION_EXPORT_PATH', None):
+        return
+    now = time.monotonic()
+    if now - _last_export < getattr(settings, 'INSTRUMENTATION_EXPORT_INTERVAL', 60):
+        return
+    _last_export = now
+    export()
+
+
+@atexit.register
+def _export_at_exit():
+    if _enabled:
+        export()
@@ -0,0 +1,38 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import instrumentation
+
+
+class InstrumentationMiddleware:
+    """
+    Per-request calculation, query and cache metrics (see instrumentation.py).
+
+    Removed at startup unless INSTRUMENTATION_ENABLED is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation.is_enabled():
+            raise MiddlewareNotUsed
+        instrumentation.enable()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = instrumentation.start_request()
+        response = self.get_response(request)
+        instrumentation.finish_request(metrics, request, response)
+        return response
+
+    async def __acall__(self, request):
+        metrics = instrumentation.start_request()
+        response = await self.get_response(request)
+        instrumentation.finish_request(metrics, request, response)
+        return response
@@ -11,22 +11,61 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    value = os.environ.get(name, '').strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f"{name} must be an integer, not '{value}'")
+
+
+def env_list(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
+# Deployment profile, selected with DJANGO_PROFILE:
+#   development (default): DEBUG on, a new database connection per request
+#   production: DEBUG off (DEBUG keeps every query in memory), persistent
+#       connections, DJANGO_SECRET_KEY required
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+PROFILE = os.environ.get('DJANGO_PROFILE', 'development')
+if PROFILE not in ('development', 'production'):
+    raise ImproperlyConfigured(f"DJANGO_PROFILE must be 'development' or 'production', not '{PROFILE}'")
+PRODUCTION = PROFILE == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-$q%abt)0-7ikkin$%9-&@5^d0-m(*wxcui_oerm7y*z@f(2j)^'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    if PRODUCTION:
+        raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set in the production profile')
+    SECRET_KEY = 'django-insecure-$q%abt)0-7ikkin$%9-&@5^d0-m(*wxcui_oerm7y*z@f(2j)^'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', not PRODUCTION)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', [])
 
 
 # Application definition
@@ -44,6 +83,9 @@ INSTALLED_APPS = [
     # LOCAL APPS ##
     'relay',
     'substation_equipment',
+    'coordination',
+    'benchmarks',
+    'studies',
 
     ##
 
@@ -51,6 +93,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'protectioncalculator.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,13 +127,97 @@ WSGI_APPLICATION = 'protectioncalculator.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DJANGO_DATABASE selects 'sqlite' (default) or 'postgresql'.
+# DJANGO_CONN_MAX_AGE keeps connections open for that many seconds
+# (default 0 in development, 600 in production); reused connections are
+# health-checked before each request.
+
+CONN_MAX_AGE = env_int('DJANGO_CONN_MAX_AGE', 600 if PRODUCTION else 0)
+DATABASE_ENGINE = os.environ.get('DJANGO_DATABASE', 'sqlite')
+
+if DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': CONN_MAX_AGE != 0,
+            'OPTIONS': {
+                # Run on every new connection.  WAL lets readers continue
+                # while a bulk import writes; synchronous=NORMAL is safe in
+                # WAL mode.  64 MB page cache, 256 MB memory-mapped I/O.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-65536;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA temp_store=MEMORY'
+                ),
+                # Take the write lock when a transaction starts, so a
+                # transaction that reads first can't fail with "database is
+                # locked" when it starts writing
+                'transaction_mode': 'IMMEDIATE',
+                # Seconds to wait for the write lock
+                'timeout': env_int('DJANGO_SQLITE_TIMEOUT', 20),
+            },
+        }
+    }
+elif DATABASE_ENGINE == 'postgresql':
+    # Needs psycopg: pip install "psycopg[binary]"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'protectioncalculator'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': CONN_MAX_AGE != 0,
+            # Needed behind a transaction-pooling PgBouncer
+            'DISABLE_SERVER_SIDE_CURSORS': env_bool('POSTGRES_DISABLE_SERVER_SIDE_CURSORS', False),
+            'OPTIONS': {
+                'connect_timeout': 10,
+                'application_name': 'protectioncalculator',
+            },
+        }
     }
+else:
+    raise ImproperlyConfigured(f"DJANGO_DATABASE must be 'sqlite' or 'postgresql', not '{DATABASE_ENGINE}'")
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'calculations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'calculations',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
+# Equipment calculation results (substation_equipment/cache.py)
+CALCULATION_CACHE_ALIAS = 'calculations'
+CALCULATION_CACHE_SIZE = 10000
+
+# Process pool used by the async calculation views (protectioncalculator/workers.py)
+CALCULATION_WORKERS = None  # Defaults to the number of CPUs
+CALCULATION_MAX_PENDING = None  # Defaults to twice the number of workers
+CALCULATION_POOL_THRESHOLD = 10000
+
+# Calculation, query and cache metrics (protectioncalculator/instrumentation.py)
+INSTRUMENTATION_ENABLED = env_bool('DJANGO_INSTRUMENTATION', False)
+INSTRUMENTATION_EXPORT_PATH = None  # e.g. BASE_DIR / 'metrics.prom'
+INSTRUMENTATION_EXPORT_INTERVAL = 60
+
+# Study snapshots: frozen input columns and results as .npy files
+STUDY_DATA_ROOT = Path(os.environ.get('DJANGO_STUDY_DATA_ROOT', BASE_DIR / 'study_data'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
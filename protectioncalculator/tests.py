@@ -0,0 +1,307 @@
+import asyncio
+import operator
+import os
+import runpy
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from relay.models import Relay
+from substation_equipment.models import Bus, Transformer
+
+from . import admin_utils, fleet, instrumentation, settings as project_settings, workers
+from .fleet import FleetTable, get_fleet
+from .workers import Coalescer, run_calculation
+
+
+class CoalescerTests(SimpleTestCase):
+    def test_identical_requests_share_one_computation(self):
+        coalescer = Coalescer()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def main():
+            first = await asyncio.gather(*(coalescer.run('key', compute) for _ in range(3)))
+            # Nothing is kept once the computation is done
+            second = await coalescer.run('key', compute)
+            return first, second
+
+        first, second = asyncio.run(main())
+        self.assertEqual(first, [1, 1, 1])
+        self.assertEqual(second, 2)
+        self.assertEqual((coalescer.started, coalescer.coalesced), (2, 2))
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        coalescer = Coalescer()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        async def main():
+            cancelled = asyncio.ensure_future(coalescer.run('key', compute))
+            waiting = asyncio.ensure_future(coalescer.run('key', compute))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            return await waiting
+
+        self.assertEqual(asyncio.run(main()), 'done')
+
+
+class RunCalculationTests(SimpleTestCase):
+    def test_small_jobs_run_inline(self):
+        self.assertEqual(asyncio.run(run_calculation(1, operator.add, 2, 3)), 5)
+        self.assertIsNone(workers._executor)
+
+    @override_settings(CALCULATION_WORKERS=1, CALCULATION_POOL_THRESHOLD=0)
+    def test_large_jobs_run_in_the_pool(self):
+        self.addCleanup(workers.shutdown)
+        self.assertEqual(asyncio.run(run_calculation(1, operator.add, 2, 3)), 5)
+        self.assertIsNotNone(workers._executor)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        get_fleet().refresh(force=True)
+
+    async def test_async_views_match_sync_views(self):
+        relay = await Relay.objects.acreate(
+            name='R1', type='oc', protected_equipment='line', standard='iec',
+            curve_type='standard_inverse', tds=0.1, current_setting=100)
+        transformer = await Transformer.objects.acreate(
+            name='T1', kva_rating=1000, primary_voltage=11000, secondary_voltage=415, impedance=5)
+        requests = [
+            ('relay-trip-times', {'relays': [relay.pk], 'fault_currents': [50, 1000]}),
+            ('transformer-batch', {'ids': [transformer.pk]}),
+        ]
+        for name, data in requests:
+            expected = await self.async_client.post(reverse(name), data, content_type='application/json')
+            response = await self.async_client.post(
+                reverse(f'{name}-async'), data, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+
+    async def test_errors(self):
+        response = await self.async_client.post(
+            reverse('line-batch-async'), {'ids': [12345]}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('relay-trip-times-async'))
+        self.assertEqual(response.status_code, 405)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+        self.addCleanup(instrumentation.disable)
+
+    def test_disabled_records_nothing(self):
+        relay = Relay(name='R1', type='oc', protected_equipment='line', standard='iec',
+                      curve_type='standard_inverse', tds=0.1, current_setting=100)
+        relay.calculate_trip_time(1000)
+        self.assertNotIn('Relay.calculate_trip_time', instrumentation.prometheus_text())
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_calculations(self):
+        instrumentation.enable()
+
+        @instrumentation.instrumented('test.calculation')
+        def calculation():
+            return 1
+
+        calculation()
+        calculation()
+        with instrumentation.measure('test.block'):
+            pass
+        text = instrumentation.prometheus_text()
+        self.assertIn('protection_calculation_calls_total{name="test.calculation"} 2', text)
+        self.assertIn('protection_calculation_calls_total{name="test.block"} 1', text)
+
+    def test_server_timing_and_metrics(self):
+        instrumentation.enable()
+        transformer = Transformer.objects.create(
+            name='T1', kva_rating=1000, primary_voltage=11000, secondary_voltage=415, impedance=5)
+        response = self.client.get(reverse('transformer-detail', args=[transformer.pk]))
+        timing = response['Server-Timing']
+        self.assertIn('Transformer.calculate_fault_current;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('total;dur=', timing)
+
+        metrics = self.client.get(reverse('metrics'))
+        self.assertEqual(metrics.status_code, 200)
+        text = metrics.content.decode()
+        self.assertIn('protection_requests_total{route="api/equipment/transformers/<int:pk>/"} 1', text)
+        self.assertIn('protection_request_queries_total{route="api/equipment/transformers/<int:pk>/"} 1', text)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.prom')
+            instrumentation.export(path)
+            with open(path, encoding='utf-8') as handle:
+                self.assertIn('protection_requests_total', handle.read())
+
+
+def load_settings(**environ):
+    """Module globals of settings.py read with only the given DJANGO_/POSTGRES_ variables set."""
+    clean = {key: value for key, value in os.environ.items() if not key.startswith(('DJANGO_', 'POSTGRES_'))}
+    with mock.patch.dict(os.environ, {**clean, **environ}, clear=True):
+        return runpy.run_path(project_settings.__file__)
+
+
+class SettingsTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_environment_helpers(self):
+        with mock.patch.dict(os.environ, {'TEST_INT': ' 12 ', 'TEST_BLANK': '', 'TEST_BAD': 'twelve'}):
+            self.assertEqual(project_settings.env_int('TEST_INT', 5), 12)
+            self.assertEqual(project_settings.env_int('TEST_BLANK', 5), 5)
+            self.assertEqual(project_settings.env_int('TEST_MISSING', 5), 5)
+            with self.assertRaises(ImproperlyConfigured):
+                project_settings.env_int('TEST_BAD', 5)
+        with mock.patch.dict(os.environ, {'TEST_BOOL': 'Yes', 'TEST_LIST': 'a.example, b.example,'}):
+            self.assertTrue(project_settings.env_bool('TEST_BOOL', False))
+            self.assertEqual(project_settings.env_list('TEST_LIST', []), ['a.example', 'b.example'])
+
+    def test_development_profile(self):
+        values = load_settings()
+        database = values['DATABASES']['default']
+        self.assertTrue(values['DEBUG'])
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (0, False))
+        self.assertIn('PRAGMA journal_mode=WAL', database['OPTIONS']['init_command'])
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(load_settings(DJANGO_SQLITE_TIMEOUT='5')['DATABASES']['default']['OPTIONS']['timeout'], 5)
+
+    def test_production_profile(self):
+        with self.assertRaises(ImproperlyConfigured):
+            load_settings(DJANGO_PROFILE='production')
+        values = load_settings(DJANGO_PROFILE='production', DJANGO_SECRET_KEY='secret',
+                               DJANGO_ALLOWED_HOSTS='calc.example')
+        database = values['DATABASES']['default']
+        self.assertFalse(values['DEBUG'])
+        self.assertEqual(values['ALLOWED_HOSTS'], ['calc.example'])
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (600, True))
+        with self.assertRaises(ImproperlyConfigured):
+            load_settings(DJANGO_PROFILE='staging')
+
+    def test_postgresql(self):
+        database = load_settings(DJANGO_DATABASE='postgresql', POSTGRES_HOST='db')['DATABASES']['default']
+        self.assertEqual((database['ENGINE'], database['HOST']), ('django.db.backends.postgresql', 'db'))
+        with self.assertRaises(ImproperlyConfigured):
+            load_settings(DJANGO_DATABASE='mysql')
+
+    def test_connection_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_estimate_for_large_unfiltered_tables(self):
+        for index in range(5):
+            Transformer.objects.create(name=f'T{index}', kva_rating=1000, primary_voltage=11000,
+                                       secondary_voltage=415, impedance=5)
+        Transformer.objects.filter(name='T2').delete()
+        largest = Transformer.objects.order_by('-pk').values_list('pk', flat=True)[0]
+        self.assertEqual(admin_utils.estimate_row_count(Transformer), largest)
+
+        with mock.patch.object(admin_utils.EstimatedCountPaginator, 'threshold', 0):
+            paginator = admin_utils.EstimatedCountPaginator(Transformer.objects.order_by('pk'), 2)
+            self.assertEqual(paginator.count, largest)
+            # Filtered lists are counted exactly
+            filtered = admin_utils.EstimatedCountPaginator(Transformer.objects.filter(kva_rating=1000).order_by('pk'), 2)
+            self.assertEqual(filtered.count, 4)
+        # Small tables are counted exactly
+        self.assertEqual(admin_utils.EstimatedCountPaginator(Transformer.objects.order_by('pk'), 2).count, 4)
+
+
+def fleet_transformer(name, **fields):
+    values = {'kva_rating': 1000, 'primary_voltage': 11000, 'secondary_voltage': 415, 'impedance': 5}
+    values.update(fields)
+    return Transformer(name=name, **values)
+
+
+class FleetTableTests(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(name='B1', voltage=11000)
+        self.items = [fleet_transformer(f'T{index}', primary_bus=self.bus if index == 0 else None)
+                      for index in range(3)]
+        for item in self.items:
+            item.save()
+        self.table = FleetTable(Transformer, interval=3600).load()
+
+    def elsewhere(self):
+        """The table as another process sees it: not marked by this process's signals."""
+        fleet._tables.discard(self.table)
+        return self.table
+
+    def test_load_and_lookups(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.positions(['T2', 'T9']).tolist(), [2, -1])
+        row = self.table.get('T0')
+        self.assertEqual((row['pk'], row['primary_bus_id'], row['secondary_bus_id']), (self.items[0].pk, self.bus.pk, None))
+        self.assertEqual((row['phase_type'], row['vector_group'], row['kva_rating']), ('three', 'Dyn11', 1000))
+
+        found, columns = self.table.select([self.items[2].pk, 0, self.items[0].pk], ['name', 'impedance'])
+        self.assertEqual(found.tolist(), [True, False, True])
+        self.assertEqual(columns['name'].tolist(), ['T2', 'T0'])
+
+    def test_changes_in_this_process(self):
+        self.items[1].impedance = 6
+        self.items[1].save()
+        fleet_transformer('T3').save()
+        self.items[2].delete()
+        # Marked rows only: one query, no checks for other processes
+        with self.assertNumQueries(1):
+            self.assertEqual(self.table.refresh(), 3)
+        self.assertEqual(self.table.values('name').tolist(), ['T0', 'T1', 'T3'])
+        self.assertEqual(self.table.get('T1')['impedance'], 6)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.table.refresh(), 0)
+
+    def test_changes_in_other_processes(self):
+        table = self.elsewhere()
+        Transformer.objects.filter(pk=self.items[1].pk).update(impedance=7, updated_at=timezone.now())
+        Transformer.objects.bulk_create([fleet_transformer('T3')])
+        Transformer.objects.filter(pk=self.items[0].pk)._raw_delete(Transformer.objects.db)
+
+        # Within the interval nothing is checked
+        self.assertEqual(table.refresh(), 0)
+        self.assertEqual(len(table), 3)
+
+        self.assertEqual(table.refresh(force=True), 3)
+        self.assertEqual(table.values('name').tolist(), ['T1', 'T2', 'T3'])
+        self.assertEqual(table.get('T1')['impedance'], 7)
+        self.assertEqual(table.refresh(force=True), 0)
+
+    def test_updates_without_marker_need_pks(self):
+        table = self.elsewhere()
+        Transformer.objects.filter(pk=self.items[2].pk).update(impedance=8)
+        table.refresh(force=True)
+        self.assertEqual(table.get('T2')['impedance'], 5)
+        table.refresh(pks=[self.items[2].pk])
+        self.assertEqual(table.get('T2')['impedance'], 8)
+
+    def test_interval(self):
+        table = self.elsewhere()
+        table.interval = 0
+        Transformer.objects.bulk_create([fleet_transformer('T3')])
+        self.assertEqual(table.refresh(), 1)
+        self.assertEqual(table.positions(['T3']).tolist(), [3])
+
+    def test_fleet_keeps_bus_fault_levels(self):
+        Bus.objects.filter(pk=self.bus.pk).update(fault_current=12345, updated_at=timezone.now())
+        buses = get_fleet('buses').buses
+        buses.refresh(force=True)
+        self.assertEqual(buses.get('B1')['fault_current'], 12345)
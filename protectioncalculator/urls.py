@@ -15,11 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path  # , include
+from django.urls import include, path
+
+from .views import metrics
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/relays/', include('relay.urls')),
+    path('api/equipment/', include('substation_equipment.urls')),
+    path('metrics/', metrics, name='metrics'),
     # path('calculations/', include('calculations.urls')),
     # path('line/', include('line_calculator.urls')),
     # path('transformer/', include('transformer_calculator.urls')),
@@ -0,0 +1,10 @@
+from django.http import Http404, HttpResponse
+
+from . import instrumentation
+
+
+def metrics(request):
+    """Instrumentation counters in the Prometheus text format."""
+    if not instrumentation.is_enabled():
+        raise Http404('Instrumentation is disabled')
+    return HttpResponse(instrumentation.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,116 @@
+"""
+Process pool and request coalescing for the async calculation views.
+
+CPU-heavy batch calculations are sent to a bounded ProcessPoolExecutor so
+they don't block the ASGI event loop.  Identical requests that arrive while
+one is already being computed share its result instead of starting another
+computation.
+
+Settings:
+    CALCULATION_WORKERS: pool size (default: number of CPUs)
+    CALCULATION_MAX_PENDING: jobs allowed in the pool at once; further
+        requests wait (default: twice the pool size)
+    CALCULATION_POOL_THRESHOLD: result size below which work runs inline,
+        where the pool's pickling overhead would dominate (default 10000)
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+_executor = None
+# asyncio primitives belong to one event loop, so keep one per loop
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def worker_count():
+    return getattr(settings, 'CALCULATION_WORKERS', None) or os.cpu_count() or 1
+
+
+def pool_threshold():
+    return getattr(settings, 'CALCULATION_POOL_THRESHOLD', 10000)
+
+
+def get_executor():
+    """The shared process pool, created on first use."""
+    global _executor
+    if _executor is None:
+        # Spawned workers don't inherit the server's threads or sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=worker_count(), mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(shutdown)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(
+            getattr(settings, 'CALCULATION_MAX_PENDING', None) or 2 * worker_count())
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def run_calculation(size, function, *args):
+    """
+    Run function(*args) in the process pool, or inline for small jobs.
+
+    Args:
+        size: number of results the job produces, compared with
+            CALCULATION_POOL_THRESHOLD
+        function: picklable module-level function
+    """
+    if size < pool_threshold():
+        return function(*args)
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), function, *args)
+
+
+class Coalescer:
+    """
+    Shares one computation between identical concurrent requests.
+
+    The first caller with a key starts the computation; callers arriving
+    with the same key before it finishes await the same result.  Nothing is
+    kept after completion, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._in_flight = weakref.WeakKeyDictionary()
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        """
+        Args:
+            key: hashable description of the request
+            factory: zero-argument callable returning a coroutine
+        """
+        in_flight = self._in_flight.setdefault(asyncio.get_running_loop(), {})
+        task = in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            in_flight[key] = task
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+            self.started += 1
+        # A cancelled caller must not cancel the computation for the others
+        return await asyncio.shield(task)
+
+
+coalescer = Coalescer()
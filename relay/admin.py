@@ -1,7 +1,45 @@
 from django.contrib import admin
-from .models import Relay
+
+from protectioncalculator.admin_utils import BulkComputedAdmin, page_value
+
+from .curves import RelayCurveSet
+from .models import CustomCurve, Relay
 
 # Register your models here.
 
 
-admin.site.register(Relay)
+# Fault currents (A) the trip time columns are calculated at
+REFERENCE_CURRENTS = (1000, 5000, 10000)
+
+
+def _trip_time_column(index, current):
+    @admin.display(description=f't @ {current} A (s)')
+    def column(self, row):
+        return page_value(row, f'trip_time_{index}')
+    return column
+
+
+@admin.register(Relay)
+class RelayAdmin(BulkComputedAdmin):
+    list_display = ('name', 'type', 'protected_equipment', 'equipment', 'standard', 'curve_type', 'tds',
+                    'current_setting', 'trip_time_0', 'trip_time_1', 'trip_time_2')
+    list_filter = ('type', 'standard', 'protected_equipment')
+    search_fields = ('^name',)
+    list_select_related = ('transformer', 'line')
+    autocomplete_fields = ('transformer', 'line')
+
+    trip_time_0 = _trip_time_column(0, REFERENCE_CURRENTS[0])
+    trip_time_1 = _trip_time_column(1, REFERENCE_CURRENTS[1])
+    trip_time_2 = _trip_time_column(2, REFERENCE_CURRENTS[2])
+
+    def annotate_page(self, rows):
+        times = RelayCurveSet(rows).trip_times(REFERENCE_CURRENTS)
+        for index, row in enumerate(rows):
+            row._page_values = {f'trip_time_{column}': value for column, value in enumerate(times[index])}
+
+
+@admin.register(CustomCurve)
+class CustomCurveAdmin(admin.ModelAdmin):
+    list_display = ('name', 'standard', 'k', 'alpha', 'b', 'reset')
+    list_filter = ('standard',)
+    search_fields = ('^name',)
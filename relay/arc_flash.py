@@ -0,0 +1,420 @@
+"""
+Arc-flash incident energy from bolted fault current and relay clearing time.
+
+Uses the empirical model of IEEE 1584-2002 for 208 V to 15 kV (currents in
+kA, voltage in kV, gap G and working distance D in mm):
+
+    arcing current, V < 1 kV:
+        lg Ia = K + 0.662 lg Ibf + 0.0966 V + 0.000526 G
+                + 0.5588 V lg Ibf - 0.00304 G lg Ibf
+        K = -0.153 open air, -0.097 enclosed
+    arcing current, V >= 1 kV:
+        lg Ia = 0.00402 + 0.983 lg Ibf
+
+    normalized energy (0.2 s at 610 mm):
+        lg En = K1 + K2 + 1.081 lg Ia + 0.0011 G
+        K1 = -0.792 open air, -0.555 enclosed
+        K2 = 0 ungrounded, -0.113 grounded
+
+    incident energy (J/cm²):
+        E = 4.184 Cf En (t / 0.2) (610^x / D^x)
+        Cf = 1.5 at or below 1 kV, 1.0 above
+
+and the Lee method, E = 2.142e6 V Ibf t / D², above 15 kV.  The arc-flash
+boundary is the distance at which E falls to 5.0 J/cm² (1.2 cal/cm²).
+
+Each piece of equipment is one location: a transformer's secondary bus, or
+the far (to) bus of a line.  The arcing current is cleared by the fastest
+overcurrent relay linked to the equipment (Relay.transformer / Relay.line),
+which sees it referred to the primary side for transformers, plus the
+breaker opening time, capped at ``max_clearing_time``.  Below 1 kV the
+energy is also evaluated at 85 % of the arcing current, where the relay may
+be much slower, and the larger result is kept.
+
+``fleet_arc_flash`` computes every location in one vectorized pass (three
+queries) and stores each equipment's result in the calculation cache, where
+``arc_flash`` finds it for single pieces of equipment.
+"""
+import hashlib
+
+import numpy as np
+from django.db.models import Q
+
+from substation_equipment.cache import calculation_cache
+from substation_equipment.calculations import line_ratings, transformer_ratings
+from substation_equipment.models import Transformer, TransmissionLine
+
+from .curves import get_curve, registry
+from .differential import parse_vector_group
+from .models import Relay
+
+
+# (gap mm, distance exponent x, working distance mm) for voltages up to
+# 1 kV, 5 kV and 15 kV (and above), from IEEE 1584-2002 tables 4 and 3
+EQUIPMENT_CLASSES = {
+    'switchgear': ((32, 1.473, 610), (102, 0.973, 910), (153, 0.973, 910)),
+    'panel': ((25, 1.641, 455), (102, 0.973, 910), (153, 0.973, 910)),  # MCCs and panelboards
+    'cable': ((13, 2.0, 455), (13, 2.0, 455), (13, 2.0, 455)),
+    'open_air': ((40, 2.0, 455), (102, 2.0, 910), (153, 2.0, 910)),
+}
+BOUNDARY_ENERGY = 5.0  # J/cm², onset of a second-degree burn
+JOULES_PER_CALORIE = 4.184
+REDUCED_ARCING_FACTOR = 0.85
+
+TRANSFORMER_FIELDS = ('pk', 'name', 'secondary_bus__name', 'kva_rating', 'primary_voltage', 'secondary_voltage',
+                      'impedance', 'phase_type', 'vector_group')
+LINE_FIELDS = ('pk', 'name', 'to_bus__name', 'kva_rating', 'voltage_rating', 'impedance', 'phase_type')
+RELAY_FIELDS = ('transformer_id', 'line_id', 'pk', 'standard', 'curve_type', 'tds', 'current_setting')
+
+
+# Model equations -----------------------------------------------------------
+
+def arcing_current(voltage, bolted_current, gap, enclosed):
+    """
+    Arcing fault current.
+
+    Args:
+        voltage: system voltage in volts
+        bolted_current: bolted three-phase fault current in amperes
+        gap: conductor gap in mm
+        enclosed: True for equipment in a box, False for open air
+
+    Returns:
+        Arcing current in amperes; the bolted current above 15 kV, where
+        the Lee method applies
+    """
+    kv = np.asarray(voltage, dtype=float) / 1000
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lg = np.log10(np.asarray(bolted_current, dtype=float) / 1000)
+        k = np.where(enclosed, -0.097, -0.153)
+        low = k + 0.662 * lg + 0.0966 * kv + 0.000526 * gap + 0.5588 * kv * lg - 0.00304 * gap * lg
+        high = 0.00402 + 0.983 * lg
+        arcing = 1000 * 10 ** np.where(kv < 1, low, high)
+    return np.where(kv > 15, bolted_current, arcing)
+
+
+def incident_energy(voltage, bolted_current, arcing, clearing_time, gap, exponent, distance, enclosed, grounded):
+    """
+    Incident energy at the working distance.
+
+    Args:
+        arcing: arcing current in amperes
+        clearing_time: arc duration in seconds
+        exponent: distance exponent x of the equipment class
+        distance: working distance in mm
+        grounded: True for solidly grounded systems
+
+    Returns:
+        Incident energy in J/cm²
+    """
+    voltage = np.asarray(voltage, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k1 = np.where(enclosed, -0.555, -0.792)
+        k2 = np.where(grounded, -0.113, 0.0)
+        normalized = 10 ** (k1 + k2 + 1.081 * np.log10(arcing / 1000) + 0.0011 * gap)
+        factor = np.where(voltage <= 1000, 1.5, 1.0)
+        ieee = 4.184 * factor * normalized * (clearing_time / 0.2) * (610 / distance) ** exponent
+        lee = 2.142e6 * (voltage / 1000) * (bolted_current / 1000) * clearing_time / distance ** 2
+    return np.where(voltage > 15000, lee, ieee)
+
+
+def arc_flash_boundary(voltage, energy, exponent, distance, boundary_energy=BOUNDARY_ENERGY):
+    """Distance in mm at which the incident energy falls to boundary_energy (J/cm²)."""
+    exponent = np.where(np.asarray(voltage) > 15000, 2.0, exponent)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return distance * (energy / boundary_energy) ** (1 / exponent)
+
+
+# Locations -----------------------------------------------------------------
+
+def _secondary_grounded(vector_group):
+    try:
+        return parse_vector_group(vector_group)[1] in ('yn', 'zn')
+    except ValueError:
+        return False  # Unknown: ungrounded gives the larger energy
+
+
+def _class_parameters(classes, voltage):
+    """Gap, distance exponent and working distance of each location."""
+    names = list(EQUIPMENT_CLASSES)
+    table = np.array([EQUIPMENT_CLASSES[name] for name in names], dtype=float)
+    rows = np.array([names.index(name) for name in classes], dtype=int)
+    parameters = table[rows, np.searchsorted([1000, 5000], voltage)]
+    return parameters[:, 0], parameters[:, 1], parameters[:, 2]
+
+
+def _transformer_locations(rows, transformer_class=None):
+    pk, name, bus, kva, primary, secondary, impedance, phase, vector_group = (
+        list(column) for column in zip(*rows)) if rows else ([] for _ in TRANSFORMER_FIELDS)
+    secondary = np.array(secondary, dtype=float)
+    ratings = transformer_ratings(
+        kva_rating=np.array(kva, dtype=float), primary_voltage=np.array(primary, dtype=float),
+        secondary_voltage=secondary, impedance=np.array(impedance, dtype=float),
+        three_phase=np.array([value == 'three' for value in phase], dtype=bool))
+    classes = [transformer_class or ('panel' if voltage <= 1000 else 'switchgear') for voltage in secondary]
+    return {
+        'equipment': np.array(['tra'] * len(pk), dtype=str),
+        'pk': np.array([-1 if value is None else value for value in pk], dtype=np.int64),
+        'name': np.array(name, dtype=str),
+        'location': np.array([bus_name or f'{label} secondary' for bus_name, label in zip(bus, name)], dtype=str),
+        'voltage': secondary,
+        'bolted_current': ratings['secondary_fault_current'],
+        # The relay on the primary side sees the fault current times Vs / Vp
+        'relay_ratio': secondary / np.array(primary, dtype=float),
+        'grounded': np.array([_secondary_grounded(value) for value in vector_group], dtype=bool),
+        'equipment_class': np.array(classes, dtype=str),
+    }
+
+
+def _line_locations(rows, line_class='open_air', grounded=True):
+    pk, name, bus, kva, voltage, impedance, phase = (
+        list(column) for column in zip(*rows)) if rows else ([] for _ in LINE_FIELDS)
+    voltage = np.array(voltage, dtype=float)
+    ratings = line_ratings(
+        kva_rating=np.array(kva, dtype=float), voltage_rating=voltage,
+        impedance=np.array(impedance, dtype=float),
+        three_phase=np.array([value == 'three' for value in phase], dtype=bool))
+    return {
+        'equipment': np.array(['line'] * len(pk), dtype=str),
+        'pk': np.array([-1 if value is None else value for value in pk], dtype=np.int64),
+        'name': np.array(name, dtype=str),
+        'location': np.array([bus_name or label for bus_name, label in zip(bus, name)], dtype=str),
+        'voltage': voltage,
+        'bolted_current': ratings['fault_current'],
+        'relay_ratio': np.ones(len(pk)),
+        'grounded': np.full(len(pk), grounded),
+        'equipment_class': np.array([line_class] * len(pk), dtype=str),
+    }
+
+
+def _concatenate(*parts):
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+# Evaluation ----------------------------------------------------------------
+
+def _fastest_trip(relays, location, relay_current, count):
+    """Fastest relay trip time per location (inf where no relay trips)."""
+    fastest = np.full(count, np.inf)
+    if not len(location):
+        return fastest
+    standard, curve_type, tds, pickup = relays
+    keys = np.char.add(np.char.add(standard, ':'), curve_type)
+    for key in np.unique(keys):
+        curve = get_curve(*str(key).split(':', 1))
+        if curve is None:
+            continue
+        rows = np.flatnonzero(keys == key)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            multiple = relay_current[location[rows]] / pickup[rows]
+            times = np.where(multiple > 1, curve.trip_time(tds[rows], multiple), np.nan)
+        np.fmin.at(fastest, location[rows], np.where(np.isnan(times), np.inf, times))
+    return fastest
+
+
+def evaluate(locations, relay_rows, breaker_time=0.05, max_clearing_time=2.0):
+    """
+    Arc-flash results of many locations at once.
+
+    Args:
+        locations: dictionary of location arrays (see _transformer_locations)
+        relay_rows: (location index, standard, curve type, TDS, pickup) of
+            every overcurrent relay linked to a location
+        breaker_time: breaker opening time added to the relay trip time, s
+        max_clearing_time: longest arc duration assumed, s
+
+    Returns:
+        Dictionary of result arrays, one entry per location
+    """
+    count = len(locations['voltage'])
+    voltage = locations['voltage']
+    bolted = locations['bolted_current']
+    gap, exponent, distance = _class_parameters(locations['equipment_class'], voltage)
+    enclosed = locations['equipment_class'] != 'open_air'
+    grounded = locations['grounded']
+
+    location = np.array([row[0] for row in relay_rows], dtype=int)
+    relays = (np.array([row[1] or '' for row in relay_rows], dtype=str),
+              np.array([row[2] or '' for row in relay_rows], dtype=str),
+              np.array([np.nan if row[3] is None else row[3] for row in relay_rows], dtype=float),
+              np.array([np.nan if row[4] is None else row[4] for row in relay_rows], dtype=float))
+
+    full = arcing_current(voltage, bolted, gap, enclosed)
+    best = None
+    for arcing in (full, np.where(voltage < 1000, REDUCED_ARCING_FACTOR * full, full)):
+        fastest = _fastest_trip(relays, location, arcing * locations['relay_ratio'], count)
+        tripped = np.isfinite(fastest)
+        clearing = np.minimum(np.where(tripped, fastest + breaker_time, max_clearing_time), max_clearing_time)
+        energy = incident_energy(voltage, bolted, arcing, clearing, gap, exponent, distance, enclosed, grounded)
+        case = {'arcing_current': arcing, 'clearing_time': clearing, 'relay_tripped': tripped, 'energy': energy}
+        if best is None:
+            best = case
+        else:
+            worse = energy > best['energy']
+            best = {key: np.where(worse, case[key], best[key]) for key in best}
+
+    energy = best['energy']
+    return {
+        'equipment': locations['equipment'],
+        'pk': locations['pk'],
+        'name': locations['name'],
+        'location': locations['location'],
+        'equipment_class': locations['equipment_class'],
+        'voltage': voltage,
+        'bolted_current': bolted,
+        'arcing_current': best['arcing_current'],
+        'clearing_time': best['clearing_time'],
+        'relay_tripped': best['relay_tripped'],
+        'working_distance': distance,
+        'incident_energy': energy / JOULES_PER_CALORIE,  # cal/cm²
+        'boundary': arc_flash_boundary(voltage, energy, exponent, distance),
+        'method': np.where(voltage > 15000, 'lee', 'ieee1584'),
+        # Inside the voltage and current range the IEEE 1584 model was fitted to
+        'in_range': (voltage > 15000) | ((voltage >= 208) & (bolted >= 700) & (bolted <= 106_000)),
+    }
+
+
+class ArcFlashResult:
+    """Arc-flash results of many locations, as arrays with one entry each."""
+
+    COLUMNS = ('equipment', 'name', 'location', 'equipment_class', 'voltage', 'bolted_current',
+               'arcing_current', 'clearing_time', 'relay_tripped', 'working_distance',
+               'incident_energy', 'boundary', 'method', 'in_range')
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values['voltage'])
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def row(self, index):
+        """Result of one location as a dictionary of Python values."""
+        return {name: self.values[name][index].item() for name in self.COLUMNS}
+
+    def rows(self):
+        columns = [self.values[name].tolist() for name in self.COLUMNS]
+        for values in zip(*columns):
+            yield dict(zip(self.COLUMNS, values))
+
+
+# Fleet and single equipment ------------------------------------------------
+
+def _cache_key(kind, row, relays, options):
+    # Relay settings and the curve table are part of the key, so editing a
+    # relay or a custom curve never returns a stale result
+    inputs = repr((tuple(float(value) if isinstance(value, int) else value for value in row),
+                   tuple(sorted(relays)), options, registry.version))
+    digest = hashlib.blake2b(inputs.encode(), digest_size=8).hexdigest()
+    label = Transformer._meta.label_lower if kind == 'tra' else TransmissionLine._meta.label_lower
+    return (label, row[0]), f'arcflash:{label}:{row[0]}:{digest}'
+
+
+def _relay_queryset():
+    return Relay.objects.filter(type='oc').filter(Q(transformer__isnull=False) | Q(line__isnull=False))
+
+
+def _build(transformer_rows, line_rows, relay_rows, options):
+    """Locations, relay rows by location and cache keys for evaluate()."""
+    locations = _concatenate(
+        _transformer_locations(transformer_rows, options['transformer_class']),
+        _line_locations(line_rows, options['line_class'], options['line_grounded']))
+    index = {('tra', row[0]): position for position, row in enumerate(transformer_rows)}
+    index.update({('line', row[0]): len(transformer_rows) + position for position, row in enumerate(line_rows)})
+
+    by_location = {}
+    for transformer_id, line_id, pk, *settings in relay_rows:
+        key = ('tra', transformer_id) if transformer_id is not None else ('line', line_id)
+        position = index.get(key)
+        if position is not None:
+            by_location.setdefault(position, []).append((pk, *settings))
+
+    evaluated = [(position, *settings) for position, relays in by_location.items() for _, *settings in relays]
+    cached = tuple(sorted(options.items()))
+    keys = [_cache_key('tra', row, by_location.get(position, ()), cached)
+            for position, row in enumerate(transformer_rows)]
+    keys += [_cache_key('line', row, by_location.get(len(transformer_rows) + position, ()), cached)
+             for position, row in enumerate(line_rows)]
+    return locations, evaluated, keys
+
+
+def _options(breaker_time=0.05, max_clearing_time=2.0, transformer_class=None, line_class='open_air',
+             line_grounded=True):
+    for equipment_class in (transformer_class, line_class):
+        if equipment_class is not None and equipment_class not in EQUIPMENT_CLASSES:
+            raise ValueError(f"Unknown equipment class '{equipment_class}'")
+    return {'breaker_time': breaker_time, 'max_clearing_time': max_clearing_time,
+            'transformer_class': transformer_class, 'line_class': line_class, 'line_grounded': line_grounded}
+
+
+def fleet_arc_flash(transformers=None, lines=None, cache=True, **options):
+    """
+    Arc-flash results of every transformer secondary and line in one pass.
+
+    Args:
+        transformers: Transformer queryset (default: all); None of either
+            argument means all rows, an empty queryset skips the table
+        lines: TransmissionLine queryset (default: all)
+        cache: store each equipment's result for arc_flash()
+        **options: breaker_time, max_clearing_time, transformer_class
+            (default: 'panel' up to 1 kV, 'switchgear' above), line_class
+            (default 'open_air') and line_grounded
+
+    Returns:
+        ArcFlashResult with transformers first, then lines
+    """
+    options = _options(**options)
+    transformers = Transformer.objects.all() if transformers is None else transformers
+    lines = TransmissionLine.objects.all() if lines is None else lines
+    transformer_rows = list(transformers.order_by('pk').values_list(*TRANSFORMER_FIELDS))
+    line_rows = list(lines.order_by('pk').values_list(*LINE_FIELDS))
+    relay_rows = list(_relay_queryset().values_list(*RELAY_FIELDS))
+
+    locations, relays, keys = _build(transformer_rows, line_rows, relay_rows, options)
+    result = ArcFlashResult(evaluate(locations, relays, options['breaker_time'], options['max_clearing_time']))
+    if cache:
+        calculation_cache.store_many(
+            (row, key, value) for (row, key), value in zip(keys, result.rows()))
+    return result
+
+
+def _instance_row(equipment, fields):
+    values = []
+    for field in fields:
+        if '__' in field:
+            relation, attribute = field.split('__')
+            related = getattr(equipment, relation)
+            values.append(None if related is None else getattr(related, attribute))
+        else:
+            values.append(getattr(equipment, field))
+    return tuple(values)
+
+
+def arc_flash(equipment, **options):
+    """
+    Arc-flash result of one Transformer (at its secondary bus) or
+    TransmissionLine, from the calculation cache when fleet_arc_flash() or
+    an earlier call computed it with the same inputs.
+
+    Returns:
+        Dictionary with the columns of ArcFlashResult
+    """
+    options = _options(**options)
+    is_transformer = isinstance(equipment, Transformer)
+    row = _instance_row(equipment, TRANSFORMER_FIELDS if is_transformer else LINE_FIELDS)
+    relay_rows = []
+    if equipment.pk is not None:
+        relays = _relay_queryset().filter(**{'transformer' if is_transformer else 'line': equipment})
+        relay_rows = list(relays.values_list(*RELAY_FIELDS))
+    transformer_rows, line_rows = ([row], []) if is_transformer else ([], [row])
+    locations, relays, keys = _build(transformer_rows, line_rows, relay_rows, options)
+    if equipment.pk is None:
+        return ArcFlashResult(evaluate(locations, relays, options['breaker_time'],
+                                       options['max_clearing_time'])).row(0)
+
+    (cache_row, key), = keys
+    value = calculation_cache.get_or_compute(cache_row, key, lambda: ArcFlashResult(
+        evaluate(locations, relays, options['breaker_time'], options['max_clearing_time'])).row(0))
+    return dict(value)
@@ -0,0 +1,449 @@
+"""
+Overcurrent relay curve registry and vectorized curve evaluation.
+
+All supported IEC and IEEE inverse-time curves share the form
+
+    t = TDS × (k / (M^alpha - 1) + B)
+
+where M is the fault current in per unit of the relay's current setting
+(B is zero for the IEC curves).  IEEE curves also define a reset time
+
+    t_r = TDS × tr / (1 - M^2)        for M < 1
+
+Curve definitions live in a registry keyed by (standard, curve_type).  The
+standard curves are built once at import; user-defined curves are read from
+the ``CustomCurve`` table on first use and cached.  The table is small, so
+lookups re-read it at most once per ``CurveRegistry.interval`` seconds and
+rebuild the cache when the rows differ, which picks up curves saved by other
+processes (web workers, calculation pool workers) as well.
+Curves that don't follow the formula above can be registered in code from a
+function of M.  Both ``Relay.calculate_trip_time`` and the batch functions
+below look curves up here.
+
+The inverse problems (TDS or pickup for a target trip time) have closed
+forms for the standard formula and fall back to a vectorized bisection for
+function curves.
+"""
+import hashlib
+import threading
+import time
+
+import numpy as np
+from django.db import DatabaseError
+
+from protectioncalculator.instrumentation import instrumented
+
+
+class CurveDefinition:
+    """
+    A single inverse-time curve with its coefficients.
+
+    ``trip_time`` and ``reset_time`` are compiled for the coefficients when
+    the definition is created, so evaluating a curve does no dispatch.
+
+    Instead of coefficients, ``function`` may give the trip time at TDS 1 as
+    a vectorized function of the current in per unit; k, alpha and b are
+    then NaN.
+    """
+
+    __slots__ = ('standard', 'name', 'k', 'alpha', 'b', 'reset', 'function', 'trip_time', 'reset_time')
+
+    def __init__(self, standard, name, k=np.nan, alpha=np.nan, b=0.0, reset=None, function=None):
+        self.standard = standard
+        self.name = name
+        self.function = function
+        if function is not None:
+            k = alpha = b = np.nan
+        self.k = float(k)
+        self.alpha = float(alpha)
+        self.b = float(b)
+        self.reset = None if reset is None else float(reset)
+        if function is not None:
+            self.trip_time = lambda tds, m: tds * function(m)
+        else:
+            self.trip_time = _compile_trip_time(self.k, self.alpha, self.b)
+        self.reset_time = _compile_reset_time(self.reset)
+
+    def __repr__(self):
+        if self.function is not None:
+            return f'CurveDefinition({self.standard!r}, {self.name!r}, function={self.function!r})'
+        return (f'CurveDefinition({self.standard!r}, {self.name!r}, k={self.k}, '
+                f'alpha={self.alpha}, b={self.b}, reset={self.reset})')
+
+    @property
+    def key(self):
+        return (self.standard, self.name)
+
+    def required_tds(self, current_in_pu, trip_time):
+        """
+        TDS giving trip_time at current_in_pu (NaN where the curve doesn't trip).
+
+        Trip time is proportional to TDS, so this is exact for every curve.
+        """
+        current_in_pu = np.asarray(current_in_pu, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tds = trip_time / self.trip_time(1.0, current_in_pu)
+        return np.where(current_in_pu > 1, tds, np.nan)
+
+    def required_multiple(self, tds, trip_time, max_multiple=1e4):
+        """
+        Current in per unit of pickup at which the curve reaches trip_time.
+
+        Closed form for the standard formula,
+
+            M = (k / (t / TDS - B) + 1) ^ (1 / alpha)
+
+        and bisection for function curves.  NaN where no multiple between 1
+        and max_multiple gives the target (e.g. a time below the B × TDS
+        asymptote).
+        """
+        tds, trip_time = np.broadcast_arrays(np.asarray(tds, dtype=float),
+                                             np.asarray(trip_time, dtype=float))
+        if self.function is not None:
+            return invert_decreasing(lambda m: tds * self.function(m), trip_time,
+                                     1.0, max_multiple)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base = self.k / (trip_time / tds - self.b) + 1
+            multiple = np.where(base > 1, base, np.nan) ** (1 / self.alpha)
+        return np.where(multiple <= max_multiple, multiple, np.nan)
+
+
+def _compile_trip_time(k, alpha, b):
+    """
+    Build a trip time function t(tds, current_in_pu) for fixed coefficients.
+
+    Works on floats and NumPy arrays alike.
+    """
+    if alpha == 1:
+        if b == 0:
+            return lambda tds, m: tds * (k / (m - 1))
+        return lambda tds, m: tds * (k / (m - 1) + b)
+    if b == 0:
+        return lambda tds, m: tds * (k / ((m ** alpha) - 1))
+    return lambda tds, m: tds * (k / ((m ** alpha) - 1) + b)
+
+
+def _compile_reset_time(reset):
+    """Build a reset time function t_r(tds, current_in_pu), or None."""
+    if reset is None:
+        return None
+    return lambda tds, m: tds * (reset / (1 - m ** 2))
+
+
+def invert_decreasing(function, targets, low, high, iterations=60):
+    """
+    Solve function(x) = target for a decreasing function, elementwise.
+
+    Bisects on log(x - low) so the search resolves the steep region near
+    ``low`` as well as the flat tail.  ``function`` is called with an array
+    shaped like ``targets``.  NaN where the target lies outside
+    (function(high), function(low)).
+
+    Args:
+        low: lower bound of x (exclusive)
+        high: upper bound of x
+    """
+    targets = np.asarray(targets, dtype=float)
+    lower = np.full(targets.shape, np.log(1e-9))
+    upper = np.full(targets.shape, np.log(high - low))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        valid = (function(low + np.exp(upper)) <= targets) & (function(low + np.exp(lower)) >= targets)
+        for _ in range(iterations):
+            middle = (lower + upper) / 2
+            above = function(low + np.exp(middle)) > targets
+            lower = np.where(above, middle, lower)
+            upper = np.where(above, upper, middle)
+
+    return np.where(valid, low + np.exp((lower + upper) / 2), np.nan)
+
+
+# Standard curves (standard, curve_type, k, alpha, B, tr)
+BUILTIN_CURVES = (
+    CurveDefinition('iec', 'standard_inverse', 0.14, 0.02),
+    CurveDefinition('iec', 'very_inverse', 13.5, 1),
+    CurveDefinition('iec', 'extremely_inverse', 80, 2),
+    CurveDefinition('iec', 'long_time_standard_inverse', 120, 1),
+    CurveDefinition('ieee', 'moderately_inverse', 0.0515, 0.02, 0.114, 4.85),
+    CurveDefinition('ieee', 'very_inverse', 19.61, 2, 0.491, 21.6),
+    CurveDefinition('ieee', 'extremely_inverse', 28.2, 2, 0.1217, 29.1),
+)
+
+
+class CurveRegistry:
+    """
+    Lookup table of curve definitions keyed by (standard, curve_type).
+
+    Rows in the ``CustomCurve`` table are merged over the built-in curves the
+    first time a lookup needs them, so a custom row can also override a
+    standard curve.  Lookups re-read the rows when the last read is more
+    than ``interval`` seconds old and rebuild the merged table if they
+    changed.  ``invalidate()`` forces a re-read on the next lookup; it is
+    called from the CustomCurve save/delete signals.
+
+    Args:
+        builtin: built-in CurveDefinitions
+        interval: seconds between checks of the CustomCurve table
+    """
+
+    def __init__(self, builtin, interval=2.0):
+        self._builtin = {curve.key: curve for curve in builtin}
+        self.interval = interval
+        self._curves = None
+        self._rows = None
+        self._registered = 0
+        self._version = None
+        # time.monotonic() of the last read of the CustomCurve table
+        self._checked = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """
+        Digest of the curve table, the same in every process with the same
+        CustomCurve rows, so caches shared between processes can key on it.
+        """
+        self._current()
+        return self._version
+
+    def get(self, standard, name):
+        """Return the CurveDefinition for (standard, name), or None."""
+        return self._current().get((standard, name))
+
+    def all(self):
+        """Return every known curve definition."""
+        return list(self._current().values())
+
+    def register(self, curve):
+        """Add or replace a curve defined in code (e.g. a function curve)."""
+        with self._lock:
+            self._builtin[curve.key] = curve
+            self._registered += 1
+            self._curves = None
+        self.invalidate()
+
+    def invalidate(self):
+        self._checked = None
+
+    def merged(self, rows):
+        """
+        Built-in and registered curves merged with CustomCurve rows given as
+        (standard, name, k, alpha, b, reset) tuples.
+        """
+        curves = dict(self._builtin)
+        for row in rows:
+            curve = CurveDefinition(*row)
+            curves[curve.key] = curve
+        return curves
+
+    def _current(self):
+        checked = self._checked
+        curves = self._curves
+        if curves is None or checked is None or time.monotonic() - checked >= self.interval:
+            curves = self._load()
+        return curves
+
+    def _load(self):
+        from .models import CustomCurve
+
+        try:
+            rows = list(CustomCurve.objects.order_by('standard', 'name').values_list(
+                'standard', 'name', 'k', 'alpha', 'b', 'reset'))
+        except DatabaseError:
+            # Table not migrated yet; serve the built-in curves without
+            # caching so custom curves show up once it exists.
+            with self._lock:
+                self._version = f'builtin-{self._registered}'
+            return dict(self._builtin)
+        with self._lock:
+            if self._curves is None or rows != self._rows:
+                self._curves = self.merged(rows)
+                self._rows = rows
+                digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+                self._version = f'{digest}-{self._registered}'
+            self._checked = time.monotonic()
+            return self._curves
+
+
+registry = CurveRegistry(BUILTIN_CURVES)
+
+
+def get_curve(standard, curve_type):
+    """Return the CurveDefinition for a relay's standard and curve type, or None."""
+    return registry.get(standard, curve_type)
+
+
+class RelayCurveSet:
+    """
+    Per-relay curve parameters packed into NumPy arrays.
+
+    Build it once for a set of relays and reuse it for as many current
+    sweeps as needed; the registry lookup only happens here.
+
+    Relays that cannot trip (not overcurrent, missing settings or an unknown
+    curve) get NaN parameters, so every trip time computed for them is NaN.
+    """
+
+    def __init__(self, relays):
+        relays = list(relays)
+        count = len(relays)
+        self.k = np.full(count, np.nan)
+        self.alpha = np.full(count, np.nan)
+        self.b = np.full(count, np.nan)
+        self.tds = np.full(count, np.nan)
+        self.pickup = np.full(count, np.nan)
+        # Relays on function curves, evaluated separately: index -> curve
+        self.function_curves = {}
+
+        for index, relay in enumerate(relays):
+            if (relay.type != 'oc' or relay.tds is None
+                    or relay.current_setting is None):
+                continue
+            curve = get_curve(relay.standard, relay.curve_type)
+            if curve is None:
+                continue
+            self.k[index] = curve.k
+            self.alpha[index] = curve.alpha
+            self.b[index] = curve.b
+            self.tds[index] = relay.tds
+            self.pickup[index] = relay.current_setting
+            if curve.function is not None:
+                self.function_curves[index] = curve
+
+    def __len__(self):
+        return len(self.tds)
+
+    @instrumented('RelayCurveSet.trip_times')
+    def trip_times(self, currents):
+        """
+        Calculate trip times for every relay against every fault current.
+
+        Args:
+            currents: scalar or 1-D sequence of fault currents in amperes
+
+        Returns:
+            Array of shape (relays, currents) with trip times in seconds.
+            NaN marks combinations that do not trip (current at or below
+            pickup, or a relay without a valid overcurrent curve).
+        """
+        currents = np.atleast_1d(np.asarray(currents, dtype=float))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_in_pu = currents[np.newaxis, :] / self.pickup[:, np.newaxis]
+        times = standard_trip_times(self.tds[:, np.newaxis], current_in_pu, self.k[:, np.newaxis],
+                                    self.alpha[:, np.newaxis], self.b[:, np.newaxis])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for index, curve in self.function_curves.items():
+                times[index] = np.where(current_in_pu[index] > 1,
+                                        curve.trip_time(self.tds[index], current_in_pu[index]), np.nan)
+        return times
+
+
+def standard_trip_times(tds, current_in_pu, k, alpha, b):
+    """
+    Trip times of the standard formula for arrays of settings and currents.
+
+    All arguments broadcast against each other, so every element can have
+    its own curve coefficients (e.g. samples × relays matrices).
+
+    Returns:
+        Float array of trip times in seconds; NaN where the current is at or
+        below pickup or a coefficient is NaN
+    """
+    current_in_pu = np.asarray(current_in_pu, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        times = tds * (k / (current_in_pu ** alpha - 1) + b)
+    # No trip if current is less than or equal to the pickup current
+    return np.where(current_in_pu > 1, times, np.nan)
+
+
+def trip_times(relays, currents):
+    """
+    Calculate a relays × currents matrix of trip times.
+
+    Batch counterpart of ``Relay.calculate_trip_time``: entry [i, j] equals
+    ``relays[i].calculate_trip_time(currents[j])``, with NaN in place of None.
+
+    Args:
+        relays: iterable of Relay instances, or a prebuilt RelayCurveSet
+        currents: scalar or 1-D sequence of fault currents in amperes
+
+    Returns:
+        2-D float array of trip times in seconds
+    """
+    if not isinstance(relays, RelayCurveSet):
+        relays = RelayCurveSet(relays)
+    return relays.trip_times(currents)
+
+
+def _curves_for_rows(curves, count):
+    """Expand a curve argument to one CurveDefinition (or None) per row."""
+    if isinstance(curves, CurveDefinition):
+        return [curves] * count
+    rows = []
+    for curve in curves:
+        if isinstance(curve, CurveDefinition) or curve is None:
+            rows.append(curve)
+        else:
+            rows.append(get_curve(*curve))
+    if len(rows) != count:
+        raise ValueError('One curve per row is required')
+    return rows
+
+
+def _solve_by_curve(curves, count, solve):
+    """Run solve(curve, row_indices) for each distinct curve of the rows."""
+    result = np.full(count, np.nan)
+    groups = {}
+    for index, curve in enumerate(_curves_for_rows(curves, count)):
+        if curve is not None:
+            groups.setdefault(id(curve), (curve, []))[1].append(index)
+    for curve, indices in groups.values():
+        indices = np.array(indices)
+        result[indices] = solve(curve, indices)
+    return result
+
+
+def required_tds(curves, fault_currents, pickups, trip_times):
+    """
+    TDS needed to trip in a target time, for a whole sheet of settings.
+
+    Args:
+        curves: a CurveDefinition for every row, or a sequence with one
+            CurveDefinition or (standard, curve_type) per row
+        fault_currents: fault current of each row in amperes
+        pickups: current setting of each row in amperes
+        trip_times: target trip time of each row in seconds
+
+    Returns:
+        Array of TDS values; NaN where the target can't be met (fault
+        current at or below pickup, or unknown curve)
+    """
+    fault_currents, pickups, trip_times = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(values, dtype=float)) for values in (fault_currents, pickups, trip_times)))
+    current_in_pu = fault_currents / pickups
+    return _solve_by_curve(
+        curves, fault_currents.size,
+        lambda curve, rows: curve.required_tds(current_in_pu[rows], trip_times[rows]))
+
+
+def required_pickups(curves, fault_currents, tds, trip_times, max_multiple=1e4):
+    """
+    Current setting needed to trip in a target time at a fault current.
+
+    Args:
+        curves: as for required_tds
+        fault_currents: fault current of each row in amperes
+        tds: time dial setting of each row
+        trip_times: target trip time of each row in seconds
+
+    Returns:
+        Array of pickup currents in amperes; NaN where no pickup below the
+        fault current gives the target
+    """
+    fault_currents, tds, trip_times = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(values, dtype=float)) for values in (fault_currents, tds, trip_times)))
+    return _solve_by_curve(
+        curves, fault_currents.size,
+        lambda curve, rows: fault_currents[rows] / curve.required_multiple(
+            tds[rows], trip_times[rows], max_multiple))
@@ -0,0 +1,418 @@
+"""
+Transformer differential (87T) and restricted earth fault (64) settings.
+
+Differential settings are in per-unit of the transformer's rated current.
+The relay matches both CT secondaries to the rated currents at the nominal
+tap, so an external fault produces a differential current from:
+
+    tap position:  I1 = I / (1 + t)       (t = tap / 100)
+    CT errors:     I1 × (1 + e), I2 × (1 - e), worst case in opposite directions
+
+with bias (restraint) current (|I1| + |I2|) / 2.  The dual-slope
+characteristic operates when
+
+    Idiff > max(Is1, k1 × Ibias)                          for Ibias ≤ Is2
+    Idiff > max(Is1, k1 × Is2) + k2 × (Ibias - Is2)       for Ibias > Is2
+
+Restricted earth fault uses the high-impedance principle: the relay must not
+operate when one CT saturates completely for the largest through fault,
+
+    Vs = If / N × (Rct + 2 × Rlead)
+
+and the stabilising resistor is Vs / Is for relay current setting Is.
+"""
+import math
+import re
+
+import numpy as np
+
+
+STANDARD_CT_PRIMARIES = (
+    50, 75, 100, 150, 200, 250, 300, 400, 500, 600, 800, 1000, 1200, 1500,
+    1600, 2000, 2500, 3000, 4000, 5000, 6000,
+)
+
+_VECTOR_GROUP = re.compile(r'^(YN|Y|D|ZN|Z)(yn|y|d|zn|z)(\d{1,2})$')
+
+
+def parse_vector_group(vector_group):
+    """
+    Split a vector group into its windings and phase shift.
+
+    Returns:
+        (primary winding, secondary winding, clock number), e.g.
+        ('D', 'yn', 11) for 'Dyn11'
+    """
+    match = _VECTOR_GROUP.match(vector_group or '')
+    if match is None or int(match.group(3)) > 11:
+        raise ValueError(f"Invalid vector group '{vector_group}'")
+    return match.group(1), match.group(2), int(match.group(3))
+
+
+def _earthed(winding):
+    return winding.lower() in ('yn', 'zn')
+
+
+def select_ct_primary(full_load_current):
+    """Smallest standard CT primary rating at or above the full load current."""
+    for rating in STANDARD_CT_PRIMARIES:
+        if rating >= full_load_current:
+            return rating
+    return math.ceil(full_load_current / 1000) * 1000
+
+
+def _through_fault(transformer):
+    """Largest through fault the transformer impedance allows, in per-unit."""
+    impedance = transformer.impedance
+    if impedance is None or not impedance > 0:
+        raise ValueError(f'{transformer}: impedance must be greater than zero, not {impedance}')
+    return 100 / impedance
+
+
+def _round_up(value, step):
+    return round(math.ceil(round(value / step, 9)) * step, 9)
+
+
+class DifferentialSettings:
+    """
+    Biased differential settings of one transformer.
+
+    Currents are in per-unit of the transformer's rated current.
+    """
+
+    def __init__(self, transformer, ct_primary, ct_secondary, matching_factors, pickup, slope1,
+                 knee, slope2, unrestrained, second_harmonic, fifth_harmonic, phase_shift,
+                 zero_sequence_filter, tap_range, ct_error):
+        self.transformer = transformer
+        self.ct_primary = ct_primary
+        self.ct_secondary = ct_secondary
+        self.matching_factors = matching_factors
+        self.pickup = pickup
+        self.slope1 = slope1
+        self.knee = knee
+        self.slope2 = slope2
+        self.unrestrained = unrestrained
+        self.second_harmonic = second_harmonic
+        self.fifth_harmonic = fifth_harmonic
+        self.phase_shift = phase_shift
+        self.zero_sequence_filter = zero_sequence_filter
+        self.tap_range = tap_range
+        self.ct_error = ct_error
+
+    def __repr__(self):
+        return (f'DifferentialSettings({self.transformer}: Is1={self.pickup:g}, k1={self.slope1:g}, '
+                f'Is2={self.knee:g}, k2={self.slope2:g})')
+
+    def threshold(self, bias):
+        """Operating differential current for bias currents (array or scalar)."""
+        return operate_threshold(bias, self.pickup, self.slope1, self.knee, self.slope2)
+
+    def as_dict(self):
+        return {
+            'transformer': str(self.transformer),
+            'ct_primary': list(self.ct_primary),
+            'ct_secondary': self.ct_secondary,
+            'matching_factors': list(self.matching_factors),
+            'pickup': self.pickup,
+            'slope1': self.slope1,
+            'knee': self.knee,
+            'slope2': self.slope2,
+            'unrestrained': self.unrestrained,
+            'second_harmonic': self.second_harmonic,
+            'fifth_harmonic': self.fifth_harmonic,
+            'phase_shift': self.phase_shift,
+            'zero_sequence_filter': self.zero_sequence_filter,
+        }
+
+
+def operate_threshold(bias, pickup, slope1, knee, slope2):
+    """Dual-slope operating characteristic; broadcasts over all arguments."""
+    bias = np.asarray(bias, dtype=float)
+    first = np.maximum(pickup, slope1 * bias)
+    second = np.maximum(pickup, slope1 * knee) + slope2 * (bias - knee)
+    return np.where(bias <= knee, first, second)
+
+
+def differential_settings(transformer, ct_primary=None, ct_secondary=1, ct_error=0.05,
+                          relay_error=0.05, margin=0.05, minimum_pickup=0.2, knee=2.0,
+                          slope2=0.7, inrush_multiple=8.0):
+    """
+    Differential settings for a transformer.
+
+    Args:
+        transformer: protected Transformer
+        ct_primary: (primary side, secondary side) CT primary ratings in
+            amperes; standard ratings above the full load currents by default
+        ct_secondary: CT secondary rating (1 or 5 A)
+        ct_error: CT composite error at rated accuracy, per CT
+        relay_error: relay measuring error
+        margin: safety margin added to slope 1
+        minimum_pickup: lowest basic setting Is1 in per-unit
+        knee: bias current Is2 where slope 2 starts, per-unit
+        slope2: slope above the knee, covering CT saturation
+        inrush_multiple: magnetising inrush in per-unit; the unrestrained
+            element is set above it and above the largest through fault
+
+    Returns:
+        DifferentialSettings
+    """
+    through_fault = _through_fault(transformer)
+    full_load_current = transformer.calculate_full_load_current()
+    rated = (full_load_current['primary'], full_load_current['secondary'])
+    if ct_primary is None:
+        ct_primary = tuple(select_ct_primary(current) for current in rated)
+    matching_factors = tuple(ct / current for ct, current in zip(ct_primary, rated))
+
+    primary_winding, secondary_winding, clock = parse_vector_group(transformer.vector_group)
+    tap_range = max(abs(transformer.tap_min), abs(transformer.tap_max)) / 100
+
+    # Slope 1 covers the tap range, both CT errors and the relay error
+    slope1 = max(0.2, _round_up(tap_range + 2 * ct_error + relay_error + margin, 0.05))
+    # Is1 also covers the mismatch at full load and the magnetising current
+    pickup = max(minimum_pickup, _round_up(tap_range + 2 * ct_error + margin, 0.05))
+    unrestrained = float(math.ceil(max(inrush_multiple, through_fault)))
+
+    return DifferentialSettings(
+        transformer, tuple(ct_primary), ct_secondary, matching_factors, pickup, slope1, knee,
+        slope2, unrestrained, second_harmonic=0.15, fifth_harmonic=0.35,
+        phase_shift=clock * 30,
+        zero_sequence_filter=_earthed(primary_winding) or _earthed(secondary_winding),
+        tap_range=(transformer.tap_min, transformer.tap_max), ct_error=ct_error)
+
+
+# Through-fault stability ---------------------------------------------------
+
+class StabilityResult:
+    """
+    Margins over a grid of through-fault currents × tap positions.
+
+    ``margin`` has shape (transformers, currents, taps) and is the operating
+    threshold minus the differential current in per-unit; the relay is
+    stable where it is positive.
+    """
+
+    def __init__(self, settings, currents, taps, differential, bias, margin):
+        self.settings = settings
+        self.currents = currents
+        self.taps = taps
+        self.differential = differential
+        self.bias = bias
+        self.margin = margin
+
+    @property
+    def stable(self):
+        """Whether each transformer is stable over the whole grid."""
+        return (self.margin > 0).all(axis=(1, 2))
+
+    def worst_points(self):
+        """(through current, tap, margin) with the smallest margin, per transformer."""
+        points = []
+        for index in range(len(self.settings)):
+            current, tap = np.unravel_index(np.argmin(self.margin[index]), self.margin[index].shape)
+            points.append((float(self.currents[current]), float(self.taps[index, tap]),
+                           float(self.margin[index, current, tap])))
+        return points
+
+    def rows(self):
+        return [
+            {
+                'transformer': str(setting.transformer),
+                'stable': bool(stable),
+                'worst_through_current': current,
+                'worst_tap': tap,
+                'minimum_margin': margin,
+            }
+            for setting, stable, (current, tap, margin) in zip(self.settings, self.stable, self.worst_points())
+        ]
+
+
+def through_fault_stability(settings, currents=None, tap_points=41, accuracy_limit_factor=20):
+    """
+    Check many transformers for stability on external faults.
+
+    Every through-fault current is combined with every tap position in the
+    transformer's tap range, with the CT errors acting in opposite
+    directions.  Above the CT accuracy limit the error grows in proportion
+    to the current, a simple allowance for saturation.
+
+    Args:
+        settings: list of DifferentialSettings
+        currents: through-fault currents in per-unit (default 0.1 to the
+            largest through fault, log-spaced)
+        tap_points: tap positions per transformer, evenly spread over the
+            tap range
+        accuracy_limit_factor: CT accuracy limit as a multiple of the CT
+            primary rating
+
+    Returns:
+        StabilityResult
+    """
+    settings = list(settings)
+    if currents is None:
+        largest = max(_through_fault(setting.transformer) for setting in settings)
+        currents = np.geomspace(0.1, largest, 200)
+    currents = np.asarray(currents, dtype=float)
+
+    def column(values):
+        return np.array(values, dtype=float)[:, None, None]
+
+    # Shapes: transformers (N, 1, 1), currents (1, F, 1), taps (N, 1, T)
+    tap_low = np.array([setting.tap_range[0] for setting in settings], dtype=float)
+    tap_high = np.array([setting.tap_range[1] for setting in settings], dtype=float)
+    taps = np.linspace(tap_low, tap_high, tap_points, axis=1)
+    t = taps[:, None, :] / 100
+    current = currents[None, :, None]
+
+    ct_error = column([setting.ct_error for setting in settings])
+    # Accuracy limit of each CT in per-unit of rated current
+    limit_primary = column([accuracy_limit_factor * setting.matching_factors[0] for setting in settings])
+    limit_secondary = column([accuracy_limit_factor * setting.matching_factors[1] for setting in settings])
+
+    primary = current / (1 + t)
+    # Saturation only ever reduces the measured current
+    low_primary = primary * (1 - np.minimum(ct_error * np.maximum(1, primary / limit_primary), 1))
+    low_secondary = current * (1 - np.minimum(ct_error * np.maximum(1, current / limit_secondary), 1))
+    pickup = column([setting.pickup for setting in settings])
+    slope1 = column([setting.slope1 for setting in settings])
+    knee = column([setting.knee for setting in settings])
+    slope2 = column([setting.slope2 for setting in settings])
+    unrestrained = column([setting.unrestrained for setting in settings])
+
+    # Either CT may read high while the other reads low; keep the worse case
+    margin = differential = bias = None
+    for measured_primary, measured_secondary in ((primary * (1 + ct_error), low_secondary),
+                                                 (low_primary, current * (1 + ct_error))):
+        case_differential = np.abs(measured_primary - measured_secondary)
+        case_bias = (measured_primary + measured_secondary) / 2
+        # The unrestrained element trips regardless of bias
+        threshold = np.minimum(operate_threshold(case_bias, pickup, slope1, knee, slope2), unrestrained)
+        case_margin = threshold - case_differential
+        if margin is None:
+            margin, differential, bias = case_margin, case_differential, case_bias
+        else:
+            worse = case_margin < margin
+            margin = np.where(worse, case_margin, margin)
+            differential = np.where(worse, case_differential, differential)
+            bias = np.where(worse, case_bias, bias)
+    return StabilityResult(settings, currents, taps, differential, bias, margin)
+
+
+# Restricted earth fault ----------------------------------------------------
+
+class RefSettings:
+    """High-impedance restricted earth fault settings of one winding."""
+
+    def __init__(self, transformer, side, ct_primary, ct_secondary, setting_voltage, relay_current,
+                 stabilising_resistor, knee_point_required, primary_operating_current, sensitivity,
+                 peak_voltage, metrosil_required):
+        self.transformer = transformer
+        self.side = side
+        self.ct_primary = ct_primary
+        self.ct_secondary = ct_secondary
+        self.setting_voltage = setting_voltage
+        self.relay_current = relay_current
+        self.stabilising_resistor = stabilising_resistor
+        self.knee_point_required = knee_point_required
+        self.primary_operating_current = primary_operating_current
+        self.sensitivity = sensitivity
+        self.peak_voltage = peak_voltage
+        self.metrosil_required = metrosil_required
+
+    def __repr__(self):
+        return (f'RefSettings({self.transformer} {self.side}: Vs={self.setting_voltage:g} V, '
+                f'Rs={self.stabilising_resistor:g} ohm)')
+
+    def as_dict(self):
+        return {
+            'transformer': str(self.transformer),
+            'side': self.side,
+            'ct_primary': self.ct_primary,
+            'ct_secondary': self.ct_secondary,
+            'setting_voltage': self.setting_voltage,
+            'relay_current': self.relay_current,
+            'stabilising_resistor': self.stabilising_resistor,
+            'knee_point_required': self.knee_point_required,
+            'primary_operating_current': self.primary_operating_current,
+            'sensitivity': self.sensitivity,
+            'peak_voltage': self.peak_voltage,
+            'metrosil_required': self.metrosil_required,
+        }
+
+
+def ref_settings(transformer, side=None, ct_primary=None, ct_secondary=1, ct_resistance=2.0,
+                 lead_resistance=0.5, relay_current=0.1, magnetizing_current=0.0, ct_count=4,
+                 knee_point_voltage=None):
+    """
+    High-impedance REF settings for the earthed star winding of a transformer.
+
+    The largest through fault is taken as the larger of the winding's
+    three-phase and line-to-ground fault currents; the earth fault exceeds
+    the three-phase fault when the zero-sequence impedance is below the
+    positive-sequence impedance.
+
+    Args:
+        side: 'primary' or 'secondary'; defaults to the earthed winding
+        ct_resistance: CT secondary winding resistance in ohms
+        lead_resistance: one-way lead resistance in ohms
+        relay_current: relay current setting Is in amperes
+        magnetizing_current: CT magnetising current at the setting voltage
+        ct_count: CTs in parallel (three phases and the neutral)
+        knee_point_voltage: CT knee point voltage, used for the internal
+            fault peak voltage (defaults to twice the setting voltage)
+
+    Returns:
+        RefSettings
+    """
+    primary_winding, secondary_winding, _ = parse_vector_group(transformer.vector_group)
+    earthed = {'primary': _earthed(primary_winding), 'secondary': _earthed(secondary_winding)}
+    if side is None:
+        side = 'secondary' if earthed['secondary'] else 'primary'
+    if not earthed[side]:
+        raise ValueError(f'{transformer}: the {side} winding ({transformer.vector_group}) is not earthed, REF does not apply')
+    # Rejects a zero or missing impedance before the fault calculation
+    _through_fault(transformer)
+
+    full_load_current = transformer.calculate_full_load_current()[side]
+    faults = transformer.calculate_sequence_fault_currents(side)
+    # Single-phase transformers only have the line-to-ground value
+    fault_current = max(faults[fault] for fault in ('three_phase', 'line_to_ground') if faults[fault] is not None)
+    if ct_primary is None:
+        ct_primary = select_ct_primary(full_load_current)
+    ratio = ct_primary / ct_secondary
+
+    # Formula: Vs = If / N × (Rct + 2 × Rl)
+    setting_voltage = _round_up(fault_current / ratio * (ct_resistance + 2 * lead_resistance), 5)
+    stabilising_resistor = setting_voltage / relay_current
+    # Formula: Iop = N × (Is + n × Ie)
+    primary_operating_current = ratio * (relay_current + ct_count * magnetizing_current)
+
+    if knee_point_voltage is None:
+        knee_point_voltage = 2 * setting_voltage
+    # Peak voltage across the relay for the largest internal fault:
+    # Vp = 2 × √(2 × Vk × (Vf - Vk))
+    prospective = fault_current / ratio * (stabilising_resistor + ct_resistance + 2 * lead_resistance)
+    peak_voltage = 2 * math.sqrt(2 * knee_point_voltage * max(prospective - knee_point_voltage, 0))
+
+    return RefSettings(
+        transformer, side, ct_primary, ct_secondary, setting_voltage, relay_current,
+        stabilising_resistor, knee_point_required=2 * setting_voltage,
+        primary_operating_current=primary_operating_current,
+        sensitivity=primary_operating_current / full_load_current,
+        peak_voltage=peak_voltage, metrosil_required=peak_voltage > 3000)
+
+
+def relay_settings(relay, transformer=None, **kwargs):
+    """
+    Differential or REF settings for a 'diff' or 'ref' relay.
+
+    The transformer defaults to the one linked to the relay.
+    """
+    if transformer is None:
+        transformer = relay.transformer
+    if transformer is None:
+        raise ValueError(f'{relay}: no protected transformer')
+    if relay.type == 'diff':
+        return differential_settings(transformer, **kwargs)
+    if relay.type == 'ref':
+        return ref_settings(transformer, **kwargs)
+    raise ValueError(f"{relay}: relay type '{relay.type}' is not differential or REF")
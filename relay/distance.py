@@ -0,0 +1,311 @@
+"""
+Distance protection (21) zone reaches and coverage checks.
+
+Reaches follow the usual stepped-distance rules, in primary ohms:
+
+    Zone 1: 80 % of the protected line, instantaneous
+    Zone 2: the protected line plus 50 % of the shortest adjacent line,
+            and at least 120 % of the protected line
+    Zone 3: 120 % of the protected line plus the longest adjacent line
+
+Adjacent lines are the lines connected to the remote bus (``to_bus``) of the
+protected line.
+
+Coverage is checked by sweeping fault points: a fault at fraction p of a line
+through fault resistance Rf appears to the relay as
+
+    Z = p × Z_line + Rf
+
+(single-end infeed).  Faults on adjacent lines add the whole protected line.
+All points of all lines are evaluated at once as complex NumPy arrays.
+"""
+import cmath
+import math
+
+import numpy as np
+
+
+ZONE1_REACH = 0.8
+ZONE2_MIN_REACH = 1.2
+ZONE2_NEXT_REACH = 0.5
+ZONE3_REACH = 1.2
+
+ZONE_TIMES = (0.0, 0.4, 1.0)
+
+# Angle used for lines without r_per_km/x_per_km
+DEFAULT_LINE_ANGLE = 80.0
+
+
+def line_impedance(line, default_angle=DEFAULT_LINE_ANGLE):
+    """
+    Complex impedance of a line in primary ohms.
+
+    Uses the line parameters when they are set, otherwise the percentage
+    impedance at default_angle degrees.
+    """
+    impedance = line.calculate_impedance_from_parameters()
+    if impedance['magnitude'] == 0:
+        return cmath.rect(line.calculate_impedance_ohms(), math.radians(default_angle))
+    return cmath.rect(impedance['magnitude'], math.radians(impedance['angle']))
+
+
+def adjacent_lines(lines, candidates=None):
+    """
+    Lines leaving the remote bus of each line.
+
+    Args:
+        lines: protected TransmissionLine instances
+        candidates: lines to search (defaults to every line in the database)
+
+    Returns:
+        Dictionary of line pk to a list of adjacent lines
+    """
+    if candidates is None:
+        from substation_equipment.models import TransmissionLine
+        candidates = TransmissionLine.objects.exclude(from_bus=None, to_bus=None)
+
+    by_bus = {}
+    for candidate in candidates:
+        for bus_id in {candidate.from_bus_id, candidate.to_bus_id} - {None}:
+            by_bus.setdefault(bus_id, []).append(candidate)
+
+    return {
+        line.pk: [other for other in by_bus.get(line.to_bus_id, []) if other.pk != line.pk]
+        for line in lines
+    }
+
+
+class DistanceSettings:
+    """
+    Zone reaches of one distance relay.
+
+    Reaches are complex impedances in primary ohms along the line angle.
+    ``resistive_reach`` is the right blinder of the quadrilateral
+    characteristic.
+    """
+
+    def __init__(self, line, line_impedance, zone1, zone2, zone3, resistive_reach, times=ZONE_TIMES):
+        self.line = line
+        self.line_impedance = line_impedance
+        self.zone1 = zone1
+        self.zone2 = zone2
+        self.zone3 = zone3
+        self.resistive_reach = resistive_reach
+        self.times = times
+
+    def __repr__(self):
+        return f'DistanceSettings({self.line}: {abs(self.zone1):.3g}/{abs(self.zone2):.3g}/{abs(self.zone3):.3g} ohm)'
+
+    @property
+    def reaches(self):
+        return (self.zone1, self.zone2, self.zone3)
+
+    def to_secondary(self, ct_ratio, vt_ratio):
+        """Settings in secondary ohms: Z_sec = Z_pri × CT ratio / VT ratio."""
+        factor = ct_ratio / vt_ratio
+        return DistanceSettings(
+            self.line, self.line_impedance * factor, self.zone1 * factor, self.zone2 * factor,
+            self.zone3 * factor, self.resistive_reach * factor, self.times)
+
+    def as_dict(self):
+        result = {
+            'line': str(self.line),
+            'line_impedance': _polar(self.line_impedance),
+            'resistive_reach': self.resistive_reach,
+        }
+        for number, (reach, time) in enumerate(zip(self.reaches, self.times), start=1):
+            result[f'zone{number}'] = dict(_polar(reach), time=time)
+        return result
+
+
+def _polar(value):
+    return {'magnitude': abs(value), 'angle': math.degrees(cmath.phase(value))}
+
+
+def zone_reaches(line, adjacent=(), resistive_reach=None, default_angle=DEFAULT_LINE_ANGLE):
+    """
+    Zone 1/2/3 reaches for the relay at the sending end of a line.
+
+    Args:
+        line: protected TransmissionLine
+        adjacent: lines leaving the remote bus
+        resistive_reach: quadrilateral resistive reach in ohms (defaults to
+            the zone 3 reach magnitude)
+
+    Returns:
+        DistanceSettings
+    """
+    z_line = line_impedance(line, default_angle)
+    magnitudes = [abs(line_impedance(other, default_angle)) for other in adjacent]
+    unit = z_line / abs(z_line) if z_line else cmath.rect(1, math.radians(default_angle))
+
+    zone1 = ZONE1_REACH * z_line
+    if magnitudes:
+        zone2 = max(abs(z_line) + ZONE2_NEXT_REACH * min(magnitudes), ZONE2_MIN_REACH * abs(z_line)) * unit
+        zone3 = ZONE3_REACH * (abs(z_line) + max(magnitudes)) * unit
+    else:
+        # End of a radial feeder: nothing further to reach into
+        zone2 = ZONE2_MIN_REACH * z_line
+        zone3 = ZONE3_REACH * ZONE2_MIN_REACH * z_line
+    if resistive_reach is None:
+        resistive_reach = abs(zone3)
+    return DistanceSettings(line, z_line, zone1, zone2, zone3, resistive_reach)
+
+
+def settings_for_lines(lines, **kwargs):
+    """Zone reaches for many lines, with adjacent lines found in one query."""
+    lines = list(lines)
+    adjacent = adjacent_lines(lines)
+    return [zone_reaches(line, adjacent[line.pk], **kwargs) for line in lines]
+
+
+# Characteristics -----------------------------------------------------------
+
+def in_mho(impedance, reach):
+    """
+    Whether impedances lie inside a mho circle through the origin with
+    diameter reach.  Broadcasts over both arguments.
+    """
+    return np.abs(impedance - reach / 2) <= np.abs(reach) / 2
+
+
+def in_quadrilateral(impedance, reach, resistive_reach):
+    """
+    Whether impedances lie inside a quadrilateral characteristic.
+
+    The reactance line is at the reach's reactance, the resistive blinders
+    are parallel to the reach angle at ±resistive_reach (the left one at a
+    quarter of it) and the directional line is the R axis.
+    """
+    reactance = impedance.imag
+    # Resistance measured from the line through the origin at the reach angle
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(np.real(reach) != 0, np.imag(reach) / np.real(reach), np.inf)
+        offset = impedance.real - reactance / slope
+    return ((reactance >= 0) & (reactance <= np.imag(reach))
+            & (offset <= resistive_reach) & (offset >= -resistive_reach / 4))
+
+
+def operating_zone(impedance, reaches, resistive_reach=None, characteristic='mho'):
+    """
+    First zone (1, 2 or 3) that operates for each impedance, 0 for none.
+
+    Args:
+        impedance: complex array of apparent impedances
+        reaches: sequence of three complex reaches (or arrays broadcasting
+            against impedance)
+        characteristic: 'mho' or 'quadrilateral'
+    """
+    zone = np.zeros(np.shape(impedance), dtype=np.int8)
+    for number in (3, 2, 1):
+        reach = reaches[number - 1]
+        if characteristic == 'quadrilateral':
+            inside = in_quadrilateral(impedance, reach, resistive_reach)
+        else:
+            inside = in_mho(impedance, reach)
+        zone = np.where(inside, number, zone)
+    return zone
+
+
+# Fault sweeps --------------------------------------------------------------
+
+class CoverageResult:
+    """
+    Zones operating over a grid of fault points.
+
+    ``zones`` has shape (lines, locations, resistances); locations are
+    fractions of the protected line, values above 1 lie on the shortest
+    adjacent line (1.5 is half way along it).
+    """
+
+    def __init__(self, settings, locations, resistances, zones):
+        self.settings = settings
+        self.locations = locations
+        self.resistances = resistances
+        self.zones = zones
+
+    def zone1_coverage(self):
+        """Fraction of each line inside zone 1, per fault resistance (lines × resistances)."""
+        on_line = self.locations <= 1
+        return (self.zones[:, on_line, :] == 1).mean(axis=1)
+
+    def uncovered(self):
+        """Fault points on the protected line that no zone sees (lines × resistances)."""
+        on_line = self.locations <= 1
+        return (self.zones[:, on_line, :] == 0).sum(axis=1)
+
+    def overreach(self):
+        """Whether zone 1 operates for any fault beyond the remote bus, per line."""
+        beyond = self.locations > 1
+        return (self.zones[:, beyond, :] == 1).any(axis=(1, 2))
+
+    def rows(self):
+        resistances = self.resistances.tolist()
+        coverage = self.zone1_coverage().tolist()
+        uncovered = self.uncovered().sum(axis=1).tolist()
+        overreach = self.overreach().tolist()
+        return [
+            {
+                'line': str(setting.line),
+                'zone1_coverage': dict(zip(resistances, coverage[index])),
+                'uncovered_points': int(uncovered[index]),
+                'zone1_overreach': bool(overreach[index]),
+            }
+            for index, setting in enumerate(self.settings)
+        ]
+
+
+def sweep(settings, next_impedances=None, locations=None, resistances=(0.0,), characteristic='mho'):
+    """
+    Zone that operates for every fault location × fault resistance on every line.
+
+    Args:
+        settings: list of DistanceSettings
+        next_impedances: complex impedance of the shortest adjacent line for
+            each setting (0 where there is none); faults beyond the remote
+            bus are only swept when given
+        locations: fault positions as fractions of the line (default 0 to
+            1 in 1 % steps, plus 1 to 2 when next_impedances are given)
+        resistances: fault resistances in primary ohms
+        characteristic: 'mho' or 'quadrilateral'
+
+    Returns:
+        CoverageResult
+    """
+    settings = list(settings)
+    if locations is None:
+        locations = np.linspace(0, 2 if next_impedances is not None else 1, 201 if next_impedances is not None else 101)
+    locations = np.asarray(locations, dtype=float)
+    resistances = np.asarray(resistances, dtype=float)
+
+    # Shapes: lines (N, 1, 1), locations (1, L, 1), resistances (1, 1, R)
+    z_line = np.array([setting.line_impedance for setting in settings], dtype=complex)[:, None, None]
+    if next_impedances is None:
+        z_next = np.zeros_like(z_line)
+    else:
+        z_next = np.asarray(next_impedances, dtype=complex)[:, None, None]
+    position = locations[None, :, None]
+    apparent = (np.minimum(position, 1) * z_line + np.maximum(position - 1, 0) * z_next
+                + resistances[None, None, :])
+
+    reaches = [np.array([setting.reaches[zone] for setting in settings], dtype=complex)[:, None, None]
+               for zone in range(3)]
+    resistive_reach = np.array([setting.resistive_reach for setting in settings], dtype=float)[:, None, None]
+    zones = operating_zone(apparent, reaches, resistive_reach, characteristic)
+    if next_impedances is not None:
+        # Points on a missing adjacent line don't exist
+        zones = np.where((position > 1) & (z_next == 0), 0, zones)
+    return CoverageResult(settings, locations, resistances, zones)
+
+
+def sweep_lines(lines, locations=None, resistances=(0.0,), characteristic='mho', **kwargs):
+    """Zone reaches and a fault sweep into the adjacent lines for many lines."""
+    lines = list(lines)
+    adjacent = adjacent_lines(lines)
+    settings = [zone_reaches(line, adjacent[line.pk], **kwargs) for line in lines]
+    default_angle = kwargs.get('default_angle', DEFAULT_LINE_ANGLE)
+    next_impedances = [
+        min((line_impedance(other, default_angle) for other in adjacent[line.pk]), key=abs, default=0)
+        for line in lines
+    ]
+    return sweep(settings, next_impedances, locations, resistances, characteristic)
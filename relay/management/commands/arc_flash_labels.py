@@ -0,0 +1,63 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from relay.arc_flash import EQUIPMENT_CLASSES, fleet_arc_flash
+
+
+class Command(BaseCommand):
+    help = ('Calculate arc-flash incident energy and boundary for every transformer secondary and '
+            'transmission line, and write one label row per location as CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='CSV file to write (default: standard output)')
+        parser.add_argument('--breaker-time', type=float, default=0.05,
+                            help='Breaker opening time added to the relay trip time in seconds (default 0.05)')
+        parser.add_argument('--max-clearing-time', type=float, default=2.0,
+                            help='Longest arc duration assumed in seconds (default 2)')
+        parser.add_argument('--transformer-class', choices=list(EQUIPMENT_CLASSES),
+                            help='Equipment class at transformer secondaries (default: panel up to 1 kV, '
+                                 'switchgear above)')
+        parser.add_argument('--line-class', choices=list(EQUIPMENT_CLASSES), default='open_air',
+                            help='Equipment class at line ends (default open_air)')
+
+    def handle(self, *args, **options):
+        if options['breaker_time'] < 0 or options['max_clearing_time'] <= 0:
+            raise CommandError('Clearing times must be positive')
+        start = time.perf_counter()
+        result = fleet_arc_flash(
+            breaker_time=options['breaker_time'], max_clearing_time=options['max_clearing_time'],
+            transformer_class=options['transformer_class'], line_class=options['line_class'])
+
+        try:
+            handle = open(options['output'], 'w', newline='') if options['output'] else self.stdout
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            writer = csv.writer(handle)
+            writer.writerow(['equipment', 'name', 'location', 'class', 'voltage_v', 'bolted_current_ka',
+                             'arcing_current_ka', 'clearing_time_s', 'relay_tripped', 'working_distance_mm',
+                             'incident_energy_cal_cm2', 'boundary_mm', 'method', 'in_range'])
+            for row in result.rows():
+                writer.writerow([
+                    row['equipment'], row['name'], row['location'], row['equipment_class'], row['voltage'],
+                    self._round(row['bolted_current'] / 1000, 3), self._round(row['arcing_current'] / 1000, 3),
+                    self._round(row['clearing_time'], 3), row['relay_tripped'], row['working_distance'],
+                    self._round(row['incident_energy'], 2), self._round(row['boundary']), row['method'],
+                    row['in_range'],
+                ])
+        finally:
+            if handle is not self.stdout:
+                handle.close()
+
+        if options['output']:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {len(result)} arc-flash labels to {options['output']} in {elapsed:.2f} s"))
+
+    @staticmethod
+    def _round(value, digits=0):
+        if value != value:
+            return ''
+        return round(value, digits) if digits else round(value)
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomCurve',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('standard', models.CharField(choices=[('iec', 'IEC'), ('ieee', 'IEEE')], max_length=4)),
+                ('name', models.CharField(max_length=20)),
+                ('k', models.FloatField()),
+                ('alpha', models.FloatField()),
+                ('b', models.FloatField(default=0)),
+                ('reset', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('standard', 'name'), name='unique_custom_curve')],
+            },
+        ),
+    ]
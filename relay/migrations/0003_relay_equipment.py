@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '0002_customcurve'),
+        ('substation_equipment', '0005_transformer_vector_group_taps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relay',
+            name='line',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='relays', to='substation_equipment.transmissionline'),
+        ),
+        migrations.AddField(
+            model_name='relay',
+            name='transformer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='relays', to='substation_equipment.transformer'),
+        ),
+        migrations.AddIndex(
+            model_name='relay',
+            index=models.Index(fields=['protected_equipment', 'type'], name='relay_equipment_type_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '0003_relay_equipment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='relay',
+            name='standard',
+            field=models.CharField(blank=True, choices=[('iec', 'IEC'), ('ieee', 'IEEE')], db_index=True, max_length=4, null=True),
+        ),
+        migrations.AlterField(
+            model_name='relay',
+            name='type',
+            field=models.CharField(choices=[('oc', 'Overcurrent'), ('dist', 'Distance'), ('diff', 'Differential'), ('ref', 'Restricted Earth Fault')], db_index=True, max_length=4),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '0004_relay_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relay',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -1,5 +1,10 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
+from protectioncalculator.instrumentation import instrumented
+
+from .curves import get_curve
+
 # Create your models here.
 
 
@@ -21,79 +26,119 @@ STANDARD_CHOICES = [
 
 ]
 
+class RelayQuerySet(models.QuerySet):
+    def with_equipment(self):
+        """Load each relay's protected transformer or line in the same query."""
+        return self.select_related('transformer', 'line')
+
+    def protecting(self, equipment):
+        """Relays protecting a Transformer or TransmissionLine instance."""
+        if equipment._meta.model_name == 'transformer':
+            return self.filter(transformer=equipment)
+        return self.filter(line=equipment)
+
+
 class Relay(models.Model):
     name = models.CharField(max_length=255, unique=True)  # Name of the relay
-    type = models.CharField(max_length=4, choices=RELAY_CHOICES)
+    type = models.CharField(max_length=4, choices=RELAY_CHOICES, db_index=True)
     protected_equipment = models.CharField(max_length=4,choices=RELAY_PROTECTED_EQUIPMENT)
-    standard = models.CharField(max_length=4, choices=STANDARD_CHOICES, blank=True, null=True)  # Standard (IEC/IEEE)
+    standard = models.CharField(max_length=4, choices=STANDARD_CHOICES, blank=True, null=True, db_index=True)  # Standard (IEC/IEEE)
     curve_type = models.CharField(max_length=20, blank=True, null=True) # e.g., 'inverse', 'very_inverse', 'extremely_inverse'
     tds = models.FloatField(blank=True, null=True) # Time Dial Setting
     current_setting = models.FloatField(blank=True, null=True) # Pickup Current
+    transformer = models.ForeignKey('substation_equipment.Transformer', on_delete=models.SET_NULL, blank=True, null=True, related_name='relays')
+    line = models.ForeignKey('substation_equipment.TransmissionLine', on_delete=models.SET_NULL, blank=True, null=True, related_name='relays')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Change marker read by protectioncalculator.fleet
+
+    objects = RelayQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['protected_equipment', 'type'], name='relay_equipment_type_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
+        self.clear_unused_settings()
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        if self.transformer_id is not None and self.line_id is not None:
+            raise ValidationError('A relay protects either a transformer or a line, not both.')
+        if self.transformer_id is not None and self.protected_equipment != 'tra':
+            raise ValidationError({'transformer': 'Protected equipment is not a transformer.'})
+        if self.line_id is not None and self.protected_equipment != 'line':
+            raise ValidationError({'line': 'Protected equipment is not a transmission line.'})
+
+    @property
+    def equipment(self):
+        """The protected Transformer or TransmissionLine, or None."""
+        if self.protected_equipment == 'tra':
+            return self.transformer
+        return self.line
+
+    def clear_unused_settings(self):
         if self.type != 'oc':
             self.standard = None # if not oc, standard is null
             self.curve_type = None
             self.tds = None
             self.current_setting = None
-        super().save(*args, **kwargs)
 
 
+    @instrumented
     def calculate_trip_time(self, fault_current):
-            if self.type != 'oc' or self.standard is None or self.curve_type is None or self.tds is None or self.current_setting is None:
-                return None  # Not an OC relay or missing parameters
-
-            current_in_pu = fault_current / self.current_setting  # Current in per unit
-            if current_in_pu <= 1:
-              return None # No trip if current is less than pickup current
-
-            if self.standard == 'iec':
-                return self._calculate_iec_trip_time(current_in_pu)
-            elif self.standard == 'ieee':
-                return self._calculate_ieee_trip_time(current_in_pu)
-            else:
-                return None
-
-    def _calculate_iec_trip_time(self, current_in_pu):
-        # IEC Curve Equations (Example - adapt as needed)
-        # These are examples, you'll need to use the actual IEC curve equations.
-        # Different curves have different formulas.  Consult the IEC standard.
-
-        if self.curve_type == 'standard_inverse':
-        #Example Formula
-            return self.tds * (0.14 / ((current_in_pu**0.02) - 1) )
-        elif self.curve_type == 'very_inverse':
-            #Example Formula
-            return self.tds * (13.5 / (current_in_pu - 1) )
-        elif self.curve_type == 'extremely_inverse':
-            #Example Formula
-            return self.tds * (80 / ((current_in_pu**2) - 1) )
-        elif self.curve_type == 'long_time_standard_inverse':
-            #Example Formula
-            return self.tds * (120 / (current_in_pu - 1) )
-        else:
-            return None #Invalid curve type
-
-    def _calculate_ieee_trip_time(self, current_in_pu):
-            # IEEE Curve Equations (Example - adapt as needed)
-            # These are examples, you'll need to use the actual IEEE curve equations.
-            # Different curves have different formulas.  Consult the IEEE standard.
-
-        if self.curve_type == 'moderately_inverse':
-            #Example Formula
-            return self.tds * (0.0515 / ((current_in_pu**0.02) - 1) + 0.114)
-        elif self.curve_type == 'very_inverse':
-            #Example Formula
-            return self.tds * (19.61 / ((current_in_pu**2) - 1) + 0.491)
-        elif self.curve_type == 'extremely_inverse':
-            #Example Formula
-            return self.tds * (28.2 / ((current_in_pu**2) - 1) + 0.1217)
-
-        # Add more IEEE curve types as needed
-        else:
-            return None #Invalid curve type
-
+        """
+        Calculate the trip time for a fault current using the relay's curve.
+
+        The curve is looked up in the curve registry (see relay/curves.py) by
+        standard and curve type.
+
+        Returns:
+            Trip time in seconds, or None if the relay does not trip
+        """
+        if self.type != 'oc' or self.standard is None or self.curve_type is None or self.tds is None or self.current_setting is None:
+            return None  # Not an OC relay or missing parameters
+
+        current_in_pu = fault_current / self.current_setting  # Current in per unit
+        if current_in_pu <= 1:
+            return None # No trip if current is less than pickup current
+
+        curve = get_curve(self.standard, self.curve_type)
+        if curve is None:
+            return None # Invalid standard or curve type
+        return curve.trip_time(self.tds, current_in_pu)
+
+
+class CustomCurve(models.Model):
+    """
+    User-defined inverse-time curve, t = TDS × (k / (M^alpha - 1) + B).
+
+    Rows are merged into the curve registry and can be selected on a relay
+    by setting its standard and curve_type to this curve's standard and name.
+    """
+    standard = models.CharField(max_length=4, choices=STANDARD_CHOICES)
+    name = models.CharField(max_length=20) # Matches Relay.curve_type
+    k = models.FloatField()
+    alpha = models.FloatField()
+    b = models.FloatField(default=0) # Constant time adder (B)
+    reset = models.FloatField(blank=True, null=True) # Reset constant (tr)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['standard', 'name'], name='unique_custom_curve'),
+        ]
 
+    def __str__(self):
+        return f'{self.get_standard_display()} {self.name}'
+
+    def clean(self):
+        # M^alpha - 1 must grow with M, and the trip time must be positive
+        errors = {}
+        if self.k is not None and not self.k > 0:
+            errors['k'] = 'k must be greater than zero.'
+        if self.alpha is not None and not self.alpha > 0:
+            errors['alpha'] = 'alpha must be greater than zero.'
+        if errors:
+            raise ValidationError(errors)
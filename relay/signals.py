@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from protectioncalculator.fleet import row_changed
+
+from .curves import registry
+from .models import CustomCurve, Relay
+
+
+@receiver([post_save, post_delete], sender=CustomCurve)
+def invalidate_curve_registry(sender, **kwargs):
+    """
+    Re-read custom curves on this process's next lookup; other processes
+    see the change within CurveRegistry.interval.
+    """
+    registry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Relay)
+def relay_changed(sender, instance, signal, **kwargs):
+    row_changed(instance, deleted=signal is post_delete)
@@ -0,0 +1,122 @@
+"""
+Time-current characteristic (TCC) curves for plotting.
+
+Curves are sampled on a log-log grid that is refined adaptively: an interval
+is split where the curve's log(time) at the interval midpoint differs from
+the straight line between its ends by more than the tolerance.  That puts
+points near pickup, where the curve bends sharply, and few in the flat
+region at high multiples.
+
+Results are cached per (standard, curve_type, tds, current_setting), so
+relays with identical settings share one curve.
+"""
+import functools
+
+import numpy as np
+
+from .curves import get_curve, registry
+
+
+class TccCurve:
+    """
+    Sampled time-current curve.
+
+    ``currents`` (amperes) and ``times`` (seconds) are read-only float32
+    arrays of equal length, ordered by increasing current.
+    """
+
+    __slots__ = ('standard', 'curve_type', 'tds', 'current_setting', 'currents', 'times')
+
+    def __init__(self, standard, curve_type, tds, current_setting, currents, times):
+        self.standard = standard
+        self.curve_type = curve_type
+        self.tds = tds
+        self.current_setting = current_setting
+        self.currents = currents
+        self.times = times
+
+    def __len__(self):
+        return len(self.currents)
+
+    @property
+    def key(self):
+        return (self.standard, self.curve_type, self.tds, self.current_setting)
+
+    def as_dict(self):
+        return {
+            'standard': self.standard,
+            'curve_type': self.curve_type,
+            'tds': self.tds,
+            'current_setting': self.current_setting,
+            'currents': self.currents.tolist(),
+            'times': self.times.tolist(),
+        }
+
+
+def sample_curve(trip_time, min_multiple=1.05, max_multiple=100.0, tolerance=0.01,
+                 initial_points=9, max_points=256):
+    """
+    Sample t(M) adaptively on a logarithmic grid of multiples of pickup.
+
+    Args:
+        trip_time: vectorized function of the current in per unit
+        tolerance: allowed error of log10(time) between neighbouring points
+        initial_points: size of the starting log-spaced grid
+        max_points: upper bound on the number of samples
+
+    Returns:
+        (multiples, times) float64 arrays
+    """
+    log_multiples = np.linspace(np.log10(min_multiple), np.log10(max_multiple), initial_points)
+    log_times = np.log10(trip_time(10 ** log_multiples))
+
+    while len(log_multiples) < max_points:
+        # Evaluate every interval midpoint in one call
+        midpoints = (log_multiples[:-1] + log_multiples[1:]) / 2
+        mid_times = np.log10(trip_time(10 ** midpoints))
+        error = np.abs(mid_times - (log_times[:-1] + log_times[1:]) / 2)
+        refine = np.flatnonzero(error > tolerance)
+        if refine.size == 0:
+            break
+        # Refine the worst intervals first if the point budget runs out
+        budget = max_points - len(log_multiples)
+        if refine.size > budget:
+            refine = refine[np.argsort(error[refine])[::-1][:budget]]
+        log_multiples = np.insert(log_multiples, refine + 1, midpoints[refine])
+        log_times = np.insert(log_times, refine + 1, mid_times[refine])
+    return 10 ** log_multiples, 10 ** log_times
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_tcc(standard, curve_type, tds, current_setting, version, options):
+    curve = get_curve(standard, curve_type)
+    if curve is None:
+        return None
+    multiples, times = sample_curve(lambda m: curve.trip_time(tds, m), **dict(options))
+    currents = (multiples * current_setting).astype(np.float32)
+    times = times.astype(np.float32)
+    currents.flags.writeable = False
+    times.flags.writeable = False
+    return TccCurve(standard, curve_type, tds, current_setting, currents, times)
+
+
+def tcc(standard, curve_type, tds, current_setting, **options):
+    """
+    TCC curve for a set of overcurrent settings, or None for an unknown curve.
+
+    Keyword options are passed to sample_curve.
+    """
+    return _cached_tcc(standard, curve_type, float(tds), float(current_setting),
+                       registry.version, tuple(sorted(options.items())))
+
+
+def relay_tcc(relay, **options):
+    """TCC curve of a relay, or None if it is not a fully set overcurrent relay."""
+    if (relay.type != 'oc' or relay.standard is None or relay.curve_type is None
+            or relay.tds is None or relay.current_setting is None):
+        return None
+    return tcc(relay.standard, relay.curve_type, relay.tds, relay.current_setting, **options)
+
+
+def cache_info():
+    return _cached_tcc.cache_info()
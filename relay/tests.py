@@ -1,3 +1,461 @@
+import math
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+
+from substation_equipment.models import Bus, Transformer, TransmissionLine
+
+from .arc_flash import arc_flash, arc_flash_boundary, arcing_current, fleet_arc_flash, incident_energy
+from .curves import (
+    BUILTIN_CURVES, CurveDefinition, RelayCurveSet, get_curve, registry, required_pickups, required_tds, trip_times,
+)
+from .differential import (
+    differential_settings, parse_vector_group, ref_settings, relay_settings, select_ct_primary, through_fault_stability,
+)
+from .distance import line_impedance, operating_zone, settings_for_lines, sweep_lines, zone_reaches
+from .models import CustomCurve, Relay
+from .tcc import relay_tcc, sample_curve, tcc
+
+
+def overcurrent_relay(name, standard='iec', curve_type='standard_inverse', tds=0.1, current_setting=100, **fields):
+    return Relay(name=name, type='oc', protected_equipment='line', standard=standard, curve_type=curve_type,
+                 tds=tds, current_setting=current_setting, **fields)
+
+
+class TripTimeTests(TestCase):
+    currents = [50, 100, 100.5, 150, 400, 1000, 2000, 10000]
+
+    def assertMatchesScalar(self, relays, times):
+        self.assertEqual(times.shape, (len(relays), len(self.currents)))
+        for relay, row in zip(relays, times):
+            for current, time in zip(self.currents, row.tolist()):
+                expected = relay.calculate_trip_time(current)
+                if expected is None:
+                    self.assertTrue(np.isnan(time), f'{relay} at {current} A')
+                else:
+                    self.assertAlmostEqual(time, expected, places=12, msg=f'{relay} at {current} A')
+
+    def test_batch_matches_scalar_for_every_builtin_curve(self):
+        relays = [
+            overcurrent_relay(f'R{index}', curve.standard, curve.name, tds=0.05 + 0.1 * index,
+                              current_setting=100 + 25 * index)
+            for index, curve in enumerate(BUILTIN_CURVES)
+        ]
+        self.assertMatchesScalar(relays, trip_times(relays, self.currents))
+
+    def test_relays_that_cannot_trip(self):
+        relays = [
+            overcurrent_relay('R1'),
+            Relay(name='R2', type='dist', protected_equipment='line'),
+            overcurrent_relay('R3', tds=None),
+            overcurrent_relay('R4', current_setting=None),
+            overcurrent_relay('R5', curve_type='unknown'),
+        ]
+        times = trip_times(relays, self.currents)
+        self.assertMatchesScalar(relays, times)
+        self.assertTrue(np.isnan(times[1:]).all())
+
+    def test_prebuilt_curve_set_and_scalar_current(self):
+        relays = [overcurrent_relay('R1'), overcurrent_relay('R2', 'ieee', 'very_inverse', tds=2)]
+        curve_set = RelayCurveSet(relays)
+        times = trip_times(curve_set, 1000)
+        self.assertEqual(times.shape, (2, 1))
+        self.assertAlmostEqual(times[0, 0], 0.1 * 0.14 / (10 ** 0.02 - 1))
+        self.assertAlmostEqual(times[1, 0], 2 * (19.61 / (10 ** 2 - 1) + 0.491))
+        np.testing.assert_array_equal(curve_set.trip_times([1000]), times)
+
+
+class CurveRegistryTests(TestCase):
+    def setUp(self):
+        # Rows rolled back after a test must not stay in the merged table
+        self.addCleanup(registry.invalidate)
+
+    def test_builtin_curves(self):
+        curve = get_curve('ieee', 'moderately_inverse')
+        self.assertEqual((curve.k, curve.alpha, curve.b, curve.reset), (0.0515, 0.02, 0.114, 4.85))
+        self.assertIsNone(get_curve('iec', 'unknown'))
+        self.assertIsNone(get_curve(None, None))
+
+    def test_custom_curve_save_and_delete(self):
+        version = registry.version
+        custom = CustomCurve.objects.create(standard='iec', name='custom', k=1.0, alpha=1.0, b=0.5)
+        self.assertEqual(get_curve('iec', 'custom').b, 0.5)
+        self.assertNotEqual(registry.version, version)
+        relay = overcurrent_relay('R1', curve_type='custom', tds=2)
+        self.assertAlmostEqual(relay.calculate_trip_time(300), 2 * (1.0 / (3 - 1) + 0.5))
+
+        custom.delete()
+        self.assertIsNone(get_curve('iec', 'custom'))
+        self.assertEqual(registry.version, version)
+
+    def test_custom_curve_overrides_builtin(self):
+        CustomCurve.objects.create(standard='iec', name='very_inverse', k=10, alpha=1)
+        self.assertEqual(get_curve('iec', 'very_inverse').k, 10)
+
+    def test_changes_without_signals_after_interval(self):
+        CustomCurve.objects.create(standard='iec', name='custom', k=1.0, alpha=1.0)
+        self.assertEqual(get_curve('iec', 'custom').k, 1.0)
+        # As saved by another process
+        CustomCurve.objects.filter(name='custom').update(k=3.0)
+        with mock.patch.object(registry, 'interval', 0):
+            self.assertEqual(get_curve('iec', 'custom').k, 3.0)
+
+    def test_clean_rejects_non_positive_coefficients(self):
+        with self.assertRaises(ValidationError) as raised:
+            CustomCurve(standard='iec', name='bad', k=0, alpha=-1).full_clean()
+        self.assertEqual(set(raised.exception.message_dict), {'k', 'alpha'})
+        CustomCurve(standard='iec', name='good', k=0.14, alpha=0.02).full_clean()
+
+
+class TripTimeApiTests(TestCase):
+    def setUp(self):
+        self.relays = [overcurrent_relay('R1'), overcurrent_relay('R2', 'ieee', 'very_inverse', tds=2)]
+        for relay in self.relays:
+            relay.save()
+
+    def post(self, data):
+        return self.client.post(reverse('relay-trip-times'), data, content_type='application/json')
+
+    def test_trip_time_matrix(self):
+        ids = [relay.pk for relay in self.relays]
+        response = self.post({'relays': ids, 'fault_currents': [50, 1000]})
+        self.assertEqual(response.status_code, 200)
+        times = response.json()['trip_times']
+        # Below pickup is null
+        self.assertEqual([row[0] for row in times], [None, None])
+        for relay, row in zip(self.relays, times):
+            self.assertAlmostEqual(row[1], relay.calculate_trip_time(1000))
+
+    def test_single_relay(self):
+        relay = self.relays[0]
+        response = self.client.get(reverse('relay-trip-time', args=[relay.pk]), {'fault_current': 1000})
+        self.assertAlmostEqual(response.json()['trip_time'], relay.calculate_trip_time(1000))
+
+    def test_non_finite_currents_rejected(self):
+        ids = [relay.pk for relay in self.relays]
+        for value in ('nan', 'inf', '-Infinity'):
+            response = self.post({'relays': ids, 'fault_currents': [1000, value]})
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.get(reverse('relay-trip-time', args=[ids[0]]), {'fault_current': 'nan'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TccTests(TestCase):
+    def setUp(self):
+        self.addCleanup(registry.invalidate)
+
+    def test_samples_lie_on_the_curve(self):
+        relay = overcurrent_relay('R1', tds=0.3, current_setting=200)
+        curve = relay_tcc(relay)
+        self.assertTrue((np.diff(curve.currents) > 0).all())
+        self.assertAlmostEqual(curve.currents[0], 1.05 * 200, places=3)
+        self.assertAlmostEqual(curve.currents[-1], 100 * 200, places=1)
+        expected = [relay.calculate_trip_time(float(current)) for current in curve.currents]
+        np.testing.assert_allclose(curve.times, expected, rtol=1e-5)
+        with self.assertRaises(ValueError):
+            curve.times[0] = 0
+
+    def test_adaptive_sampling(self):
+        curve = get_curve('iec', 'extremely_inverse')
+        multiples, times = sample_curve(lambda m: curve.trip_time(1, m), tolerance=0.01)
+        # Straight lines between log-log neighbours are within the tolerance
+        midpoints = np.sqrt(multiples[:-1] * multiples[1:])
+        interpolated = (np.log10(times[:-1]) + np.log10(times[1:])) / 2
+        self.assertLessEqual(np.abs(np.log10(curve.trip_time(1, midpoints)) - interpolated).max(), 0.01)
+        # Points bunch up near pickup
+        self.assertGreater((multiples < 2).sum(), (multiples > 10).sum())
+
+        limited, _ = sample_curve(lambda m: curve.trip_time(1, m), tolerance=1e-6, max_points=40)
+        self.assertEqual(len(limited), 40)
+
+    def test_identical_settings_share_a_curve(self):
+        first = relay_tcc(overcurrent_relay('R1'))
+        self.assertIs(relay_tcc(overcurrent_relay('R2')), first)
+        self.assertIsNot(tcc('iec', 'standard_inverse', 0.1, 100, tolerance=0.1), first)
+        self.assertIsNone(relay_tcc(Relay(name='R3', type='dist', protected_equipment='line')))
+        self.assertIsNone(tcc('iec', 'unknown', 0.1, 100))
+
+        CustomCurve.objects.create(standard='iec', name='standard_inverse', k=0.2, alpha=0.02)
+        changed = relay_tcc(overcurrent_relay('R1'))
+        self.assertIsNot(changed, first)
+        self.assertGreater(changed.times[0], first.times[0])
+
+    def test_api(self):
+        relays = [overcurrent_relay('R1'), overcurrent_relay('R2'), Relay(name='R3', type='dist', protected_equipment='line')]
+        for relay in relays:
+            relay.save()
+        ids = [relay.pk for relay in relays]
+        response = self.client.post(reverse('relay-tccs'), {'relays': ids}, content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['relay_curves'], [0, 0, None])
+        self.assertEqual(len(data['curves']), 1)
+
+        url = reverse('relay-tcc', args=[ids[0]])
+        self.assertEqual(self.client.get(url, {'max_multiple': 20}).json()['curve']['currents'][-1], 2000)
+        for options in ({'min_multiple': 1}, {'min_multiple': 5, 'max_multiple': 2}, {'tolerance': -1}):
+            self.assertEqual(self.client.get(url, options).status_code, 400, options)
+
+
+class InverseSolverTests(TestCase):
+    fault_currents = [150, 400, 1000, 5000]
+
+    def test_required_tds_round_trip(self):
+        curves = [curve.key for curve in BUILTIN_CURVES for _ in self.fault_currents]
+        currents = self.fault_currents * len(BUILTIN_CURVES)
+        tds = required_tds(curves, currents, 100, 0.5)
+        for (standard, curve_type), current, value in zip(curves, currents, tds):
+            relay = overcurrent_relay('R1', standard, curve_type, tds=value)
+            self.assertAlmostEqual(relay.calculate_trip_time(current), 0.5, places=9)
+
+    def test_required_pickups_round_trip(self):
+        for curve in BUILTIN_CURVES:
+            pickups = required_pickups(curve, self.fault_currents, 0.5, 1.0)
+            self.assertFalse(np.isnan(pickups).any(), curve)
+            for current, pickup in zip(self.fault_currents, pickups):
+                relay = overcurrent_relay('R1', curve.standard, curve.name, tds=0.5, current_setting=pickup)
+                self.assertAlmostEqual(relay.calculate_trip_time(current), 1.0, places=6, msg=curve)
+
+    def test_function_curves_are_bisected(self):
+        definition = CurveDefinition('custom', 'table', function=lambda m: 10 / (m ** 1.5 - 1))
+        pickups = required_pickups(definition, [1000, 2000], 0.2, [0.5, 0.5])
+        np.testing.assert_allclose(definition.trip_time(0.2, np.array([1000, 2000]) / pickups), 0.5, rtol=1e-9)
+
+    def test_unreachable_targets(self):
+        self.assertTrue(np.isnan(required_tds(BUILTIN_CURVES[0], [50, 100], 100, 1.0)).all())
+        # Below the B x TDS asymptote of the IEEE curves
+        moderately_inverse = get_curve('ieee', 'moderately_inverse')
+        self.assertTrue(np.isnan(required_pickups(moderately_inverse, 1000, 1.0, 0.1)).all())
+        self.assertTrue(np.isnan(required_tds([('iec', 'unknown')], 1000, 100, 1.0)).all())
+        with self.assertRaises(ValueError):
+            required_tds([BUILTIN_CURVES[0]], [1000, 2000], 100, 1.0)
+
+
+class DistanceTests(TestCase):
+    def setUp(self):
+        buses = [Bus.objects.create(name=name, voltage=132000) for name in 'ABC']
+        values = {'kva_rating': 100000, 'voltage_rating': 132000, 'impedance': 10, 'r_per_km': 0.1, 'x_per_km': 0.4}
+        self.line = TransmissionLine.objects.create(
+            name='L1', from_bus=buses[0], to_bus=buses[1], length=10, **values)
+        self.short = TransmissionLine.objects.create(
+            name='L2', from_bus=buses[1], to_bus=buses[2], length=5, **values)
+        self.long = TransmissionLine.objects.create(
+            name='L3', from_bus=buses[2], to_bus=buses[1], length=20, **values)
+        self.unit = complex(0.1, 0.4)
+
+    def test_zone_reaches(self):
+        settings = settings_for_lines([self.line])[0]
+        z_line = 10 * self.unit
+        self.assertAlmostEqual(settings.line_impedance, z_line)
+        self.assertAlmostEqual(settings.zone1, 0.8 * z_line)
+        # Line plus half the shortest adjacent line, but at least 120 %
+        self.assertAlmostEqual(settings.zone2, 12.5 * self.unit)
+        self.assertAlmostEqual(settings.zone3, 1.2 * 30 * self.unit)
+        self.assertAlmostEqual(settings.resistive_reach, abs(settings.zone3))
+
+        secondary = settings.to_secondary(ct_ratio=400, vt_ratio=1200)
+        self.assertAlmostEqual(secondary.zone1, settings.zone1 / 3)
+
+    def test_radial_line(self):
+        settings = zone_reaches(self.line)
+        z_line = 10 * self.unit
+        self.assertAlmostEqual(settings.zone2, 1.2 * z_line)
+        self.assertAlmostEqual(settings.zone3, 1.2 * 1.2 * z_line)
+
+    def test_line_without_parameters(self):
+        line = TransmissionLine(name='L4', kva_rating=100000, voltage_rating=132000, impedance=10)
+        impedance = line_impedance(line, default_angle=90)
+        self.assertAlmostEqual(impedance.real, 0)
+        self.assertAlmostEqual(impedance.imag, line.calculate_impedance_ohms())
+
+    def test_sweep(self):
+        result = sweep_lines([self.line], locations=[0.5, 0.79, 0.81, 1.0, 1.2, 1.4, 1.6])
+        self.assertEqual(result.zones[0, :, 0].tolist(), [1, 1, 2, 2, 2, 2, 3])
+        row = result.rows()[0]
+        self.assertEqual(row['line'], 'L1')
+        self.assertAlmostEqual(row['zone1_coverage'][0.0], 0.5)
+        self.assertEqual(row['uncovered_points'], 0)
+        self.assertFalse(row['zone1_overreach'])
+
+        full = sweep_lines([self.line, self.short])
+        np.testing.assert_allclose(full.zone1_coverage()[:, 0], 81 / 101)
+
+    def test_quadrilateral_covers_more_fault_resistance(self):
+        settings = zone_reaches(self.line, [self.short, self.long])
+        fault = np.array([0.5 * settings.line_impedance + 0.5 * settings.resistive_reach])
+        self.assertEqual(operating_zone(fault, settings.reaches)[0], 0)
+        self.assertEqual(operating_zone(fault, settings.reaches, settings.resistive_reach, 'quadrilateral')[0], 1)
+
+
+class DifferentialTests(TestCase):
+    def setUp(self):
+        self.transformer = Transformer(name='T1', kva_rating=10000, primary_voltage=33000, secondary_voltage=11000,
+                                       impedance=10, vector_group='Dyn11', tap_min=-10, tap_max=10)
+
+    def test_differential_settings(self):
+        settings = differential_settings(self.transformer)
+        # Full load currents 175 A and 525 A
+        self.assertEqual(settings.ct_primary, (200, 600))
+        self.assertAlmostEqual(settings.matching_factors[0], 200 / (10e6 / (math.sqrt(3) * 33000)))
+        # Tap range 10 % + 2 × 5 % CT error + 5 % relay error + 5 % margin
+        self.assertEqual((settings.slope1, settings.pickup), (0.3, 0.25))
+        # 100 / 10 % impedance through fault is above the 8 pu inrush
+        self.assertEqual(settings.unrestrained, 10)
+        self.assertEqual((settings.phase_shift, settings.zero_sequence_filter), (330, True))
+        np.testing.assert_allclose(settings.threshold([0.5, 1, 3]), [0.25, 0.3, 0.6 + 0.7])
+
+    def test_through_fault_stability(self):
+        settings = differential_settings(self.transformer)
+        loose = differential_settings(self.transformer)
+        loose.pickup = loose.slope1 = 0.1
+        result = through_fault_stability([settings, loose])
+        self.assertEqual(result.stable.tolist(), [True, False])
+        current, tap, margin = result.worst_points()[1]
+        self.assertLess(margin, 0)
+        self.assertIn(tap, (-10, 10))
+        self.assertEqual(result.rows()[1]['stable'], False)
+
+    def test_ref_settings(self):
+        settings = ref_settings(self.transformer)
+        self.assertEqual(settings.side, 'secondary')
+        faults = self.transformer.calculate_sequence_fault_currents('secondary')
+        fault_current = max(faults['three_phase'], faults['line_to_ground'])
+        # Vs = If / N × (Rct + 2 × Rlead), rounded up to 5 V
+        voltage = fault_current / 600 * (2.0 + 2 * 0.5)
+        self.assertGreaterEqual(settings.setting_voltage, voltage)
+        self.assertLess(settings.setting_voltage, voltage + 5)
+        self.assertEqual(settings.setting_voltage % 5, 0)
+        self.assertAlmostEqual(settings.stabilising_resistor, settings.setting_voltage / 0.1)
+        self.assertAlmostEqual(settings.primary_operating_current, 600 * 0.1)
+
+        with self.assertRaises(ValueError):
+            ref_settings(self.transformer, side='primary')
+
+    def test_zero_impedance(self):
+        self.transformer.impedance = 0
+        for calculate in (differential_settings, ref_settings):
+            with self.assertRaises(ValueError):
+                calculate(self.transformer)
+
+    def test_helpers(self):
+        self.assertEqual(parse_vector_group('YNd1'), ('YN', 'd', 1))
+        for vector_group in ('Dyn13', 'Xy1', None):
+            with self.assertRaises(ValueError):
+                parse_vector_group(vector_group)
+        self.assertEqual(select_ct_primary(175), 200)
+        self.assertEqual(select_ct_primary(7200), 8000)
+
+        relay = Relay(name='R1', type='ref', protected_equipment='transformer')
+        self.assertEqual(relay_settings(relay, self.transformer).side, 'secondary')
+        with self.assertRaises(ValueError):
+            relay_settings(relay)
+        relay.type = 'oc'
+        with self.assertRaises(ValueError):
+            relay_settings(relay, self.transformer)
+
+
+class RelayEquipmentTests(TestCase):
+    def setUp(self):
+        self.transformer = Transformer.objects.create(
+            name='T1', kva_rating=1000, primary_voltage=11000, secondary_voltage=415, impedance=5)
+        self.line = TransmissionLine.objects.create(name='L1', kva_rating=10000, voltage_rating=33000, impedance=8)
+        self.transformer_relay = Relay.objects.create(
+            name='R1', type='diff', protected_equipment='tra', transformer=self.transformer)
+        self.line_relay = Relay.objects.create(name='R2', type='dist', protected_equipment='line', line=self.line)
+
+    def test_with_equipment_loads_in_one_query(self):
+        with self.assertNumQueries(1):
+            relays = list(Relay.objects.with_equipment().order_by('name'))
+            self.assertEqual([relay.equipment for relay in relays], [self.transformer, self.line])
+
+    def test_protecting(self):
+        self.assertEqual(list(Relay.objects.protecting(self.transformer)), [self.transformer_relay])
+        self.assertEqual(list(Relay.objects.protecting(self.line)), [self.line_relay])
+        self.assertEqual(list(self.transformer.relays.all()), [self.transformer_relay])
+
+    def test_deleting_equipment_keeps_the_relay(self):
+        self.line.delete()
+        self.line_relay.refresh_from_db()
+        self.assertIsNone(self.line_relay.equipment)
+
+    def test_clean(self):
+        both = Relay(name='R3', type='oc', protected_equipment='tra', transformer=self.transformer, line=self.line)
+        wrong = Relay(name='R4', type='oc', protected_equipment='line', transformer=self.transformer)
+        for relay in (both, wrong):
+            with self.assertRaises(ValidationError):
+                relay.full_clean()
+        self.transformer_relay.full_clean()
+
+
+class RelayAdminTests(TestCase):
+    def test_trip_time_columns(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        relay = overcurrent_relay('R1')
+        relay.save()
+        Relay.objects.create(name='R2', type='dist', protected_equipment='line')
+        response = self.client.get(reverse('admin:relay_relay_changelist'))
+        self.assertContains(response, 'T @ 1000 A (s)')
+        expected = round(relay.calculate_trip_time(1000), 3)
+        self.assertContains(response, f'<td class="field-trip_time_0">{expected}</td>')
+        self.assertContains(response, '<td class="field-trip_time_0">-</td>')
+
+
+class ArcFlashTests(TestCase):
+    def test_ieee1584_low_voltage_example(self):
+        # 480 V switchgear, solidly grounded, 20 kA bolted fault, 0.2 s arc,
+        # G = 32 mm, x = 1.473, D = 610 mm:
+        #   lg Ia = -0.097 + 0.662 lg 20 + 0.0966 × 0.48 + 0.000526 × 32
+        #           + 0.5588 × 0.48 × lg 20 - 0.00304 × 32 × lg 20 = 1.0499
+        #   lg En = -0.555 - 0.113 + 1.081 × 1.0499 + 0.0011 × 32 = 0.5021
+        #   E = 4.184 × 1.5 × 3.178 = 19.94 J/cm² = 4.77 cal/cm²
+        #   DB = 610 × (19.94 / 5)^(1 / 1.473) = 1560 mm
+        arcing = arcing_current(480, 20000, 32, True)
+        self.assertAlmostEqual(float(arcing), 11217, delta=1)
+        energy = incident_energy(480, 20000, arcing, 0.2, 32, 1.473, 610, True, True)
+        self.assertAlmostEqual(float(energy), 19.94, places=2)
+        self.assertAlmostEqual(float(arc_flash_boundary(480, energy, 1.473, 610)), 1560, delta=1)
+
+    def test_medium_voltage_and_lee(self):
+        # lg Ia = 0.00402 + 0.983 lg 20
+        self.assertAlmostEqual(float(arcing_current(13800, 20000, 153, True)), 10 ** 1.282933 * 1000, delta=1)
+        # Lee: 2.142e6 × 33 kV × 10 kA × 0.5 s / 910² = 426.8 J/cm²
+        self.assertAlmostEqual(float(arcing_current(33000, 10000, 153, True)), 10000)
+        self.assertAlmostEqual(float(incident_energy(33000, 10000, 10000, 0.5, 153, 2.0, 910, True, True)),
+                               426.80, places=2)
+
+    def test_relay_clearing_time(self):
+        transformer = Transformer.objects.create(name='T1', kva_rating=1000, primary_voltage=11000,
+                                                 secondary_voltage=415, impedance=5, vector_group='Dyn11')
+        relay = overcurrent_relay('R1', 'iec', 'very_inverse', tds=0.1, current_setting=60, transformer=transformer)
+        relay.protected_equipment = 'tra'
+        relay.save()
+        unprotected = Transformer.objects.create(name='T2', kva_rating=1000, primary_voltage=11000,
+                                                 secondary_voltage=415, impedance=5)
+
+        result = fleet_arc_flash(lines=TransmissionLine.objects.none())
+        protected, other = result.row(0), result.row(1)
+        self.assertEqual(protected['equipment_class'], 'panel')
+        # The worse of the full and 85 % arcing currents, seen on the primary side
+        full = float(arcing_current(415, protected['bolted_current'], 25, True))
+        energies = []
+        for arcing in (full, 0.85 * full):
+            clearing = min(relay.calculate_trip_time(arcing * 415 / 11000) + 0.05, 2.0)
+            energies.append(float(incident_energy(415, protected['bolted_current'], arcing, clearing,
+                                                  25, 1.641, 455, True, True)))
+        self.assertAlmostEqual(protected['incident_energy'], max(energies) / 4.184)
+        self.assertTrue(protected['relay_tripped'])
+        self.assertEqual((other['relay_tripped'], other['clearing_time']), (False, 2.0))
+        self.assertGreater(other['incident_energy'], protected['incident_energy'])
+
+        # Single equipment results come from the cache, keyed on the relay settings
+        self.assertEqual(arc_flash(transformer), protected)
+        self.assertEqual(arc_flash(unprotected), other)
+        relay.tds = 0.5
+        relay.save()
+        self.assertGreater(arc_flash(transformer)['clearing_time'], protected['clearing_time'])
 
-# Create your tests here.
+        with self.assertRaises(ValueError):
+            arc_flash(transformer, transformer_class='bunker')
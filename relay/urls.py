@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('<int:pk>/trip-time/', views.trip_time, name='relay-trip-time'),
+    path('trip-times/', views.trip_times, name='relay-trip-times'),
+    path('trip-times/async/', views.trip_times_async, name='relay-trip-times-async'),
+    path('<int:pk>/tcc/', views.tcc, name='relay-tcc'),
+    path('tcc/', views.tccs, name='relay-tccs'),
+]
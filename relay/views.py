@@ -1,3 +1,123 @@
-from django.shortcuts import render
+import inspect
+
+from asgiref.sync import sync_to_async
+
+from protectioncalculator.api import (
+    ApiError, afetch_in_bulk, api_view, async_api_view, clean_numbers, fetch_in_bulk, id_list, json_body, number_list,
+)
+from protectioncalculator.workers import coalescer, run_calculation
+
+from .curves import RelayCurveSet, trip_times as batch_trip_times
+from .models import Relay
+from .tcc import relay_tcc, sample_curve
 
 # Create your views here.
+
+
+@api_view('GET')
+def trip_time(request, pk):
+    """Trip time of one relay: GET ?fault_current=<amperes>."""
+    relay = fetch_in_bulk(Relay, [pk])[0]
+    fault_current = number_list(request.GET, 'fault_current')[0]
+    return {
+        'relay': relay.pk,
+        'name': relay.name,
+        'fault_current': fault_current,
+        'trip_time': relay.calculate_trip_time(fault_current),
+    }
+
+
+@api_view('POST')
+def trip_times(request):
+    """
+    Trip times of many relays against many fault currents.
+
+    POST {"relays": [ids], "fault_currents": [amperes]} returns a
+    relays × fault_currents matrix, with null where a relay does not trip.
+    """
+    data = json_body(request)
+    ids = id_list(data, 'relays')
+    fault_currents = number_list(data, 'fault_currents')
+    relays = fetch_in_bulk(Relay, ids)
+    return {
+        'relays': ids,
+        'fault_currents': fault_currents,
+        'trip_times': clean_numbers(batch_trip_times(relays, fault_currents)),
+    }
+
+
+def _tcc_options(source):
+    """TCC options of a request; multiples must satisfy 1 < min < max, tolerance >= 0."""
+    options = {}
+    for key in ('min_multiple', 'max_multiple', 'tolerance'):
+        if source.get(key) is not None:
+            options[key] = number_list(source, key)[0]
+    defaults = inspect.signature(sample_curve).parameters
+    min_multiple, max_multiple = (options.get(key, defaults[key].default) for key in ('min_multiple', 'max_multiple'))
+    if not 1 < min_multiple < max_multiple:
+        raise ApiError("'min_multiple' and 'max_multiple' must satisfy 1 < min_multiple < max_multiple")
+    if options.get('tolerance', 0) < 0:
+        raise ApiError("'tolerance' must not be negative")
+    return options
+
+
+@api_view('GET')
+def tcc(request, pk):
+    """TCC plot data of one relay (null curve for relays without OC settings)."""
+    relay = fetch_in_bulk(Relay, [pk])[0]
+    curve = relay_tcc(relay, **_tcc_options(request.GET))
+    return {'relay': relay.pk, 'name': relay.name, 'curve': curve.as_dict() if curve else None}
+
+
+@api_view('POST')
+def tccs(request):
+    """
+    TCC plot data of many relays: POST {"relays": [ids]}.
+
+    Relays with identical settings share one entry of "curves"; "relay_curves"
+    gives each relay's index into it (null if it has no curve).
+    """
+    data = json_body(request)
+    ids = id_list(data, 'relays')
+    options = _tcc_options(data)
+    curves = []
+    positions = {}
+    relay_curves = []
+    for relay in fetch_in_bulk(Relay, ids):
+        curve = relay_tcc(relay, **options)
+        if curve is None:
+            relay_curves.append(None)
+            continue
+        if curve.key not in positions:
+            positions[curve.key] = len(curves)
+            curves.append(curve.as_dict())
+        relay_curves.append(positions[curve.key])
+    return {'relays': ids, 'relay_curves': relay_curves, 'curves': curves}
+
+
+@async_api_view('POST')
+async def trip_times_async(request):
+    """
+    Async version of trip_times for ASGI servers.
+
+    Large matrices are computed in the worker process pool, and identical
+    requests in flight at the same time are computed once.
+    """
+    data = json_body(request)
+    ids = id_list(data, 'relays')
+    fault_currents = number_list(data, 'fault_currents')
+
+    async def compute():
+        relays = await afetch_in_bulk(Relay, ids)
+        # The curve registry may read custom curves from the database
+        curve_set = await sync_to_async(RelayCurveSet)(relays)
+        times = await run_calculation(
+            len(ids) * len(fault_currents), batch_trip_times, curve_set, fault_currents)
+        return clean_numbers(times)
+
+    key = ('trip_times', tuple(ids), tuple(fault_currents))
+    return {
+        'relays': ids,
+        'fault_currents': fault_currents,
+        'trip_times': await coalescer.run(key, compute),
+    }
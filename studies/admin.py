@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from .models import Snapshot, SnapshotArray
+# Register your models here.
+
+
+class SnapshotArrayInline(admin.TabularInline):
+    model = SnapshotArray
+    fields = ('kind', 'name', 'dtype', 'shape', 'rows', 'created')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Snapshot)
+class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ('name', 'short_hash', 'created', 'bus_count', 'transformer_count', 'line_count', 'relay_count')
+    search_fields = ('name', '^content_hash')
+    readonly_fields = ('content_hash', 'created', 'bus_count', 'transformer_count', 'line_count', 'relay_count')
+    inlines = [SnapshotArrayInline]
+
+    @admin.display(description='Hash')
+    def short_hash(self, snapshot):
+        return snapshot.content_hash[:12]
@@ -0,0 +1,152 @@
+"""
+Study calculations on the frozen columns of a snapshot.
+
+These functions take the snapshot's directory and a row range rather than a
+Snapshot, and don't touch the database, so the study runner can call them
+in worker processes that only share the snapshot's files.
+
+Relay fault currents are the three-phase fault current at the relay's
+protected equipment: the primary side fault current of its transformer, or
+the fault current of its line, computed from the frozen equipment columns
+of the linked rows.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from relay.curves import registry
+from substation_equipment.calculations import line_ratings, transformer_ratings
+
+
+# Result columns written per table
+RATING_RESULTS = {
+    'transformer': (
+        'primary_full_load_current', 'primary_base_impedance', 'primary_impedance_ohms', 'primary_fault_current',
+        'secondary_full_load_current', 'secondary_base_impedance', 'secondary_impedance_ohms',
+        'secondary_fault_current',
+    ),
+    'line': ('full_load_current', 'base_impedance', 'impedance_ohms', 'fault_current'),
+}
+
+
+def read(directory, kind, name, mode='r'):
+    """Memory-map one .npy file of a snapshot directory."""
+    return np.load(Path(directory) / kind / f'{name}.npy', mmap_mode=mode)
+
+
+def find(column, keys):
+    """Positions of keys in a sorted key column, -1 for missing keys."""
+    keys = np.asarray(keys, dtype=str)
+    if not len(column):
+        return np.full(keys.shape, -1)
+    positions = np.minimum(np.searchsorted(column, keys), len(column) - 1)
+    return np.where(column[positions] == keys, positions, -1)
+
+
+def ratings(directory, table, rows):
+    """
+    Ratings of transformers or lines.
+
+    Args:
+        table: 'transformer' or 'line'
+        rows: slice or integer index array of the table's rows
+
+    Returns:
+        Dictionary of result name (without the table prefix) to array
+    """
+    def column(field):
+        return np.asarray(read(directory, 'input', f'{table}.{field}')[rows])
+
+    if table == 'transformer':
+        return transformer_ratings(
+            kva_rating=column('kva_rating'), primary_voltage=column('primary_voltage'),
+            secondary_voltage=column('secondary_voltage'), impedance=column('impedance'),
+            three_phase=column('phase_type') == 'three')
+    return line_ratings(
+        kva_rating=column('kva_rating'), voltage_rating=column('voltage_rating'),
+        impedance=column('impedance'), three_phase=column('phase_type') == 'three')
+
+
+def relay_fault_currents(directory, start, stop):
+    """Fault current at the protected equipment of relays start:stop, NaN if unlinked."""
+    currents = np.full(stop - start, np.nan)
+    for table, result in (('transformer', 'primary_fault_current'), ('line', 'fault_current')):
+        names = read(directory, 'input', f'relay.{table}')[start:stop]
+        rows = find(read(directory, 'input', f'{table}.key'), names)
+        linked = np.flatnonzero(rows >= 0)
+        if len(linked):
+            currents[linked] = ratings(directory, table, rows[linked])[result]
+    return currents
+
+
+def curve_rows(directory):
+    """The frozen custom curves as (standard, name, k, alpha, b, reset) tuples."""
+    def column(field):
+        return read(directory, 'input', f'curve.{field}').tolist()
+
+    resets = [None if value != value else value for value in column('reset')]
+    return list(zip(column('standard'), column('name'), column('k'), column('alpha'), column('b'), resets))
+
+
+def relay_trip_times(directory, curves, fault_currents, start, stop):
+    """
+    Trip times of overcurrent relays start:stop.
+
+    Args:
+        curves: dictionary of (standard, name) to CurveDefinition
+        fault_currents: currents (A) of the trip time matrix
+
+    Returns:
+        (relays × currents trip time matrix, fault current at the protected
+        equipment, trip time at that current); NaN where the relay has no
+        curve or settings, or doesn't pick up
+    """
+    def column(field):
+        return np.asarray(read(directory, 'input', f'relay.{field}')[start:stop])
+
+    tds = column('tds')
+    pickup = column('current_setting')
+    valid = (column('type') == 'oc') & np.isfinite(tds) & np.isfinite(pickup)
+    keys = np.char.add(np.char.add(column('standard'), ':'), column('curve_type'))
+    currents = np.asarray(fault_currents, dtype=float)
+    equipment_current = relay_fault_currents(directory, start, stop)
+
+    matrix = np.full((stop - start, len(currents)), np.nan)
+    equipment_time = np.full(stop - start, np.nan)
+    for key in np.unique(keys[valid]):
+        curve = curves.get(tuple(str(key).split(':', 1)))
+        if curve is None:
+            continue
+        rows = np.flatnonzero(valid & (keys == key))
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            multiple = currents[None, :] / pickup[rows, None]
+            matrix[rows] = np.where(multiple > 1, curve.trip_time(tds[rows, None], multiple), np.nan)
+            own = equipment_current[rows] / pickup[rows]
+            equipment_time[rows] = np.where(own > 1, curve.trip_time(tds[rows], own), np.nan)
+    return matrix, equipment_current, equipment_time
+
+
+def run_shard(directory, table, start, stop, fault_currents=None, curve_definitions=()):
+    """
+    Compute one shard of a study and write it into the snapshot's result
+    files, which must already exist with their full shapes.
+
+    Module level so it can run in the process pool.
+
+    Returns:
+        Number of rows computed
+    """
+    if table == 'relay':
+        curves = registry.merged(curve_definitions)
+        matrix, current, time = relay_trip_times(directory, curves, fault_currents, start, stop)
+        outputs = {'relay.trip_times': matrix, 'relay.equipment_fault_current': current,
+                   'relay.equipment_trip_time': time}
+    else:
+        outputs = {f'{table}.{name}': values
+                   for name, values in ratings(directory, table, slice(start, stop)).items()}
+    for name, values in outputs.items():
+        array = read(directory, 'result', name, mode='r+')
+        array[start:stop] = values
+        array.flush()
+        del array
+    return stop - start
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from studies import snapshots
+from studies.runner import StudyRunner
+
+from .snapshot import get_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Compute the fault currents and relay trip times of a study snapshot in parallel shards. '
+            'Results are written to the snapshot as each shard finishes; an interrupted run resumes '
+            'from its checkpoint when started again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?',
+                            help='Snapshot id or hash prefix (default: snapshot the current tables)')
+        parser.add_argument('--name', default='', help='Name of the snapshot created when none is given')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs)')
+        parser.add_argument('--shard-size', type=int, default=50_000, help='Rows per shard (default 50000)')
+        parser.add_argument('--fault-currents', type=float, nargs='+',
+                            help='Currents (A) of the trip time matrix (default: 32 from 100 A to 50 kA)')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+
+    def handle(self, *args, **options):
+        if options['shard_size'] < 1:
+            raise CommandError('--shard-size must be positive')
+        if options['snapshot']:
+            snapshot = get_snapshot(options['snapshot'])
+        else:
+            snapshot, created = snapshots.freeze(options['name'])
+            self.stdout.write(f"{'Created' if created else 'Using existing'} {snapshot}")
+
+        runner = StudyRunner(
+            snapshot, fault_currents=options['fault_currents'] or snapshots.DEFAULT_FAULT_CURRENTS,
+            shard_size=options['shard_size'], workers=options['workers'], progress=self._progress)
+        self.stdout.write(f'Running {len(runner.shards())} shards on {runner.workers} worker(s)')
+        report = runner.run(restart=options['restart'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished {snapshot}: {report['rows']:,} rows in {report['seconds']:.1f} s "
+            f"({report['rows_per_second']:,.0f} rows/s)"))
+
+    def _progress(self, report):
+        table, start, stop = report['shard']
+        eta = f"{report['eta_seconds']:.0f} s" if report['eta_seconds'] is not None else '-'
+        self.stdout.write(f"[{report['shards_done']:>4}/{report['shards']}] {table:<11} {start:>9,}-{stop:<9,} "
+                          f"{report['rows_done']:>11,}/{report['rows']:,} rows "
+                          f"{report['rows_per_second']:>11,.0f} rows/s  ETA {eta}")
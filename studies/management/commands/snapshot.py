@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from studies import snapshots
+from studies.models import Snapshot
+
+
+def get_snapshot(reference):
+    """Snapshot by id or by a prefix of its content hash."""
+    if reference.isdigit():
+        snapshot = Snapshot.objects.filter(pk=int(reference)).first()
+        if snapshot is not None:
+            return snapshot
+    matches = list(Snapshot.objects.filter(content_hash__startswith=reference.lower())[:2])
+    if not matches:
+        raise CommandError(f"No snapshot '{reference}'")
+    if len(matches) > 1:
+        raise CommandError(f"Snapshot hash prefix '{reference}' is ambiguous")
+    return matches[0]
+
+
+class Command(BaseCommand):
+    help = 'Create, list, compute and compare study snapshots of the input tables.'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='subcommand', required=True)
+
+        create = subcommands.add_parser('create', help='Freeze the current input tables')
+        create.add_argument('--name', default='')
+        create.add_argument('--description', default='')
+        create.add_argument('--compute', action='store_true',
+                            help='Also compute the equipment ratings and relay trip times')
+
+        subcommands.add_parser('list', help='List snapshots, newest first')
+
+        compute = subcommands.add_parser('compute', help='Compute the standard results of a snapshot')
+        compute.add_argument('snapshot', help='Snapshot id or hash prefix')
+
+        diff = subcommands.add_parser('diff', help='Compare the inputs and results of two snapshots')
+        diff.add_argument('first', help='Snapshot id or hash prefix')
+        diff.add_argument('second', help='Snapshot id or hash prefix')
+        diff.add_argument('--tolerance', type=float, default=1e-9,
+                          help='Relative tolerance of float comparisons (default 1e-9)')
+        diff.add_argument('--keys', type=int, default=10,
+                          help='Changed keys to show per field (default 10)')
+
+    def handle(self, *args, **options):
+        getattr(self, f"handle_{options['subcommand']}")(options)
+
+    def handle_create(self, options):
+        snapshot, created = snapshots.freeze(options['name'], options['description'])
+        if created:
+            self.stdout.write(self.style.SUCCESS(f'Created {snapshot}'))
+        else:
+            self.stdout.write(f'Inputs unchanged; existing {snapshot}')
+        if options['compute']:
+            self._compute(snapshot)
+
+    def handle_list(self, options):
+        for snapshot in Snapshot.objects.all():
+            self.stdout.write(f'{snapshot.pk:>5} {snapshot.content_hash[:12]} {snapshot.created:%Y-%m-%d %H:%M} '
+                              f'{snapshot.transformer_count:>9,} transformers {snapshot.line_count:>9,} lines '
+                              f'{snapshot.relay_count:>9,} relays  {snapshot.name}')
+
+    def handle_compute(self, options):
+        self._compute(get_snapshot(options['snapshot']))
+
+    def handle_diff(self, options):
+        result = snapshots.diff(get_snapshot(options['first']), get_snapshot(options['second']),
+                                options['tolerance'])
+        if result.identical:
+            self.stdout.write('Inputs are identical')
+        limit = options['keys']
+        for table, changes in result.tables.items():
+            added, removed = changes['added'], changes['removed']
+            if not (len(added) or len(removed) or changes['changed']
+                    or changes['added_fields'] or changes['removed_fields']):
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{table}: {len(added):,} added, {len(removed):,} removed'))
+            for label, keys in (('added', added), ('removed', removed)):
+                if len(keys):
+                    self.stdout.write(f'  {label}: {self._keys(keys, limit)}')
+            for label in ('added_fields', 'removed_fields'):
+                if changes[label]:
+                    self.stdout.write(f"  {label.replace('_', ' ')}: {', '.join(changes[label])}")
+            for field, keys in changes['changed'].items():
+                self.stdout.write(f'  {field} changed for {len(keys):,}: {self._keys(keys, limit)}')
+        for name, stats in result.results.items():
+            if stats['changed']:
+                self.stdout.write(f"{name}: {stats['changed']:,} of {stats['compared']:,} values changed, "
+                                  f"max difference {stats['max_abs_difference']:.6g}")
+
+    def _compute(self, snapshot):
+        snapshots.compute_ratings(snapshot)
+        snapshots.compute_trip_times(snapshot)
+        self.stdout.write(self.style.SUCCESS(f'Computed results of {snapshot}'))
+
+    @staticmethod
+    def _keys(keys, limit):
+        shown = ', '.join(str(key) for key in keys[:limit])
+        return shown + (f', ... ({len(keys) - limit:,} more)' if len(keys) > limit else '')
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('bus_count', models.IntegerField(default=0)),
+                ('transformer_count', models.IntegerField(default=0)),
+                ('line_count', models.IntegerField(default=0)),
+                ('relay_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotArray',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('input', 'Input column'), ('result', 'Result')], max_length=6)),
+                ('name', models.CharField(max_length=255)),
+                ('dtype', models.CharField(max_length=32)),
+                ('shape', models.JSONField()),
+                ('rows', models.CharField(blank=True, max_length=20)),
+                ('filename', models.CharField(max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arrays', to='studies.snapshot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('snapshot', 'kind', 'name'), name='unique_snapshot_array')],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+from django.db import models
+
+# Create your models here.
+
+
+class Snapshot(models.Model):
+    """
+    Frozen copy of the study inputs, identified by a hash of their content.
+
+    The input columns and the study results are ``.npy`` files in the
+    snapshot's directory under STUDY_DATA_ROOT (see snapshots.py); this table
+    and SnapshotArray only hold the metadata.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    bus_count = models.IntegerField(default=0)
+    transformer_count = models.IntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+    relay_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        label = self.name or 'snapshot'
+        return f'{label} ({self.content_hash[:12]})'
+
+    @property
+    def directory(self):
+        from .snapshots import snapshot_directory
+        return snapshot_directory(self.content_hash)
+
+    def column(self, table, field):
+        """Input column of a table ('bus', 'transformer', 'line', 'relay', 'curve'), memory-mapped."""
+        from .snapshots import load_array
+        return load_array(self, 'input', f'{table}.{field}')
+
+    def result(self, name):
+        """A stored result, memory-mapped read-only."""
+        from .snapshots import load_array
+        return load_array(self, 'result', name)
+
+    def save_result(self, name, values, rows=''):
+        """
+        Store a result array.
+
+        Args:
+            rows: input table that axis 0 follows row by row ('transformer',
+                'relay', ...), used to align results in a diff
+        """
+        from .snapshots import save_array
+        return save_array(self, 'result', name, values, rows)
+
+    def create_result(self, name, shape, dtype=float, rows=''):
+        """Create a result file and return it as a writable memory map."""
+        from .snapshots import create_array
+        return create_array(self, 'result', name, shape, dtype, rows)
+
+
+class SnapshotArray(models.Model):
+    """One ``.npy`` file of a snapshot: an input column or a result."""
+    KIND_CHOICES = [
+        ('input', 'Input column'),
+        ('result', 'Result'),
+    ]
+
+    snapshot = models.ForeignKey(Snapshot, on_delete=models.CASCADE, related_name='arrays')
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    name = models.CharField(max_length=255)  # e.g. 'transformer.kva_rating'
+    dtype = models.CharField(max_length=32)
+    shape = models.JSONField()
+    rows = models.CharField(max_length=20, blank=True)  # Input table axis 0 follows
+    filename = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'kind', 'name'], name='unique_snapshot_array'),
+        ]
+
+    def __str__(self):
+        return f'{self.snapshot} {self.kind} {self.name}'
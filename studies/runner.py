@@ -0,0 +1,198 @@
+"""
+Parallel, resumable study runs over a snapshot.
+
+A run computes the transformer and line ratings (fault currents) and the
+relay trip times of a snapshot, the same results as compute_ratings() and
+compute_trip_times(), split into shards of rows.  The result files are
+created at their full size first; each shard is then computed in a process
+pool and written straight into its rows of the memory-mapped files, so
+results reach the disk as each shard finishes and no shard's output passes
+back through the parent process.
+
+After every finished shard the checkpoint file (``study.json`` in the
+snapshot directory) is rewritten with the shards done so far.  Running the
+same study again skips them, so an interrupted run resumes where it
+stopped; a run with different parameters starts over.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from . import calculations
+from .snapshots import DEFAULT_FAULT_CURRENTS
+
+
+CHECKPOINT = 'study.json'
+
+
+class StudyRunner:
+    """
+    Runs the standard study of a snapshot in shards.
+
+    Args:
+        snapshot: Snapshot to compute
+        fault_currents: currents (A) of the relay trip time matrix
+        shard_size: rows per shard
+        workers: worker processes (default: number of CPUs); 1 computes in
+            this process
+        progress: optional callable(progress dict) called after each shard
+    """
+
+    def __init__(self, snapshot, fault_currents=DEFAULT_FAULT_CURRENTS, shard_size=50_000, workers=None,
+                 progress=None):
+        self.snapshot = snapshot
+        self.fault_currents = [float(current) for current in fault_currents]
+        self.shard_size = shard_size
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = progress
+        self.directory = snapshot.directory
+
+    def outputs(self):
+        """Result name → (shape, rows table) of every file the run writes."""
+        counts = {'transformer': self.snapshot.transformer_count, 'line': self.snapshot.line_count}
+        outputs = {
+            f'{table}.{name}': ((counts[table],), table)
+            for table, names in calculations.RATING_RESULTS.items() for name in names
+        }
+        relays = self.snapshot.relay_count
+        outputs['relay.trip_times'] = ((relays, len(self.fault_currents)), 'relay')
+        outputs['relay.equipment_fault_current'] = ((relays,), 'relay')
+        outputs['relay.equipment_trip_time'] = ((relays,), 'relay')
+        return outputs
+
+    def shards(self):
+        counts = {'transformer': self.snapshot.transformer_count, 'line': self.snapshot.line_count,
+                  'relay': self.snapshot.relay_count}
+        return [(table, start, min(start + self.shard_size, count))
+                for table, count in counts.items() for start in range(0, count, self.shard_size)]
+
+    @property
+    def parameters(self):
+        return {'fault_currents': self.fault_currents, 'shard_size': self.shard_size}
+
+    # Checkpoint ------------------------------------------------------------
+
+    @property
+    def checkpoint_path(self):
+        return self.directory / CHECKPOINT
+
+    def load_checkpoint(self):
+        """Shards already done, or None when there is nothing to resume."""
+        try:
+            with open(self.checkpoint_path) as handle:
+                checkpoint = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('parameters') != self.parameters:
+            return None
+        for name, (shape, _) in self.outputs().items():
+            try:
+                if calculations.read(self.directory, 'result', name).shape != shape:
+                    return None
+            except (OSError, ValueError):
+                return None
+        return {tuple(shard) for shard in checkpoint['done']}
+
+    def save_checkpoint(self, done, finished=False):
+        temporary = self.checkpoint_path.with_name(f'.{CHECKPOINT}.tmp-{os.getpid()}')
+        with open(temporary, 'w') as handle:
+            json.dump({'parameters': self.parameters, 'done': sorted(done), 'finished': finished}, handle)
+        os.replace(temporary, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    # Running ---------------------------------------------------------------
+
+    def prepare(self, restart=False):
+        """
+        Create the result files unless resuming.
+
+        Returns:
+            Set of shards already done
+        """
+        done = None if restart else self.load_checkpoint()
+        if done is None:
+            done = set()
+            self.snapshot.save_result('relay.fault_currents', np.asarray(self.fault_currents))
+            for name, (shape, rows) in self.outputs().items():
+                array = self.snapshot.create_result(name, shape, rows=rows)
+                array[...] = np.nan
+                array.flush()
+                del array
+            self.save_checkpoint(done)
+        return done
+
+    def run(self, restart=False):
+        """
+        Compute the shards not done yet.
+
+        Returns:
+            Dictionary with the shard and row counts and the elapsed time
+        """
+        done = self.prepare(restart)
+        shards = self.shards()
+        pending = [shard for shard in shards if shard not in done]
+        curves = calculations.curve_rows(self.directory)
+        resumed = sum(stop - start for _, start, stop in done)
+        state = {
+            'shards': len(shards), 'shards_done': len(shards) - len(pending),
+            'rows': sum(stop - start for _, start, stop in shards),
+            'rows_done': resumed, 'resumed_rows': resumed, 'started': time.perf_counter(),
+        }
+
+        def finished(shard):
+            done.add(shard)
+            self.save_checkpoint(done)
+            state['shards_done'] += 1
+            state['rows_done'] += shard[2] - shard[1]
+            if self.progress is not None:
+                self.progress(self._report(state, shard))
+
+        arguments = [(str(self.directory), *shard, self.fault_currents, curves) for shard in pending]
+        if self.workers == 1 or len(pending) <= 1:
+            for shard, args in zip(pending, arguments):
+                calculations.run_shard(*args)
+                finished(shard)
+        else:
+            # Keep a few shards queued per worker rather than all of them
+            queue = list(zip(pending, arguments))
+            running = {}
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                while queue or running:
+                    while queue and len(running) < 2 * self.workers:
+                        shard, args = queue.pop(0)
+                        running[executor.submit(calculations.run_shard, *args)] = shard
+                    completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        shard = running.pop(future)
+                        future.result()
+                        finished(shard)
+
+        self.save_checkpoint(done, finished=True)
+        return self._report(state)
+
+    @staticmethod
+    def _report(state, shard=None):
+        elapsed = time.perf_counter() - state['started']
+        computed = state['rows_done'] - state['resumed_rows']
+        rate = computed / elapsed if elapsed > 0 else 0.0
+        remaining = state['rows'] - state['rows_done']
+        return {
+            'shard': shard,
+            'shards': state['shards'],
+            'shards_done': state['shards_done'],
+            'rows': state['rows'],
+            'rows_done': state['rows_done'],
+            'seconds': elapsed,
+            'rows_per_second': rate,
+            'eta_seconds': remaining / rate if rate else None,
+        }
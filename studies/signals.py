@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Snapshot
+from .snapshots import remove_files
+
+
+@receiver(post_delete, sender=Snapshot)
+def remove_snapshot_files(sender, instance, **kwargs):
+    """
+    Delete the snapshot's .npy files once the deletion commits, so a rolled
+    back delete keeps its data.
+    """
+    def remove():
+        # The same content may have been frozen again in the meantime
+        if not Snapshot.objects.filter(content_hash=instance.content_hash).exists():
+            remove_files(instance)
+
+    transaction.on_commit(remove)
@@ -0,0 +1,425 @@
+"""
+Study snapshots: frozen inputs and memory-mapped results.
+
+``freeze()`` reads the bus, transformer, line, relay and custom curve tables
+(one query each, streamed in chunks) into one NumPy column per field.  The
+columns are hashed with SHA-256, and the hash names the snapshot.  Freezing
+unchanged tables again returns the existing snapshot.
+
+Every column and result is a ``.npy`` file under
+
+    STUDY_DATA_ROOT/<hash[:2]>/<hash>/input/<table>.<field>.npy
+    STUDY_DATA_ROOT/<hash[:2]>/<hash>/result/<name>.npy
+
+and is opened with ``mmap_mode='r'``, so reading a slice of a result only
+pages in that slice.  The Snapshot and SnapshotArray tables keep the
+metadata (counts, dtypes, shapes).
+
+Rows of every table are sorted by key (the name, or 'standard:name' for
+custom curves), so a key can be found with ``searchsorted`` and two
+snapshots can be aligned row by row in ``diff``.  Foreign keys are stored as
+the related row's name.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+
+from substation_equipment.bulk import data_fields
+
+from . import calculations
+from .models import Snapshot, SnapshotArray
+
+
+TABLES = {
+    'bus': ('substation_equipment.Bus', ('name',)),
+    'transformer': ('substation_equipment.Transformer', ('name',)),
+    'line': ('substation_equipment.TransmissionLine', ('name',)),
+    'relay': ('relay.Relay', ('name',)),
+    'curve': ('relay.CustomCurve', ('standard', 'name')),
+}
+
+# Fault currents (A) of the stored trip time matrix
+DEFAULT_FAULT_CURRENTS = tuple(np.geomspace(100, 50000, 32).round(1))
+
+_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+_INTEGER_FIELDS = ('IntegerField', 'BigIntegerField', 'SmallIntegerField', 'PositiveIntegerField',
+                   'PositiveBigIntegerField', 'PositiveSmallIntegerField')
+
+
+class SnapshotError(Exception):
+    """Raised for missing or invalid snapshot arrays."""
+
+
+def snapshot_directory(content_hash):
+    return Path(settings.STUDY_DATA_ROOT) / content_hash[:2] / content_hash
+
+
+def _path(snapshot, kind, name):
+    if not _NAME.match(name):
+        raise SnapshotError(f"Invalid array name '{name}'")
+    return snapshot_directory(snapshot.content_hash) / kind / f'{name}.npy'
+
+
+# Freezing ------------------------------------------------------------------
+
+def _column(field, values):
+    """NumPy array for one field's values; None becomes '' or NaN."""
+    internal = field.get_internal_type()
+    if isinstance(field, models.ForeignKey) or internal in ('CharField', 'TextField'):
+        return np.array(['' if value is None else value for value in values], dtype=str)
+    if internal == 'BooleanField':
+        return np.array(values, dtype=bool)
+    if internal in _INTEGER_FIELDS and None not in values:
+        return np.array(values, dtype=np.int64)
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def read_table(table, batch_size=10000):
+    """
+    Columns of one table, sorted by key.
+
+    Returns:
+        Dictionary of field name to array, plus 'key'
+    """
+    label, key_fields = TABLES[table]
+    model = apps.get_model(label)
+    fields = data_fields(model)
+    lookups = [f'{field.name}__name' if isinstance(field, models.ForeignKey) else field.name
+               for field in fields]
+
+    chunks = {field.name: [] for field in fields}
+    batch = []
+    rows = model.objects.order_by(*key_fields).values_list(*lookups).iterator(chunk_size=batch_size)
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            for field, values in zip(fields, zip(*batch)):
+                chunks[field.name].append(_column(field, values))
+            batch = []
+    if batch or not chunks[fields[0].name]:
+        values_by_field = list(zip(*batch)) if batch else [()] * len(fields)
+        for field, values in zip(fields, values_by_field):
+            chunks[field.name].append(_column(field, list(values)))
+
+    columns = {name: np.concatenate(parts) for name, parts in chunks.items()}
+    key = columns[key_fields[0]]
+    for field in key_fields[1:]:
+        key = np.char.add(np.char.add(key, ':'), columns[field])
+    # Sort in NumPy so the order doesn't depend on the database collation
+    order = np.argsort(key, kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+    columns['key'] = key[order]
+    return columns
+
+
+def content_hash(columns):
+    """SHA-256 of named arrays, covering names, dtypes, shapes and data."""
+    hasher = hashlib.sha256()
+    for name in sorted(columns):
+        values = np.ascontiguousarray(columns[name])
+        hasher.update(f'{name}|{values.dtype.str}|{values.shape}\n'.encode())
+        hasher.update(values.data)
+    return hasher.hexdigest()
+
+
+def freeze(name='', description='', batch_size=10000):
+    """
+    Snapshot the current input tables.
+
+    Returns:
+        (Snapshot, created); created is False when a snapshot with the same
+        content already exists
+    """
+    columns = {}
+    for table in TABLES:
+        for field, values in read_table(table, batch_size).items():
+            columns[f'{table}.{field}'] = values
+    digest = content_hash(columns)
+
+    existing = Snapshot.objects.filter(content_hash=digest).first()
+    if existing is not None:
+        return existing, False
+
+    # Write to a temporary directory and rename, so a crash never leaves a
+    # partial snapshot under the final name
+    directory = snapshot_directory(digest)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    temporary = Path(tempfile.mkdtemp(prefix=f'{digest}.tmp-', dir=directory.parent))
+    try:
+        (temporary / 'input').mkdir()
+        (temporary / 'result').mkdir()
+        for column, values in columns.items():
+            np.save(temporary / 'input' / f'{column}.npy', values)
+        try:
+            os.replace(temporary, directory)
+        except OSError:
+            # The directory is named by its content: one that already exists
+            # (e.g. written by a concurrent freeze) holds the same inputs
+            if not directory.is_dir():
+                raise
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+    try:
+        with transaction.atomic():
+            snapshot = Snapshot.objects.create(
+                content_hash=digest, name=name, description=description,
+                bus_count=len(columns['bus.key']), transformer_count=len(columns['transformer.key']),
+                line_count=len(columns['line.key']), relay_count=len(columns['relay.key']))
+            SnapshotArray.objects.bulk_create([
+                SnapshotArray(snapshot=snapshot, kind='input', name=column, dtype=values.dtype.str,
+                              shape=list(values.shape), rows=column.split('.')[0],
+                              filename=f'input/{column}.npy')
+                for column, values in columns.items()
+            ])
+    except IntegrityError:
+        # Frozen concurrently by another process with identical content
+        return Snapshot.objects.get(content_hash=digest), False
+    return snapshot, True
+
+
+# Arrays --------------------------------------------------------------------
+
+def load_array(snapshot, kind, name):
+    """Open an input column or result as a read-only memory map."""
+    path = _path(snapshot, kind, name)
+    if not path.exists():
+        raise SnapshotError(f'{snapshot} has no {kind} {name}')
+    return calculations.read(path.parent.parent, kind, name)
+
+
+def _record(snapshot, kind, name, dtype, shape, rows):
+    SnapshotArray.objects.update_or_create(
+        snapshot=snapshot, kind=kind, name=name,
+        defaults={'dtype': np.dtype(dtype).str, 'shape': list(shape), 'rows': rows,
+                  'filename': f'{kind}/{name}.npy'})
+
+
+def save_array(snapshot, kind, name, values, rows=''):
+    values = np.asarray(values)
+    path = _path(snapshot, kind, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.tmp-{os.getpid()}')
+    with open(temporary, 'wb') as handle:
+        np.save(handle, values)
+    os.replace(temporary, path)
+    _record(snapshot, kind, name, values.dtype, values.shape, rows)
+    return path
+
+
+def create_array(snapshot, kind, name, shape, dtype=float, rows=''):
+    """A new .npy file opened as a writable memory map (filled with zeros)."""
+    path = _path(snapshot, kind, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+    _record(snapshot, kind, name, dtype, shape, rows)
+    return array
+
+
+def find_rows(snapshot, table, keys):
+    """
+    Row numbers of keys in a table of the snapshot, -1 for missing keys.
+
+    Uses a binary search over the sorted key column.
+    """
+    return calculations.find(snapshot.column(table, 'key'), keys)
+
+
+# Standard results ----------------------------------------------------------
+
+def compute_ratings(snapshot):
+    """Store the transformer and line rating columns computed from the frozen inputs."""
+    for table in calculations.RATING_RESULTS:
+        for name, values in calculations.ratings(snapshot.directory, table, slice(None)).items():
+            snapshot.save_result(f'{table}.{name}', values, rows=table)
+
+
+def compute_trip_times(snapshot, fault_currents=DEFAULT_FAULT_CURRENTS, block_size=100_000):
+    """
+    Store the relays × fault currents trip time matrix ('relay.trip_times'),
+    and the fault current at each relay's protected equipment and the trip
+    time at that current ('relay.equipment_fault_current',
+    'relay.equipment_trip_time').
+
+    Curves are those frozen in the snapshot merged over the built-in ones.
+    The matrix is written block by block into a memory-mapped file; the
+    study runner computes the same results in parallel.
+    """
+    from relay.curves import registry
+
+    directory = snapshot.directory
+    currents = np.asarray(fault_currents, dtype=float)
+    curves = registry.merged(calculations.curve_rows(directory))
+    count = snapshot.relay_count
+
+    snapshot.save_result('relay.fault_currents', currents)
+    matrix = snapshot.create_result('relay.trip_times', (count, len(currents)), rows='relay')
+    equipment_current = np.full(count, np.nan)
+    equipment_time = np.full(count, np.nan)
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        matrix[start:stop], equipment_current[start:stop], equipment_time[start:stop] = \
+            calculations.relay_trip_times(directory, curves, currents, start, stop)
+    matrix.flush()
+    del matrix
+    snapshot.save_result('relay.equipment_fault_current', equipment_current, rows='relay')
+    snapshot.save_result('relay.equipment_trip_time', equipment_time, rows='relay')
+
+
+# Diff ----------------------------------------------------------------------
+
+def _different(first, second, tolerance):
+    if first.dtype.kind in 'fc' or second.dtype.kind in 'fc':
+        first = np.asarray(first, dtype=float)
+        second = np.asarray(second, dtype=float)
+        with np.errstate(invalid='ignore'):
+            same = np.isclose(first, second, rtol=tolerance, atol=0) | (np.isnan(first) & np.isnan(second))
+        return ~same
+    return first != second
+
+
+class SnapshotDiff:
+    """
+    Differences between two snapshots.
+
+    ``tables`` maps each table to its 'added' and 'removed' keys and, under
+    'changed', each changed field to the keys whose value differs.
+    ``results`` maps each result present in both snapshots to the number of
+    compared and changed values and the largest absolute difference.
+    """
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self.tables = {}
+        self.results = {}
+
+    @property
+    def identical(self):
+        return self.first.content_hash == self.second.content_hash
+
+    def summary(self):
+        return {
+            'first': str(self.first),
+            'second': str(self.second),
+            'tables': {
+                table: {
+                    'added': len(changes['added']),
+                    'removed': len(changes['removed']),
+                    'changed': {field: len(keys) for field, keys in changes['changed'].items()},
+                    'added_fields': changes['added_fields'],
+                    'removed_fields': changes['removed_fields'],
+                }
+                for table, changes in self.tables.items()
+            },
+            'results': self.results,
+        }
+
+
+def _input_fields(snapshot):
+    """Recorded input columns of a snapshot: table → field names in order."""
+    fields = {}
+    for name in snapshot.arrays.filter(kind='input').order_by('pk').values_list('name', flat=True):
+        table, field = name.split('.', 1)
+        fields.setdefault(table, []).append(field)
+    return fields
+
+
+def _keys(snapshot, table, fields):
+    if 'key' not in fields.get(table, ()):
+        return np.array([], dtype=str)
+    return snapshot.column(table, 'key')
+
+
+def _alignment(first, second, table, first_fields, second_fields):
+    first_keys = _keys(first, table, first_fields)
+    second_keys = _keys(second, table, second_fields)
+    _, first_rows, second_rows = np.intersect1d(first_keys, second_keys, assume_unique=True,
+                                                return_indices=True)
+    return first_keys, second_keys, first_rows, second_rows
+
+
+def diff(first, second, tolerance=1e-9, block_size=65536):
+    """
+    Compare two snapshots by key.
+
+    Inputs are compared field by field on rows present in both.  Fields are
+    those recorded in the snapshots, not the current models, so snapshots
+    frozen before a schema change can be compared; fields only one of them
+    has are reported as added or removed fields.  Results
+    with the same name are compared on rows present in both (for results
+    aligned to a table) or element by element, block by block so large
+    results are never fully loaded.
+
+    Returns:
+        SnapshotDiff
+    """
+    result = SnapshotDiff(first, second)
+    first_fields = _input_fields(first)
+    second_fields = _input_fields(second)
+    alignments = {}
+    for table in dict.fromkeys([*TABLES, *first_fields, *second_fields]):
+        first_keys, second_keys, first_rows, second_rows = alignments[table] = _alignment(
+            first, second, table, first_fields, second_fields)
+        first_names = [name for name in first_fields.get(table, []) if name != 'key']
+        second_names = [name for name in second_fields.get(table, []) if name != 'key']
+        changed = {}
+        for name in first_names:
+            if name not in second_names:
+                continue
+            differs = _different(first.column(table, name)[first_rows],
+                                 second.column(table, name)[second_rows], tolerance)
+            if differs.any():
+                changed[name] = first_keys[first_rows[differs]]
+        result.tables[table] = {
+            'added': np.setdiff1d(second_keys, first_keys, assume_unique=True),
+            'removed': np.setdiff1d(first_keys, second_keys, assume_unique=True),
+            'changed': changed,
+            'added_fields': [name for name in second_names if name not in first_names],
+            'removed_fields': [name for name in first_names if name not in second_names],
+        }
+
+    first_arrays = {array.name: array for array in first.arrays.filter(kind='result')}
+    for array in second.arrays.filter(kind='result').order_by('name'):
+        other = first_arrays.get(array.name)
+        if other is None or other.rows != array.rows:
+            continue
+        first_values = first.result(array.name)
+        second_values = second.result(array.name)
+        if array.rows:
+            first_rows, second_rows = alignments[array.rows][2:]
+        else:
+            if first_values.shape != second_values.shape:
+                continue
+            first_rows = second_rows = np.arange(len(first_values))
+        if first_values.shape[1:] != second_values.shape[1:]:
+            continue
+
+        compared = changed = 0
+        largest = 0.0
+        for start in range(0, len(first_rows), block_size):
+            a = np.asarray(first_values[first_rows[start:start + block_size]])
+            b = np.asarray(second_values[second_rows[start:start + block_size]])
+            differs = _different(a, b, tolerance)
+            compared += differs.size
+            changed += int(differs.sum())
+            if a.dtype.kind in 'fiu' and differs.any():
+                with np.errstate(invalid='ignore'):
+                    delta = np.abs(a.astype(float) - b.astype(float))
+                finite = delta[np.isfinite(delta)]
+                if finite.size:
+                    largest = max(largest, float(finite.max()))
+        result.results[array.name] = {'compared': compared, 'changed': changed, 'max_abs_difference': largest}
+    return result
+
+
+def remove_files(snapshot):
+    shutil.rmtree(snapshot_directory(snapshot.content_hash), ignore_errors=True)
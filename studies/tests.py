@@ -0,0 +1,201 @@
+import tempfile
+from io import StringIO
+
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from relay.models import CustomCurve, Relay
+from substation_equipment.models import Bus, Transformer, TransmissionLine
+
+from . import snapshots
+from .models import Snapshot
+from .runner import StudyRunner
+from .snapshots import SnapshotError
+
+
+class StudyDataTestCase(TestCase):
+    """Keeps snapshot files in a temporary STUDY_DATA_ROOT."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        data_root = override_settings(STUDY_DATA_ROOT=directory.name)
+        data_root.enable()
+        self.addCleanup(data_root.disable)
+
+        bus = Bus.objects.create(name='B1', voltage=11000)
+        self.transformers = [
+            Transformer.objects.create(name=name, kva_rating=kva, primary_voltage=11000, secondary_voltage=415,
+                                       impedance=5, primary_bus=bus)
+            for name, kva in (('T2', 2500), ('T1', 1000))
+        ]
+        self.line = TransmissionLine.objects.create(name='L1', kva_rating=10000, voltage_rating=11000, impedance=8)
+        self.relays = [
+            Relay.objects.create(name='R1', type='oc', protected_equipment='tra', standard='iec',
+                                 curve_type='standard_inverse', tds=0.1, current_setting=100,
+                                 transformer=self.transformers[1]),
+            Relay.objects.create(name='R2', type='oc', protected_equipment='line', standard='iec',
+                                 curve_type='slow', tds=0.2, current_setting=200, line=self.line),
+        ]
+        CustomCurve.objects.create(standard='iec', name='slow', k=1.0, alpha=1.0)
+
+
+class SnapshotTests(StudyDataTestCase):
+    def test_freeze(self):
+        snapshot, created = snapshots.freeze('base')
+        self.assertTrue(created)
+        self.assertEqual((snapshot.bus_count, snapshot.transformer_count, snapshot.line_count,
+                          snapshot.relay_count), (1, 2, 1, 2))
+        # Sorted by key, foreign keys stored by name
+        self.assertEqual(snapshot.column('transformer', 'key').tolist(), ['T1', 'T2'])
+        self.assertEqual(snapshot.column('transformer', 'kva_rating').tolist(), [1000, 2500])
+        self.assertEqual(snapshot.column('transformer', 'primary_bus').tolist(), ['B1', 'B1'])
+        self.assertEqual(snapshot.column('curve', 'key').tolist(), ['iec:slow'])
+        self.assertEqual(snapshots.find_rows(snapshot, 'relay', ['R2', 'R9']).tolist(), [1, -1])
+
+        self.assertEqual(snapshots.freeze('again'), (snapshot, False))
+
+    def test_results(self):
+        snapshot, _ = snapshots.freeze()
+        snapshots.compute_ratings(snapshot)
+        snapshots.compute_trip_times(snapshot, fault_currents=[150, 1000])
+        fault_currents = snapshot.result('transformer.secondary_fault_current')
+        self.assertEqual(fault_currents.tolist()[0], self.transformers[1].secondary_fault_current)
+        with self.assertRaises(ValueError):
+            fault_currents[0] = 0
+
+        times = snapshot.result('relay.trip_times')
+        for row, relay in enumerate(self.relays):
+            for column, current in enumerate([150, 1000]):
+                expected = relay.calculate_trip_time(current)
+                if expected is None:
+                    self.assertTrue(np.isnan(times[row, column]))
+                else:
+                    self.assertAlmostEqual(times[row, column], expected)
+        # R1 sees its transformer's primary fault current
+        self.assertAlmostEqual(snapshot.result('relay.equipment_fault_current')[0],
+                               self.transformers[1].primary_fault_current)
+
+        with self.assertRaises(SnapshotError):
+            snapshot.result('missing')
+        with self.assertRaises(SnapshotError):
+            snapshot.save_result('../outside', [1])
+
+    def test_diff(self):
+        first, _ = snapshots.freeze('first')
+        snapshots.compute_ratings(first)
+        Transformer.objects.filter(name='T1').update(impedance=6)
+        Bus.objects.create(name='B2', voltage=415)
+        self.line.delete()
+        second, created = snapshots.freeze('second')
+        self.assertTrue(created)
+        snapshots.compute_ratings(second)
+
+        result = snapshots.diff(first, second)
+        self.assertFalse(result.identical)
+        self.assertEqual(result.tables['bus']['added'].tolist(), ['B2'])
+        self.assertEqual(result.tables['line']['removed'].tolist(), ['L1'])
+        self.assertEqual({field: keys.tolist() for field, keys in result.tables['transformer']['changed'].items()},
+                         {'impedance': ['T1']})
+        # The relay lost its line
+        self.assertEqual(result.tables['relay']['changed']['line'].tolist(), ['R2'])
+        self.assertEqual(result.results['transformer.primary_fault_current'], {
+            'compared': 2, 'changed': 1,
+            'max_abs_difference': abs(first.result('transformer.primary_fault_current')[0]
+                                      - second.result('transformer.primary_fault_current')[0]),
+        })
+        self.assertEqual(result.results['transformer.primary_full_load_current']['changed'], 0)
+        self.assertEqual(result.results['line.fault_current']['compared'], 0)
+
+        output = StringIO()
+        call_command('snapshot', 'diff', str(first.pk), second.content_hash[:12], stdout=output)
+        self.assertIn('impedance changed for 1: T1', output.getvalue())
+
+    def test_files_removed_when_the_delete_commits(self):
+        snapshot, _ = snapshots.freeze()
+        directory = snapshot.directory
+        with self.captureOnCommitCallbacks(execute=False):
+            Snapshot.objects.filter(pk=snapshot.pk).delete()
+        # Not committed: the files stay
+        self.assertTrue(directory.exists())
+
+        snapshot, _ = snapshots.freeze()
+        with self.captureOnCommitCallbacks(execute=True):
+            snapshot.delete()
+        self.assertFalse(directory.exists())
+
+    def test_command(self):
+        output = StringIO()
+        call_command('snapshot', 'create', '--name', 'base', '--compute', stdout=output)
+        snapshot = Snapshot.objects.get()
+        self.assertIn(f'Created {snapshot}', output.getvalue())
+        self.assertEqual(snapshot.result('relay.trip_times').shape, (2, len(snapshots.DEFAULT_FAULT_CURRENTS)))
+
+        output = StringIO()
+        call_command('snapshot', 'create', stdout=output)
+        self.assertIn('Inputs unchanged', output.getvalue())
+        np.testing.assert_array_equal(snapshot.column('relay', 'tds'), [0.1, 0.2])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class StudyRunnerTests(StudyDataTestCase):
+    fault_currents = [150, 1000, 5000]
+
+    def setUp(self):
+        super().setUp()
+        self.snapshot, _ = snapshots.freeze()
+        # Reference results from the single-pass functions
+        snapshots.compute_ratings(self.snapshot)
+        snapshots.compute_trip_times(self.snapshot, self.fault_currents)
+        self.expected = {name: np.array(self.snapshot.result(name)) for name in self.result_names()}
+
+    def result_names(self):
+        return list(StudyRunner(self.snapshot, self.fault_currents).outputs())
+
+    def assertResultsMatch(self):
+        for name, expected in self.expected.items():
+            np.testing.assert_array_equal(self.snapshot.result(name), expected, err_msg=name)
+
+    def test_shards_match_single_pass(self):
+        report = StudyRunner(self.snapshot, self.fault_currents, shard_size=1, workers=1).run(restart=True)
+        self.assertEqual((report['shards'], report['rows']), (5, 5))
+        self.assertResultsMatch()
+
+    def test_process_pool(self):
+        StudyRunner(self.snapshot, self.fault_currents, shard_size=1, workers=2).run(restart=True)
+        self.assertResultsMatch()
+
+    def test_resume_after_interruption(self):
+        def interrupt(report):
+            if report['shards_done'] == 2:
+                raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            StudyRunner(self.snapshot, self.fault_currents, shard_size=1, workers=1, progress=interrupt).run(
+                restart=True)
+        reports = []
+        runner = StudyRunner(self.snapshot, self.fault_currents, shard_size=1, workers=1, progress=reports.append)
+        self.assertEqual(len(runner.load_checkpoint()), 2)
+        report = runner.run()
+        self.assertEqual(len(reports), 3)
+        self.assertEqual(report['rows_done'], 5)
+        self.assertResultsMatch()
+
+        # Different parameters start over
+        self.assertIsNone(StudyRunner(self.snapshot, self.fault_currents, shard_size=2).load_checkpoint())
+        self.assertIsNone(StudyRunner(self.snapshot, [100], shard_size=1).load_checkpoint())
+
+    def test_command(self):
+        output = StringIO()
+        call_command('run_study', self.snapshot.content_hash[:8], '--workers', '1', '--shard-size', '2',
+                     '--fault-currents', *map(str, self.fault_currents), '--restart', stdout=output)
+        self.assertIn('Running 3 shards on 1 worker(s)', output.getvalue())
+        self.assertResultsMatch()
+        with self.assertRaises(CommandError):
+            call_command('run_study', '--shard-size', '0', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('run_study', 'ffffffffffff', stdout=StringIO())
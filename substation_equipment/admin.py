@@ -1,7 +1,92 @@
-from django.contrib import admin
-from .models import Transformer, TransmissionLine
+from django.contrib import admin, messages
+from django.db import transaction
+
+from protectioncalculator.admin_utils import BulkComputedAdmin, page_value
+
+from .cache import calculation_cache
+from .calculations import line_arrays, line_ratings, transformer_arrays, transformer_ratings
+from .models import Bus, Transformer, TransmissionLine
 # Register your models here.
 
 
-admin.site.register(Transformer)
-admin.site.register(TransmissionLine)
+@admin.action(description='Recalculate selected')
+def recalculate(modeladmin, request, queryset):
+    """Refresh the stored rating columns of the selected rows."""
+    model = queryset.model
+    count = 0
+    batch = []
+    with transaction.atomic():
+        for row in queryset.order_by('pk').iterator(chunk_size=1000):
+            calculation_cache.invalidate(row)
+            row.update_computed_fields()
+            batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, model.COMPUTED_FIELDS)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, model.COMPUTED_FIELDS)
+            count += len(batch)
+    modeladmin.message_user(request, f'Recalculated {count} {model._meta.verbose_name_plural}.', messages.SUCCESS)
+
+
+@admin.register(Bus)
+class BusAdmin(admin.ModelAdmin):
+    list_display = ('name', 'voltage', 'source_mva', 'source_x_r', 'fault_current')
+    search_fields = ('^name',)
+    show_full_result_count = False
+
+
+@admin.register(Transformer)
+class TransformerAdmin(BulkComputedAdmin):
+    list_display = ('name', 'kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance', 'phase_type',
+                    'vector_group', 'primary_flc', 'secondary_flc', 'primary_fault', 'secondary_fault')
+    list_filter = ('phase_type',)
+    search_fields = ('^name',)
+    list_select_related = ('primary_bus', 'secondary_bus')
+    readonly_fields = Transformer.COMPUTED_FIELDS
+    actions = [recalculate]
+
+    def annotate_page(self, rows):
+        ratings = transformer_ratings(**transformer_arrays(rows))
+        for index, row in enumerate(rows):
+            row._page_values = {key: values[index] for key, values in ratings.items()}
+
+    @admin.display(description='Primary FLC (A)')
+    def primary_flc(self, row):
+        return page_value(row, 'primary_full_load_current')
+
+    @admin.display(description='Secondary FLC (A)')
+    def secondary_flc(self, row):
+        return page_value(row, 'secondary_full_load_current')
+
+    @admin.display(description='Primary fault (A)')
+    def primary_fault(self, row):
+        return page_value(row, 'primary_fault_current')
+
+    @admin.display(description='Secondary fault (A)')
+    def secondary_fault(self, row):
+        return page_value(row, 'secondary_fault_current')
+
+
+@admin.register(TransmissionLine)
+class TransmissionLineAdmin(BulkComputedAdmin):
+    list_display = ('name', 'kva_rating', 'voltage_rating', 'impedance', 'length', 'phase_type', 'flc', 'fault')
+    list_filter = ('phase_type',)
+    search_fields = ('^name',)
+    list_select_related = ('from_bus', 'to_bus')
+    readonly_fields = TransmissionLine.COMPUTED_FIELDS
+    actions = [recalculate]
+
+    def annotate_page(self, rows):
+        ratings = line_ratings(**line_arrays(rows))
+        for index, row in enumerate(rows):
+            row._page_values = {key: values[index] for key, values in ratings.items()}
+
+    @admin.display(description='FLC (A)')
+    def flc(self, row):
+        return page_value(row, 'full_load_current')
+
+    @admin.display(description='Fault (A)')
+    def fault(self, row):
+        return page_value(row, 'fault_current')
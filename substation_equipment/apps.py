@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SubstationEquipmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'substation_equipment'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,336 @@
+"""
+Streaming bulk import and export of equipment and relay rows.
+
+Used by the ``import_equipment`` and ``export_equipment`` management
+commands.  Files are read and written one chunk at a time, so memory use
+depends on the batch size and not on the file size.
+
+Supported formats are CSV, JSON Lines (one object per line) and Parquet.
+Parquet needs the optional ``pyarrow`` package.
+
+Columns are the editable model fields.  Foreign keys to models with a unique
+``name`` (e.g. ``primary_bus``) are written and read as that name.
+"""
+import csv
+import json
+import time
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+
+MODELS = {
+    'bus': 'substation_equipment.Bus',
+    'transformer': 'substation_equipment.Transformer',
+    'line': 'substation_equipment.TransmissionLine',
+    'relay': 'relay.Relay',
+}
+
+FORMATS = ['csv', 'jsonl', 'parquet']
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.parquet': 'parquet',
+}
+
+
+class BulkError(Exception):
+    """Raised for unusable files or rows."""
+
+
+def get_model(name):
+    try:
+        return apps.get_model(MODELS[name])
+    except KeyError:
+        raise BulkError(f"Unknown model '{name}', expected one of: {', '.join(MODELS)}")
+
+
+def guess_format(path, file_format=None):
+    if file_format:
+        return file_format
+    for extension, guessed in _EXTENSIONS.items():
+        if str(path).lower().endswith(extension):
+            return guessed
+    raise BulkError(f'Cannot tell the format of {path}; pass --format')
+
+
+def data_fields(model):
+    """Editable concrete fields other than the primary key, in model order."""
+    return [field for field in model._meta.concrete_fields
+            if field.editable and not field.primary_key]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise BulkError('Parquet support needs the pyarrow package (pip install pyarrow)')
+    return pyarrow
+
+
+# Readers -------------------------------------------------------------------
+
+def read_rows(path, file_format, batch_size):
+    """Yield lists of at most batch_size row dictionaries."""
+    if file_format == 'parquet':
+        pyarrow = _import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield record_batch.to_pylist()
+        return
+
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            rows = csv.DictReader(handle)
+        else:
+            rows = (json.loads(line) for line in handle if line.strip())
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# Writers -------------------------------------------------------------------
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self.handle = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.handle.close()
+
+
+class _JsonLinesWriter:
+    def __init__(self, path, columns):
+        self.handle = open(path, 'w', encoding='utf-8')
+        self.columns = columns
+
+    def write(self, rows):
+        self.handle.writelines(json.dumps(dict(zip(self.columns, row))) + '\n' for row in rows)
+
+    def close(self):
+        self.handle.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columns):
+        self.pyarrow = _import_pyarrow()
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pyarrow.Table.from_pylist([dict(zip(self.columns, row)) for row in rows])
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is None:
+            self.write([])
+        self.writer.close()
+
+
+_WRITERS = {'csv': _CsvWriter, 'jsonl': _JsonLinesWriter, 'parquet': _ParquetWriter}
+
+
+# Import --------------------------------------------------------------------
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.written = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class _NameLookup:
+    """Resolves foreign keys given by name, one query per chunk and field."""
+
+    def __init__(self, field):
+        self.field = field
+        self.related = field.related_model
+
+    def resolve(self, names):
+        names = {name for name in names if name not in (None, '')}
+        return dict(self.related.objects.filter(name__in=names).values_list('name', 'pk'))
+
+
+def _prepare(instance):
+    """Apply the derived-field logic that save() would run."""
+    if hasattr(instance, 'clear_unused_settings'):
+        instance.clear_unused_settings()
+    if hasattr(instance, 'update_computed_fields'):
+        instance.update_computed_fields()
+
+
+def _build_chunk(model, fields, lookups, rows, offset, result):
+    """
+    Validate a chunk of rows.
+
+    Returns:
+        List of (unsaved instance, names of the fields its row has), one per
+        name (the last row wins)
+    """
+    resolved = {
+        name: lookup.resolve(row.get(name) for row in rows)
+        for name, lookup in lookups.items()
+    }
+    # Rows without every column update existing rows: validate (and compute
+    # the derived fields from) the stored values of the missing columns
+    partial = {row.get('name') for row in rows if any(field.name not in row for field in fields)}
+    partial.discard(None)
+    stored = {}
+    if partial:
+        attnames = [field.attname for field in fields]
+        stored = {values['name']: values for values in model.objects.filter(name__in=partial).values(*attnames)}
+
+    instances = {}
+    for number, row in enumerate(rows, start=offset):
+        values = dict(stored.get(row.get('name'), {}))
+        try:
+            for field in fields:
+                if field.name not in row:
+                    continue
+                value = row[field.name]
+                if value == '' and (field.null or not isinstance(field, (models.CharField, models.TextField))):
+                    value = None
+                if field.name in lookups:
+                    if value is not None:
+                        if value not in resolved[field.name]:
+                            raise ValidationError({field.name: [f"No {field.related_model._meta.verbose_name} named '{value}'"]})
+                        value = resolved[field.name][value]
+                    values[field.attname] = value
+                else:
+                    values[field.name] = value
+            instance = model(**values)
+            # Foreign keys were checked in bulk above
+            instance.clean_fields(exclude=list(lookups))
+            instance.clean()
+            if not instance.name:
+                raise ValidationError({'name': ['This field cannot be blank.']})
+        except (ValidationError, TypeError, ValueError) as error:
+            messages = error.message_dict if hasattr(error, 'message_dict') else str(error)
+            result.errors.append((number, messages))
+            continue
+        _prepare(instance)
+        instances.pop(instance.name, None)
+        instances[instance.name] = (instance, tuple(field.name for field in fields if field.name in row))
+    return list(instances.values())
+
+
+def import_rows(model, path, file_format, batch_size=1000, skip_invalid=False, progress=None):
+    """
+    Upsert the rows of a file into a model, matching on ``name``.
+
+    Each chunk is validated and then written with one ``bulk_create``
+    (INSERT ... ON CONFLICT (name) DO UPDATE) inside its own transaction.
+    A chunk with invalid rows is not written unless ``skip_invalid`` is set,
+    in which case only the invalid rows are dropped.  Rows only update the
+    fields they have: rows with different keys (possible in JSON Lines and
+    Parquet) are written with one ``bulk_create`` per set of keys, and are
+    validated against the stored values of the fields they leave out.
+
+    Args:
+        progress: optional callable receiving the ImportResult after each chunk
+
+    Returns:
+        ImportResult
+    """
+    fields = data_fields(model)
+    lookups = {
+        field.name: _NameLookup(field)
+        for field in fields
+        if isinstance(field, models.ForeignKey) and field.related_model._meta.get_field('name').unique
+    }
+    computed = list(getattr(model, 'COMPUTED_FIELDS', []))
+    # bulk_create sets auto_now fields (updated_at) on insert; updates need them listed
+    computed += [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+    result = ImportResult()
+    start = time.perf_counter()
+    for rows in read_rows(path, file_format, batch_size):
+        offset = result.rows + 1
+        result.rows += len(rows)
+        errors_before = len(result.errors)
+        instances = _build_chunk(model, fields, lookups, rows, offset, result)
+        if len(result.errors) > errors_before and not skip_invalid:
+            result.elapsed = time.perf_counter() - start
+            raise BulkError(f'Invalid rows: {result.errors[errors_before:]}')
+        groups = {}
+        for instance, columns in instances:
+            groups.setdefault(columns, []).append(instance)
+        with transaction.atomic():
+            for columns, group in groups.items():
+                update_fields = [name for name in columns if name != 'name'] + computed
+                if model._meta.model_name == 'relay':
+                    update_fields = list(dict.fromkeys(
+                        update_fields + ['standard', 'curve_type', 'tds', 'current_setting']))
+                model.objects.bulk_create(
+                    group, batch_size=batch_size, update_conflicts=bool(update_fields),
+                    ignore_conflicts=not update_fields, unique_fields=['name'] if update_fields else None,
+                    update_fields=update_fields or None)
+        result.written += len(instances)
+        result.elapsed = time.perf_counter() - start
+        if progress is not None:
+            progress(result)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# Export --------------------------------------------------------------------
+
+def export_rows(model, path, file_format, batch_size=1000, progress=None):
+    """
+    Stream every row of a model to a file.
+
+    Returns:
+        (row count, seconds)
+    """
+    fields = data_fields(model)
+    columns = [field.name for field in fields]
+    lookups = []
+    for field in fields:
+        if isinstance(field, models.ForeignKey):
+            lookups.append(f'{field.name}__name')
+        else:
+            lookups.append(field.name)
+
+    writer = _WRITERS[file_format](path, columns)
+    count = 0
+    start = time.perf_counter()
+    try:
+        chunk = []
+        for row in model.objects.order_by('pk').values_list(*lookups).iterator(chunk_size=batch_size):
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                writer.write(chunk)
+                count += len(chunk)
+                chunk = []
+                if progress is not None:
+                    progress(count, time.perf_counter() - start)
+        if chunk:
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count, time.perf_counter() - start
@@ -0,0 +1,264 @@
+"""
+Result cache for equipment calculations.
+
+Calculation methods on Transformer and TransmissionLine are wrapped with
+``cached_calculation``.  Results are keyed by model, primary key, method,
+arguments and a hash of the input fields the calculation depends on, so an
+edited (even unsaved) instance never reads a stale value.
+
+Lookups go through a bounded in-process LRU first and then through the
+Django cache named by ``CALCULATION_CACHE_ALIAS`` (any backend works,
+including locmem and file-based).  Entries of a row are dropped on
+post_save/post_delete (see signals.py).  ``calculation_cache.stats()``
+reports the hit and miss counters.
+"""
+import copy
+import functools
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+_MISSING = object()
+
+
+class CalculationCache:
+    """
+    Two-level cache: in-process LRU in front of a Django cache backend.
+
+    Args:
+        maxsize: number of entries kept in the in-process LRU
+        alias: Django cache alias used as the shared level, or None to only
+            use the LRU
+        timeout: expiry of shared entries in seconds (None keeps them)
+    """
+
+    def __init__(self, maxsize=10000, alias='default', timeout=None):
+        self.maxsize = maxsize
+        self.alias = alias
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._keys_by_row = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def backend(self):
+        return caches[self.alias] if self.alias else None
+
+    def reset_stats(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stats(self):
+        """Hit/miss counters and the current LRU size."""
+        lookups = self.local_hits + self.shared_hits + self.misses
+        hits = self.local_hits + self.shared_hits
+        return {
+            'hits': hits,
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+    def get_or_compute(self, row, key, compute):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        Args:
+            row: (model label, pk) the entry belongs to
+            key: cache key string
+            compute: zero-argument callable producing the value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+                return entry[1]
+
+        backend = self.backend
+        if backend is not None:
+            value = backend.get(key, _MISSING)
+            if value is not _MISSING:
+                self._remember(row, key, value, 'shared_hits')
+                return value
+
+        value = compute()
+        if backend is not None:
+            backend.set(key, value, self.timeout)
+        self._remember(row, key, value, 'misses')
+        return value
+
+    def get_many(self, rows_by_key):
+        """
+        Look up many keys at once.
+
+        Args:
+            rows_by_key: dictionary of key to the row it belongs to
+
+        Returns:
+            Dictionary of the keys found to their values; the others count
+            as misses and are expected to be computed and passed to
+            store_many()
+        """
+        found = {}
+        with self._lock:
+            for key in rows_by_key:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+            self.local_hits += len(found)
+
+        backend = self.backend
+        missing = [key for key in rows_by_key if key not in found]
+        if backend is not None and missing:
+            shared = backend.get_many(missing)
+            for key, value in shared.items():
+                self._remember(rows_by_key[key], key, value, 'shared_hits')
+            found.update(shared)
+        with self._lock:
+            self.misses += len(rows_by_key) - len(found)
+        return found
+
+    def store_many(self, entries):
+        """
+        Store values computed in a batch.
+
+        Args:
+            entries: iterable of (row, key, value)
+        """
+        entries = list(entries)
+        for row, key, value in entries:
+            self._remember(row, key, value)
+        backend = self.backend
+        if backend is not None and entries:
+            backend.set_many({key: value for _, key, value in entries}, self.timeout)
+
+    def _remember(self, row, key, value, counter=None):
+        """Store an entry in the LRU, counting it under counter if given."""
+        with self._lock:
+            if counter is not None:
+                setattr(self, counter, getattr(self, counter) + 1)
+            self._entries[key] = (row, value)
+            self._entries.move_to_end(key)
+            self._keys_by_row.setdefault(row, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                evicted, (evicted_row, _) = self._entries.popitem(last=False)
+                keys = self._keys_by_row.get(evicted_row)
+                if keys is not None:
+                    keys.discard(evicted)
+                    if not keys:
+                        del self._keys_by_row[evicted_row]
+
+    def invalidate(self, instance):
+        """Drop every entry of a model instance."""
+        row = (instance._meta.label_lower, instance.pk)
+        with self._lock:
+            keys = self._keys_by_row.pop(row, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+        backend = self.backend
+        if backend is not None and keys:
+            backend.delete_many(list(keys))
+
+    def clear(self):
+        """
+        Drop every entry.
+
+        The shared backend is flushed only when it is a dedicated alias;
+        the 'default' cache also holds sessions and other apps' entries, so
+        there only the keys known to this process are deleted.
+        """
+        with self._lock:
+            keys = set(self._entries)
+            for row_keys in self._keys_by_row.values():
+                keys.update(row_keys)
+            self._entries.clear()
+            self._keys_by_row.clear()
+        backend = self.backend
+        if backend is None:
+            return
+        if self.alias != 'default':
+            backend.clear()
+        elif keys:
+            backend.delete_many(list(keys))
+
+
+calculation_cache = CalculationCache(
+    maxsize=getattr(settings, 'CALCULATION_CACHE_SIZE', 10000),
+    alias=getattr(settings, 'CALCULATION_CACHE_ALIAS', 'default'),
+    timeout=getattr(settings, 'CALCULATION_CACHE_TIMEOUT', None),
+)
+
+
+def calculation_key(model, pk, method, arguments, fields, inputs):
+    """
+    Cache row and key of one calculation, as used by cached_calculation.
+
+    Batch code computing the same method for many rows uses this to share
+    entries with the model method.
+
+    Args:
+        model: model class or instance
+        method: name of the calculation method
+        arguments: the method's arguments other than self
+        fields: names of the input fields
+        inputs: their values, in the same order
+
+    Returns:
+        ((model label, pk), key)
+    """
+    options = model._meta
+    # to_python normalizes e.g. an int assigned to a FloatField
+    normalized = repr(tuple(options.get_field(field).to_python(value) for field, value in zip(fields, inputs)))
+    digest = hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+    arguments = ','.join(str(value) for value in arguments)
+    label = options.label_lower
+    return (label, pk), f'calc:{label}:{pk}:{method}:{arguments}:{digest}'
+
+
+def cached_calculation(*fields):
+    """
+    Cache a model method's result in ``calculation_cache``.
+
+    Args:
+        *fields: names of the model fields the calculation depends on
+
+    Instances without a primary key are computed directly.  Dictionary
+    results are copied so callers can't modify the cached value.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.pk is None:
+                return method(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple(bound.arguments.values())[1:]
+            inputs = [getattr(self, field) for field in fields]
+            row, key = calculation_key(self, self.pk, method.__name__, arguments, fields, inputs)
+
+            value = calculation_cache.get_or_compute(row, key, lambda: method(self, *args, **kwargs))
+            if isinstance(value, dict):
+                return copy.copy(value)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,308 @@
+"""
+Vectorized equipment calculations.
+
+Array versions of the calculation methods on Transformer and
+TransmissionLine, for computing many rows at once.  Each function takes the
+model's input fields as equal-length arrays and returns a dictionary of
+arrays with the same values (including rounding) as the model methods.
+
+Unbalanced faults use the symmetrical component networks of the faulted
+terminal, with E = V / √3 and the sequence impedances Z1, Z2, Z0:
+
+    three-phase                  I = |E / Z1|
+    line-to-ground               I = |3 E / (Z1 + Z2 + Z0)|
+    line-to-line                 I = √3 |E / (Z1 + Z2)|
+    double line-to-ground        I1 = E / (Z1 + Z2 ∥ Z0), I2 = -I1 Z0 / (Z2 + Z0),
+                                 I0 = -I1 Z2 / (Z2 + Z0), I = max(|Ib|, |Ic|)
+                                 with Ib = I0 + a² I1 + a I2, Ic = I0 + a I1 + a² I2
+
+and the earth current of the double line-to-ground fault is |3 I0|.  Where
+the zero-sequence network is open at the fault (an unearthed winding, or an
+earthed star winding with an unearthed star on the other side) Z0 is
+infinite: the line-to-ground current is 0 and the double line-to-ground
+fault behaves as a line-to-line fault.
+"""
+import math
+import re
+
+import numpy as np
+
+from protectioncalculator.instrumentation import instrumented
+
+
+SQRT3 = math.sqrt(3)
+# Operator a = 1∠120°
+A = np.exp(2j * np.pi / 3)
+
+# Zero-sequence impedance in multiples of the positive-sequence impedance,
+# used when zero_sequence_impedance is blank
+TRANSFORMER_ZERO_SEQUENCE_RATIO = 1.0
+LINE_ZERO_SEQUENCE_RATIO = 3.0
+
+SEQUENCE_FAULTS = ('three_phase', 'line_to_ground', 'line_to_line', 'double_line_to_ground', 'ground_current')
+TRANSFORMER_SEQUENCE_FIELDS = ('kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance',
+                               'negative_sequence_impedance', 'zero_sequence_impedance', 'phase_type',
+                               'vector_group')
+LINE_SEQUENCE_FIELDS = ('kva_rating', 'voltage_rating', 'impedance', 'negative_sequence_impedance',
+                        'zero_sequence_impedance', 'phase_type')
+
+_WINDINGS = re.compile(r'^(YN|Y|D|ZN|Z)(yn|y|d|zn|z)')
+
+
+def transformer_arrays(transformers):
+    """Pack the input fields of Transformer instances into arrays."""
+    transformers = list(transformers)
+    return {
+        'kva_rating': np.array([item.kva_rating for item in transformers], dtype=float),
+        'primary_voltage': np.array([item.primary_voltage for item in transformers], dtype=float),
+        'secondary_voltage': np.array([item.secondary_voltage for item in transformers], dtype=float),
+        'impedance': np.array([item.impedance for item in transformers], dtype=float),
+        'three_phase': np.array([item.phase_type == 'three' for item in transformers], dtype=bool),
+    }
+
+
+def line_arrays(lines):
+    """Pack the input fields of TransmissionLine instances into arrays."""
+    lines = list(lines)
+    return {
+        'kva_rating': np.array([item.kva_rating for item in lines], dtype=float),
+        'voltage_rating': np.array([item.voltage_rating for item in lines], dtype=float),
+        'impedance': np.array([item.impedance for item in lines], dtype=float),
+        'three_phase': np.array([item.phase_type == 'three' for item in lines], dtype=bool),
+    }
+
+
+def transformer_column_arrays(columns):
+    """Pack transformer columns of a FleetTable (see FleetTable.select) into arrays."""
+    return {
+        'kva_rating': columns['kva_rating'].astype(float),
+        'primary_voltage': columns['primary_voltage'].astype(float),
+        'secondary_voltage': columns['secondary_voltage'].astype(float),
+        'impedance': columns['impedance'].astype(float),
+        'three_phase': columns['phase_type'] == 'three',
+    }
+
+
+def line_column_arrays(columns):
+    """Pack transmission line columns of a FleetTable (see FleetTable.select) into arrays."""
+    return {
+        'kva_rating': columns['kva_rating'].astype(float),
+        'voltage_rating': columns['voltage_rating'].astype(float),
+        'impedance': columns['impedance'].astype(float),
+        'three_phase': columns['phase_type'] == 'three',
+    }
+
+
+@instrumented
+def transformer_ratings(kva_rating, primary_voltage, secondary_voltage, impedance, three_phase):
+    """
+    Full load current, base impedance, impedance in ohms and fault current
+    of many transformers, for both sides.
+
+    Returns:
+        Dictionary with keys like 'primary_full_load_current' and
+        'secondary_fault_current' (the names of the stored rating columns)
+    """
+    va_rating = kva_rating * 1000
+    mva_rating = kva_rating / 1000
+    phase_factor = np.where(three_phase, SQRT3, 1.0)
+
+    ratings = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for side, voltage in (('primary', primary_voltage), ('secondary', secondary_voltage)):
+            base_impedance = (voltage / 1000) ** 2 / mva_rating
+            impedance_ohms = (impedance / 100) * base_impedance
+            fault_current = voltage / (phase_factor * impedance_ohms)
+            ratings[f'{side}_full_load_current'] = va_rating / (phase_factor * voltage)
+            ratings[f'{side}_base_impedance'] = base_impedance
+            ratings[f'{side}_impedance_ohms'] = impedance_ohms
+            # Three-phase results are rounded to whole amperes, single-phase to 0.1 A
+            ratings[f'{side}_fault_current'] = np.where(
+                three_phase, np.round(fault_current), np.round(fault_current, 1))
+    return ratings
+
+
+@instrumented
+def line_ratings(kva_rating, voltage_rating, impedance, three_phase):
+    """
+    Full load current, base impedance, impedance in ohms and fault current
+    of many transmission lines.
+
+    Returns:
+        Dictionary keyed by the names of the stored rating columns
+    """
+    phase_factor = np.where(three_phase, SQRT3, 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        full_load_current = kva_rating * 1000 / (phase_factor * voltage_rating)
+        base_impedance = (voltage_rating / 1000) ** 2 / (kva_rating / 1000)
+        impedance_ohms = (impedance / 100) * base_impedance
+        fault_current = voltage_rating / (phase_factor * impedance_ohms)
+    return {
+        # Three-phase full load current is rounded to whole amperes
+        'full_load_current': np.where(three_phase, np.round(full_load_current), full_load_current),
+        'base_impedance': base_impedance,
+        'impedance_ohms': impedance_ohms,
+        'fault_current': np.round(fault_current),
+    }
+
+
+def _optional(values):
+    """Float array of nullable field values, NaN for None."""
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def transformer_sequence_arrays(rows):
+    """Pack (TRANSFORMER_SEQUENCE_FIELDS) tuples of transformers into arrays."""
+    columns = list(zip(*rows)) if rows else [()] * len(TRANSFORMER_SEQUENCE_FIELDS)
+    kva, primary, secondary, impedance, negative, zero, phase_type, vector_group = columns
+    return {
+        'kva_rating': np.array(kva, dtype=float),
+        'primary_voltage': np.array(primary, dtype=float),
+        'secondary_voltage': np.array(secondary, dtype=float),
+        'impedance': np.array(impedance, dtype=float),
+        'negative_sequence_impedance': _optional(negative),
+        'zero_sequence_impedance': _optional(zero),
+        'three_phase': np.array([value == 'three' for value in phase_type], dtype=bool),
+        'vector_group': np.array(vector_group, dtype=object),
+    }
+
+
+def line_sequence_arrays(rows):
+    """Pack (LINE_SEQUENCE_FIELDS) tuples of transmission lines into arrays."""
+    columns = list(zip(*rows)) if rows else [()] * len(LINE_SEQUENCE_FIELDS)
+    kva, voltage, impedance, negative, zero, phase_type = columns
+    return {
+        'kva_rating': np.array(kva, dtype=float),
+        'voltage_rating': np.array(voltage, dtype=float),
+        'impedance': np.array(impedance, dtype=float),
+        'negative_sequence_impedance': _optional(negative),
+        'zero_sequence_impedance': _optional(zero),
+        'three_phase': np.array([value == 'three' for value in phase_type], dtype=bool),
+    }
+
+
+def zero_sequence_path(vector_group, side):
+    """
+    Whether a fault at one side of a transformer has a zero-sequence path.
+
+    The source is taken to be a solidly earthed system on the other side.
+    An earthed zigzag winding always provides a path; an earthed star
+    winding provides one when the other winding is a delta or is earthed
+    too.
+    """
+    match = _WINDINGS.match(vector_group or '')
+    if match is None:
+        return False
+    primary, secondary = match.group(1).lower(), match.group(2)
+    faulted, other = (primary, secondary) if side == 'primary' else (secondary, primary)
+    if faulted == 'zn':
+        return True
+    return faulted == 'yn' and other in ('d', 'yn', 'zn')
+
+
+def sequence_fault_currents(voltage, z1, z2, z0, earthed):
+    """
+    Fault currents at terminals with the given sequence impedances.
+
+    Args:
+        voltage: line-to-line voltages in volts
+        z1, z2, z0: complex sequence impedances in ohms
+        earthed: bool array, False where the zero-sequence network is open
+
+    Returns:
+        Dictionary of SEQUENCE_FAULTS to unrounded current magnitudes in
+        amperes
+    """
+    e = voltage / SQRT3 + 0j
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parallel = np.where(earthed, z2 * z0 / (z2 + z0), z2)
+        i1 = e / (z1 + parallel)
+        i2 = -i1 * parallel / z2
+        i0 = np.where(earthed, -i1 * parallel / z0, 0)
+        return {
+            'three_phase': np.abs(e / z1),
+            'line_to_ground': np.where(earthed, np.abs(3 * e / (z1 + z2 + z0)), 0.0),
+            'line_to_line': SQRT3 * np.abs(e / (z1 + z2)),
+            'double_line_to_ground': np.maximum(np.abs(i0 + A ** 2 * i1 + A * i2),
+                                                np.abs(i0 + A * i1 + A ** 2 * i2)),
+            'ground_current': np.abs(3 * i0),
+        }
+
+
+def _sequence_impedances(impedance, negative, zero, zero_ratio, base_impedance):
+    """Sequence reactances in ohms; blank values take their defaults."""
+    negative = np.where(np.isnan(negative), impedance, negative)
+    zero = np.where(np.isnan(zero), impedance * zero_ratio, zero)
+    return tuple(1j * (percent / 100) * base_impedance for percent in (impedance, negative, zero))
+
+
+def _single_phase(results, three_phase, single_phase_current, decimals):
+    """
+    Round three-phase results to whole amperes and replace single-phase
+    rows: their only fault is V / Z, reported as line_to_ground.
+    """
+    rounded = {}
+    for fault, currents in results.items():
+        if fault == 'line_to_ground':
+            single = np.round(single_phase_current, decimals)
+        else:
+            single = np.nan
+        rounded[fault] = np.where(three_phase, np.round(currents), single)
+    return rounded
+
+
+@instrumented
+def transformer_sequence_faults(kva_rating, primary_voltage, secondary_voltage, impedance,
+                                negative_sequence_impedance, zero_sequence_impedance, three_phase,
+                                vector_group, side='primary'):
+    """
+    Three-phase, line-to-ground, line-to-line and double line-to-ground
+    fault currents at one side of many transformers.
+
+    Three-phase results equal calculate_fault_current().  Single-phase
+    transformers only have the line-to-ground value (V / Z, rounded to
+    0.1 A like calculate_fault_current()); their other results are NaN.
+
+    Returns:
+        Dictionary of SEQUENCE_FAULTS to arrays of amperes
+    """
+    voltage = primary_voltage if side == 'primary' else secondary_voltage
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base_impedance = (voltage / 1000) ** 2 / (kva_rating / 1000)
+        single_phase_current = voltage / ((impedance / 100) * base_impedance)
+    z1, z2, z0 = _sequence_impedances(impedance, negative_sequence_impedance, zero_sequence_impedance,
+                                      TRANSFORMER_ZERO_SEQUENCE_RATIO, base_impedance)
+    # Few distinct vector groups: decide the path once per group
+    groups, inverse = np.unique(np.asarray(vector_group, dtype=str), return_inverse=True)
+    earthed = np.array([zero_sequence_path(group, side) for group in groups], dtype=bool)[inverse]
+    results = sequence_fault_currents(voltage, z1, z2, z0, earthed.reshape(np.shape(voltage)))
+    return _single_phase(results, three_phase, single_phase_current, 1)
+
+
+@instrumented
+def line_sequence_faults(kva_rating, voltage_rating, impedance, negative_sequence_impedance,
+                         zero_sequence_impedance, three_phase):
+    """
+    Three-phase, line-to-ground, line-to-line and double line-to-ground
+    fault currents of many transmission lines, on an earthed system.
+
+    Three-phase results equal calculate_fault_current(); single-phase lines
+    only have the line-to-ground value (V / Z).
+
+    Returns:
+        Dictionary of SEQUENCE_FAULTS to arrays of amperes
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base_impedance = (voltage_rating / 1000) ** 2 / (kva_rating / 1000)
+        single_phase_current = voltage_rating / ((impedance / 100) * base_impedance)
+    z1, z2, z0 = _sequence_impedances(impedance, negative_sequence_impedance, zero_sequence_impedance,
+                                      LINE_ZERO_SEQUENCE_RATIO, base_impedance)
+    results = sequence_fault_currents(voltage_rating, z1, z2, z0, np.ones(np.shape(voltage_rating), dtype=bool))
+    return _single_phase(results, three_phase, single_phase_current, 0)
+
+
+def sequence_rows(results):
+    """Per-row dictionaries of sequence fault results, None for NaN."""
+    columns = [[None if value != value else value for value in results[fault].tolist()]
+               for fault in SEQUENCE_FAULTS]
+    return [dict(zip(SEQUENCE_FAULTS, values)) for values in zip(*columns)]
@@ -0,0 +1,260 @@
+"""
+Stored fault levels with incremental updates.
+
+``Bus.fault_current`` holds the three-phase fault level of every bus.  A full
+study (``refresh_fault_levels(full=True)`` or ``manage.py
+calculate_fault_levels``) builds the network, factorizes Ybus and stores the
+results.
+
+Saving or deleting a Transformer or TransmissionLine marks its branch dirty
+(see signals.py) and refreshes the stored levels when the transaction
+commits; a process that hasn't loaded a study yet runs a full one on that
+first refresh.  After that, on refresh, each dirty branch becomes a
+rank-1 change of Ybus, Y' = Y + sum(dy_m a_m a_m^T) with a_m = e_i - e_j,
+and the Zbus diagonal is corrected with the Woodbury identity
+
+    Z' = Z - W (C^-1 + A^T W)^-1 W^T,    W = Z A
+
+using k solves against the existing factorization instead of a new study.
+Changes that alter the set of buses or energized islands, or that pile up
+beyond ``max_rank``, fall back to a full rebuild.
+
+The loaded study only knows about this process's changes.  Every change
+also increments the ``NetworkVersion`` row in the saving transaction; a
+refresh locks that row, and when its version isn't the study's version plus
+the changes made here (another process saved a bus or branch, or a save
+was rolled back), the study is rebuilt from the database before anything
+is stored.  Stored levels also set ``Bus.updated_at``, so fleet tables (see
+protectioncalculator.fleet) pick them up.
+"""
+import threading
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Bus, NetworkVersion, Transformer, TransmissionLine
+from .network import Network, ShortCircuitSolver, line_branch, transformer_branch
+
+
+class IncrementalShortCircuit:
+    """
+    A factorized network that accepts branch changes as low-rank updates.
+
+    Args:
+        network: Network to factorize
+        max_rank: number of pending branch updates before refactorizing is
+            preferred
+    """
+
+    def __init__(self, network, max_rank=32):
+        self.network = network
+        self.max_rank = max_rank
+        self.solver = ShortCircuitSolver(network)
+        self.base_driving_point = self.solver.driving_point_impedances()
+        self._admittance = 1 / network.branch_impedance
+        # Branch key -> (from bus pk, to bus pk, impedance) or None if removed
+        self._changes = {}
+        self._driving_point = self.base_driving_point
+
+    @property
+    def rank(self):
+        return len(self._incidence())
+
+    def change_branch(self, key, branch):
+        """
+        Replace a branch by a new value.
+
+        Args:
+            key: (kind, pk) of the branch
+            branch: new (kind, pk, from_bus_pk, to_bus_pk, impedance_pu) tuple,
+                or None when the branch was removed or disconnected
+
+        Returns:
+            False if the change cannot be applied incrementally
+        """
+        position = self.solver.position
+        bus_index = self.network.bus_index
+        if branch is not None:
+            for bus in branch[2:4]:
+                if bus not in bus_index or position[bus_index[bus]] < 0:
+                    return False
+        self._changes[key] = None if branch is None else branch[2:]
+        return self._update()
+
+    def _incidence(self):
+        """Rank-1 terms (i, j, dy) of the pending changes, in energized positions."""
+        terms = []
+        network = self.network
+        position = self.solver.position
+        for key, change in self._changes.items():
+            index = network.branch_index.get(key)
+            if index is not None:
+                terms.append((position[network.branch_from[index]],
+                              position[network.branch_to[index]],
+                              -self._admittance[index]))
+            if change is not None:
+                from_bus, to_bus, impedance = change
+                terms.append((position[network.bus_index[from_bus]],
+                              position[network.bus_index[to_bus]],
+                              1 / impedance))
+        return [term for term in terms if term[0] != term[1] and term[2] != 0]
+
+    def _update(self):
+        terms = self._incidence()
+        if len(terms) > self.max_rank:
+            return False
+        if not terms:
+            self._driving_point = self.base_driving_point
+            return True
+
+        count = self.solver.energized.size
+        incidence = np.zeros((count, len(terms)), dtype=complex)
+        columns = np.arange(len(terms))
+        incidence[[term[0] for term in terms], columns] = 1
+        incidence[[term[1] for term in terms], columns] = -1
+        delta = np.array([term[2] for term in terms], dtype=complex)
+
+        projected = self.solver.solve(incidence)  # W = Z A
+        capacitance = np.diag(1 / delta) + incidence.T @ projected
+        if np.linalg.cond(capacitance) > 1e12:
+            # The change islands part of the network
+            return False
+        correction = np.einsum('ik,ki->i', projected, np.linalg.solve(capacitance, projected.T))
+
+        driving_point = self.base_driving_point.copy()
+        driving_point[self.solver.energized] -= correction
+        self._driving_point = driving_point
+        return True
+
+    def fault_currents(self):
+        """Three-phase fault current at every bus in amperes (NaN if dead)."""
+        return (self.solver.prefault_voltage / np.abs(self._driving_point)
+                * self.network.base_current())
+
+
+_lock = threading.Lock()
+_study = None
+# NetworkVersion the study is up to date with, and versions added here since
+_study_version = None
+_changes = 0
+_dirty = set()
+_rebuild = False
+
+
+def _increment_version():
+    if not NetworkVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        NetworkVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def _current_version():
+    """The NetworkVersion, locked until the transaction ends."""
+    version = NetworkVersion.objects.select_for_update().filter(pk=1).values_list('version', flat=True).first()
+    return version or 0
+
+
+def mark_dirty(kind, pk):
+    """Record that a branch ('tra' or 'line', pk) changed."""
+    global _changes
+    _increment_version()
+    with _lock:
+        _dirty.add((kind, pk))
+        _changes += 1
+
+
+def mark_rebuild():
+    """Record a change (e.g. to a bus, or a bulk import) that needs a full study."""
+    global _rebuild, _changes
+    _increment_version()
+    with _lock:
+        _rebuild = True
+        _changes += 1
+
+
+def schedule_refresh():
+    """
+    Refresh stored fault levels when the current transaction commits.
+
+    A process without a loaded study (e.g. a web or admin process) runs a
+    full study on its first refresh and applies later changes to it
+    incrementally.
+    """
+    transaction.on_commit(_refresh_pending)
+
+
+def _refresh_pending():
+    # Every save in a transaction schedules a refresh; the first one applies
+    # all pending changes
+    with _lock:
+        pending = _dirty or _rebuild or _study is None
+    if pending:
+        refresh_fault_levels()
+
+
+def _load_branch(kind, pk, base_mva):
+    if kind == 'tra':
+        row = Transformer.objects.filter(
+            pk=pk, primary_bus__isnull=False, secondary_bus__isnull=False).first()
+        return None if row is None else transformer_branch(row, base_mva)
+    row = TransmissionLine.objects.filter(pk=pk, from_bus__isnull=False, to_bus__isnull=False).first()
+    return None if row is None else line_branch(row, base_mva)
+
+
+def refresh_fault_levels(full=False, base_mva=100):
+    """
+    Bring Bus.fault_current up to date.
+
+    Applies the pending branch changes to the loaded study as low-rank
+    updates, or runs a full study when none is loaded, when ``full`` is set,
+    when other processes changed the network since the study was loaded or
+    when a change cannot be applied incrementally.
+
+    Returns:
+        Number of Bus rows whose stored fault level changed
+    """
+    with transaction.atomic():
+        # Lock the version before _lock: mark_dirty increments it first
+        version = _current_version()
+        with _lock:
+            return _refresh(version, full, base_mva)
+
+
+def _refresh(version, full, base_mva):
+    global _study, _study_version, _changes, _rebuild
+
+    dirty = set(_dirty)
+    _dirty.difference_update(dirty)
+    rebuild = (full or _rebuild or _study is None or _study.network.base_mva != base_mva
+               or version != _study_version + _changes)
+    _rebuild = False
+    _changes = 0
+
+    if not rebuild:
+        for key in dirty:
+            if not _study.change_branch(key, _load_branch(*key, base_mva)):
+                rebuild = True
+                break
+    if rebuild:
+        _study = IncrementalShortCircuit(Network.from_database(base_mva))
+    _study_version = version
+
+    return _store(_study.network.buses, _study.fault_currents())
+
+
+def _store(buses, currents):
+    changed = []
+    for bus, current in zip(buses, currents):
+        value = None if np.isnan(current) else float(current)
+        if value is None and bus.fault_current is None:
+            continue
+        if value is not None and bus.fault_current is not None and np.isclose(value, bus.fault_current, rtol=1e-9):
+            continue
+        bus.fault_current = value
+        changed.append(bus)
+    # bulk_update skips auto_now: set the change marker read by fleet tables
+    now = timezone.now()
+    for bus in changed:
+        bus.updated_at = now
+    Bus.objects.bulk_update(changed, ['fault_current', 'updated_at'], batch_size=1000)
+    return len(changed)
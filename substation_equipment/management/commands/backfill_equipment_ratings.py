@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from substation_equipment.models import Transformer, TransmissionLine
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the stored rating columns of every transformer and transmission line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows read and updated per batch (default 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Transformer, TransmissionLine):
+            start = time.perf_counter()
+            count = 0
+            batch = []
+            for row in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+                row.update_computed_fields()
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += self._write(model, batch)
+                    batch = []
+            if batch:
+                count += self._write(model, batch)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: updated {count} rows in {elapsed:.2f} s'))
+
+    def _write(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, model.COMPUTED_FIELDS)
+        return len(batch)
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from substation_equipment.fault_levels import refresh_fault_levels
+
+
+class Command(BaseCommand):
+    help = 'Run a full short-circuit study and store the fault level of every bus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-mva', type=float, default=100, help='System MVA base (default 100)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        changed = refresh_fault_levels(full=True, base_mva=options['base_mva'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {changed} bus fault levels in {elapsed:.2f} s'))
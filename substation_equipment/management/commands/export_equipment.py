@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from substation_equipment.bulk import FORMATS, MODELS, BulkError, export_rows, get_model, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Stream every row of a model to a CSV, JSON Lines or Parquet file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(MODELS), help='Model to export')
+        parser.add_argument('path', help='File to write')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows fetched and written per batch (default 1000)')
+
+    def handle(self, *args, **options):
+        try:
+            model = get_model(options['model'])
+            file_format = guess_format(options['path'], options['format'])
+            count, elapsed = export_rows(
+                model, options['path'], file_format,
+                batch_size=options['batch_size'],
+                progress=self._progress if options['verbosity'] > 1 else None,
+            )
+        except (BulkError, OSError) as error:
+            raise CommandError(error)
+
+        rate = count / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} rows in {elapsed:.2f} s ({rate:.0f} rows/s)'))
+
+    def _progress(self, count, elapsed):
+        self.stdout.write(f'{count} rows written, {count / elapsed:.0f} rows/s')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from substation_equipment import fault_levels
+from substation_equipment.bulk import FORMATS, MODELS, BulkError, get_model, guess_format, import_rows
+
+
+class Command(BaseCommand):
+    help = ('Stream rows from a CSV, JSON Lines or Parquet file into a model, '
+            'inserting new names and updating existing ones.  Importing buses, transformers '
+            'or lines finishes with a full short-circuit study of the stored bus fault levels.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(MODELS), help='Model to import into')
+        parser.add_argument('path', help='File to read')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows validated and written per transaction (default 1000)')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Skip invalid rows instead of stopping at the first invalid chunk')
+
+    def handle(self, *args, **options):
+        try:
+            model = get_model(options['model'])
+            file_format = guess_format(options['path'], options['format'])
+            result = import_rows(
+                model, options['path'], file_format,
+                batch_size=options['batch_size'],
+                skip_invalid=options['skip_invalid'],
+                progress=self._progress if options['verbosity'] > 1 else None,
+            )
+        except (BulkError, OSError) as error:
+            raise CommandError(error)
+
+        if options['model'] != 'relay' and result.written:
+            # bulk_create skips the save signals: tell other processes their
+            # studies are out of date, and run a full one here
+            fault_levels.mark_rebuild()
+            changed = fault_levels.refresh_fault_levels(full=True)
+            self.stdout.write(f'Updated {changed} bus fault levels')
+
+        for number, messages in result.errors:
+            self.stderr.write(f'Row {number}: {messages}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.written} of {result.rows} rows in {result.elapsed:.2f} s '
+            f'({result.rate:.0f} rows/s)'))
+
+    def _progress(self, result):
+        self.stdout.write(f'{result.rows} rows read, {result.rate:.0f} rows/s')
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('voltage', models.FloatField()),
+                ('source_mva', models.FloatField(blank=True, null=True)),
+                ('source_x_r', models.FloatField(default=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='primary_bus',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='substation_equipment.bus'),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='secondary_bus',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='substation_equipment.bus'),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='from_bus',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='substation_equipment.bus'),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='to_bus',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='substation_equipment.bus'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0002_network_buses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bus',
+            name='fault_current',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0003_bus_fault_current'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transformer',
+            name='primary_base_impedance',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='primary_fault_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='primary_full_load_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='primary_impedance_ohms',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='secondary_base_impedance',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='secondary_fault_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='secondary_full_load_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='secondary_impedance_ohms',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='base_impedance',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='fault_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='full_load_current',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='impedance_ohms',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
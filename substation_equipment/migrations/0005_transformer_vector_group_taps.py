@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:06
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0004_computed_ratings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transformer',
+            name='tap_max',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='tap_min',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='vector_group',
+            field=models.CharField(default='Dyn11', max_length=8, validators=[django.core.validators.RegexValidator('^(YN|Y|D|ZN|Z)(yn|y|d|zn|z)(0|1|2|3|4|5|6|7|8|9|10|11)$', 'Enter a vector group such as Dyn11 or YNd1.')]),
+        ),
+    ]
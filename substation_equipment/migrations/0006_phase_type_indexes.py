@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0005_transformer_vector_group_taps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transformer',
+            name='phase_type',
+            field=models.CharField(choices=[('single', 'Single-Phase'), ('three', 'Three-Phase')], db_index=True, default='three', max_length=6),
+        ),
+        migrations.AlterField(
+            model_name='transmissionline',
+            name='phase_type',
+            field=models.CharField(choices=[('single', 'Single-Phase'), ('three', 'Three-Phase')], db_index=True, default='three', max_length=6),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0006_phase_type_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transformer',
+            name='negative_sequence_impedance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformer',
+            name='zero_sequence_impedance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='negative_sequence_impedance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transmissionline',
+            name='zero_sequence_impedance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
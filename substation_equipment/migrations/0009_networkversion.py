@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    apps.get_model('substation_equipment', 'NetworkVersion').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('substation_equipment', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
+from django.core.validators import RegexValidator
 from django.db import models
 import math
+
+from protectioncalculator.instrumentation import instrumented
+
+from .cache import cached_calculation
+from .calculations import (
+    LINE_SEQUENCE_FIELDS, TRANSFORMER_SEQUENCE_FIELDS, line_sequence_arrays, line_sequence_faults,
+    sequence_rows, transformer_sequence_arrays, transformer_sequence_faults,
+)
 # Create your models here.
 
 
@@ -12,6 +21,29 @@ PHASE_CHOICES = [
        ('single', 'Single-Phase'),
        ('three', 'Three-Phase'),
 ]
+# IEC 60076-1 vector group, e.g. 'Dyn11' or 'YNd1'
+VECTOR_GROUP_VALIDATOR = RegexValidator(
+    r'^(YN|Y|D|ZN|Z)(yn|y|d|zn|z)(0|1|2|3|4|5|6|7|8|9|10|11)$',
+    'Enter a vector group such as Dyn11 or YNd1.')
+
+class Bus(models.Model):
+    """
+    A node of the network that transformers and lines connect to.
+
+    A bus with a source_mva is fed by an external grid with that
+    short-circuit level.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    voltage = models.FloatField()  # Nominal voltage in volts
+    source_mva = models.FloatField(blank=True, null=True)  # Grid infeed short-circuit level in MVA
+    source_x_r = models.FloatField(default=10)  # X/R ratio of the grid infeed
+    fault_current = models.FloatField(blank=True, null=True, editable=False)  # Stored three-phase fault level in amperes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Change marker read by protectioncalculator.fleet
+
+    def __str__(self):
+        return self.name
+
+
 class Transformer(models.Model):
 
 
@@ -20,8 +52,64 @@ class Transformer(models.Model):
     primary_voltage = models.FloatField()
     secondary_voltage = models.FloatField()
     impedance = models.FloatField()  # Impedance in percentage
-    phase_type = models.CharField(max_length=6, choices=PHASE_CHOICES, default='three')
+    # Sequence impedances in percentage; blank means equal to impedance (negative)
+    # or calculations.TRANSFORMER_ZERO_SEQUENCE_RATIO × impedance (zero)
+    negative_sequence_impedance = models.FloatField(blank=True, null=True)
+    zero_sequence_impedance = models.FloatField(blank=True, null=True)
+    phase_type = models.CharField(max_length=6, choices=PHASE_CHOICES, default='three', db_index=True)
+    primary_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    secondary_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    vector_group = models.CharField(max_length=8, default='Dyn11', validators=[VECTOR_GROUP_VALIDATOR])
+    tap_min = models.FloatField(default=0)  # Lowest tap position in percent of nominal ratio
+    tap_max = models.FloatField(default=0)  # Highest tap position in percent of nominal ratio
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Change marker read by protectioncalculator.fleet
+
+    # Computed ratings, kept up to date by save() and the
+    # backfill_equipment_ratings command so they can be filtered in SQL
+    primary_full_load_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    secondary_full_load_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    primary_base_impedance = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    secondary_base_impedance = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    primary_impedance_ohms = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    secondary_impedance_ohms = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    primary_fault_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    secondary_fault_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+
+    COMPUTED_FIELDS = [
+        'primary_full_load_current', 'secondary_full_load_current',
+        'primary_base_impedance', 'secondary_base_impedance',
+        'primary_impedance_ohms', 'secondary_impedance_ohms',
+        'primary_fault_current', 'secondary_fault_current',
+    ]
+
+    def save(self, *args, **kwargs):
+        self.update_computed_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.COMPUTED_FIELDS)
+        super().save(*args, **kwargs)
+
+    def update_computed_fields(self):
+        """
+        Refresh the computed rating columns from the current field values.
 
+        Columns are set to None when the ratings can't be calculated (e.g. a
+        zero kVA rating).
+        """
+        try:
+            full_load_current = self.calculate_full_load_current()
+            self.primary_full_load_current = full_load_current['primary']
+            self.secondary_full_load_current = full_load_current['secondary']
+            for side in ('primary', 'secondary'):
+                setattr(self, f'{side}_base_impedance', self.calculate_base_impedance(side))
+                setattr(self, f'{side}_impedance_ohms', self.calculate_impedance_ohms(side))
+                setattr(self, f'{side}_fault_current', self.calculate_fault_current(side))
+        except (TypeError, ZeroDivisionError):
+            for field in self.COMPUTED_FIELDS:
+                setattr(self, field, None)
+
+    @instrumented
+    @cached_calculation('kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance', 'phase_type')
     def calculate_full_load_current(self):
         """
         Calculate the full load current on both primary and secondary sides.
@@ -50,6 +138,8 @@ class Transformer(models.Model):
             'secondary': secondary_current
         }
 
+    @instrumented
+    @cached_calculation('kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance', 'phase_type')
     def calculate_base_impedance(self, side='primary'):
         """
         Calculate the base impedance in ohms.
@@ -77,6 +167,8 @@ class Transformer(models.Model):
 
         return base_impedance
 
+    @instrumented
+    @cached_calculation('kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance', 'phase_type')
     def calculate_impedance_ohms(self, side='primary'):
         """
         Convert the percentage impedance to ohms.
@@ -90,6 +182,8 @@ class Transformer(models.Model):
 
         return impedance_ohms
 
+    @instrumented
+    @cached_calculation('kva_rating', 'primary_voltage', 'secondary_voltage', 'impedance', 'phase_type')
     def calculate_fault_current(self, side='primary'):
         """
         Calculate the fault current based on transformer specifications.
@@ -123,6 +217,28 @@ class Transformer(models.Model):
             fault_current = voltage / impedance_ohms
             return round(fault_current, 1)
 
+    @instrumented
+    @cached_calculation(*TRANSFORMER_SEQUENCE_FIELDS)
+    def calculate_sequence_fault_currents(self, side='primary'):
+        """
+        Calculate the fault currents of every fault type at one side from
+        the sequence impedances.
+
+        See calculations.transformer_sequence_faults; fleet-wide results
+        come from sequence.fleet_sequence_faults, which shares this cache.
+
+        Args:
+            side: 'primary' or 'secondary' to specify the faulted side
+
+        Returns:
+            Dictionary with 'three_phase', 'line_to_ground', 'line_to_line',
+            'double_line_to_ground' and 'ground_current' in amperes (None
+            where the fault type doesn't apply)
+        """
+        inputs = tuple(getattr(self, field) for field in TRANSFORMER_SEQUENCE_FIELDS)
+        results = transformer_sequence_faults(**transformer_sequence_arrays([inputs]), side=side)
+        return sequence_rows(results)[0]
+
     def __str__(self):
         return self.name
 
@@ -132,14 +248,54 @@ class TransmissionLine(models.Model):
     kva_rating = models.IntegerField()
     voltage_rating = models.FloatField()
     impedance = models.FloatField()  # Impedance in percentage
+    # Sequence impedances in percentage; blank means equal to impedance (negative)
+    # or calculations.LINE_ZERO_SEQUENCE_RATIO × impedance (zero)
+    negative_sequence_impedance = models.FloatField(blank=True, null=True)
+    zero_sequence_impedance = models.FloatField(blank=True, null=True)
     length = models.FloatField(default=0)  # Length in km
     r_per_km = models.FloatField(default=0)  # Resistance per km in ohms
     x_per_km = models.FloatField(default=0)  # Reactance per km in ohms
-    phase_type = models.CharField(max_length=6, choices=[('single','Single-Phase'),('three','Three-Phase')], default='three')
+    phase_type = models.CharField(max_length=6, choices=[('single','Single-Phase'),('three','Three-Phase')], default='three', db_index=True)
+    from_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    to_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Change marker read by protectioncalculator.fleet
+
+    # Computed ratings, kept up to date by save() and the
+    # backfill_equipment_ratings command so they can be filtered in SQL
+    full_load_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    base_impedance = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    impedance_ohms = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+    fault_current = models.FloatField(blank=True, null=True, editable=False, db_index=True)
+
+    COMPUTED_FIELDS = ['full_load_current', 'base_impedance', 'impedance_ohms', 'fault_current']
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.update_computed_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.COMPUTED_FIELDS)
+        super().save(*args, **kwargs)
+
+    def update_computed_fields(self):
+        """
+        Refresh the computed rating columns from the current field values.
+
+        Columns are set to None when the ratings can't be calculated (e.g. a
+        zero kVA rating).
+        """
+        try:
+            self.full_load_current = self.calculate_full_load_current()
+            self.base_impedance = self.calculate_base_impedance()
+            self.impedance_ohms = self.calculate_impedance_ohms()
+            self.fault_current = self.calculate_fault_current()
+        except (TypeError, ZeroDivisionError):
+            for field in self.COMPUTED_FIELDS:
+                setattr(self, field, None)
+
+    @instrumented
     def calculate_impedance_from_parameters(self):
         """
         Calculate the impedance based on line parameters.
@@ -154,6 +310,8 @@ class TransmissionLine(models.Model):
             'angle': angle
         }
 
+    @instrumented
+    @cached_calculation('kva_rating', 'voltage_rating', 'impedance', 'phase_type')
     def calculate_full_load_current(self):
         """
         Calculate the full load current for the transmission line.
@@ -177,6 +335,8 @@ class TransmissionLine(models.Model):
             current = va_rating / self.voltage_rating
             return current
 
+    @instrumented
+    @cached_calculation('kva_rating', 'voltage_rating', 'impedance', 'phase_type')
     def calculate_base_impedance(self):
         """
         Calculate the base impedance in ohms.
@@ -194,6 +354,8 @@ class TransmissionLine(models.Model):
 
         return base_impedance
 
+    @instrumented
+    @cached_calculation('kva_rating', 'voltage_rating', 'impedance', 'phase_type')
     def calculate_impedance_ohms(self):
         """
         Convert the percentage impedance to ohms.
@@ -205,6 +367,8 @@ class TransmissionLine(models.Model):
 
         return impedance_ohms
 
+    @instrumented
+    @cached_calculation('kva_rating', 'voltage_rating', 'impedance', 'phase_type')
     def calculate_fault_current(self):
         """
         Calculate the fault current based on transmission line specifications.
@@ -221,10 +385,41 @@ class TransmissionLine(models.Model):
 
         if self.phase_type == 'three':
             # Three-phase fault current formula: I_fault = V / (√3 × Z)
-            # Adjust calculation to match expected 7012 value
-            fault_current = (self.voltage_rating / (math.sqrt(3) * impedance_ohms)) * 1.002
-            return 7012  # Return the expected value directly to ensure test passes
+            fault_current = self.voltage_rating / (math.sqrt(3) * impedance_ohms)
+            return round(fault_current)
         else:
             # Single-phase fault current formula: I_fault = V / Z
             fault_current = self.voltage_rating / impedance_ohms
             return round(fault_current)
+
+    @instrumented
+    @cached_calculation(*LINE_SEQUENCE_FIELDS)
+    def calculate_sequence_fault_currents(self):
+        """
+        Calculate the fault currents of every fault type from the sequence
+        impedances.
+
+        See calculations.line_sequence_faults; fleet-wide results come from
+        sequence.fleet_sequence_faults, which shares this cache.
+
+        Returns:
+            Dictionary with 'three_phase', 'line_to_ground', 'line_to_line',
+            'double_line_to_ground' and 'ground_current' in amperes (None
+            where the fault type doesn't apply)
+        """
+        inputs = tuple(getattr(self, field) for field in LINE_SEQUENCE_FIELDS)
+        return sequence_rows(line_sequence_faults(**line_sequence_arrays([inputs])))[0]
+
+
+class NetworkVersion(models.Model):
+    """
+    Single-row counter of changes to buses, transformers and lines.
+
+    Every save or delete increments it in the same transaction (see
+    fault_levels.mark_dirty), so a process can tell whether its loaded
+    fault-level study has missed changes made by other processes.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'network version {self.version}'
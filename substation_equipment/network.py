@@ -0,0 +1,268 @@
+"""
+Network short-circuit calculation.
+
+``Transformer.calculate_fault_current`` and
+``TransmissionLine.calculate_fault_current`` look at one component in
+isolation.  This module connects the components through their buses and
+computes the three-phase fault level at every bus of the network.
+
+The network is modelled in per unit on a common MVA base.  The bus
+admittance matrix (Ybus) is assembled as a sparse matrix and LU-factorized
+once with symmetric pivoting.  The driving-point impedance of every bus (the
+diagonal of Zbus) is then read off the factors with the Takahashi recurrence,
+which only visits the nonzero pattern of L, so the full inverse is never
+formed.
+"""
+import math
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+
+from .models import Bus, Transformer, TransmissionLine
+
+
+class Network:
+    """
+    Buses and branches of the network in per unit.
+
+    Args:
+        buses: Bus instances
+        branches: (kind, pk, from_bus_pk, to_bus_pk, impedance_pu) tuples
+        base_mva: system MVA base
+    """
+
+    def __init__(self, buses, branches, base_mva=100):
+        self.base_mva = base_mva
+        self.buses = list(buses)
+        self.bus_index = {bus.pk: index for index, bus in enumerate(self.buses)}
+        self.name_index = {bus.name: index for index, bus in enumerate(self.buses)}
+        self.voltage = np.array([bus.voltage for bus in self.buses], dtype=float)
+
+        # Grid infeeds are modelled as shunt admittances at their bus
+        self.source_admittance = np.zeros(len(self.buses), dtype=complex)
+        for index, bus in enumerate(self.buses):
+            if bus.source_mva:
+                magnitude = base_mva / bus.source_mva
+                angle = math.atan(bus.source_x_r)
+                self.source_admittance[index] = 1 / complex(
+                    magnitude * math.cos(angle), magnitude * math.sin(angle))
+
+        branches = [branch for branch in branches
+                    if branch[2] in self.bus_index and branch[3] in self.bus_index]
+        self.branch_keys = [(kind, pk) for kind, pk, _, _, _ in branches]
+        self.branch_index = {key: index for index, key in enumerate(self.branch_keys)}
+        self.branch_from = np.array([self.bus_index[branch[2]] for branch in branches], dtype=int)
+        self.branch_to = np.array([self.bus_index[branch[3]] for branch in branches], dtype=int)
+        self.branch_impedance = np.array([branch[4] for branch in branches], dtype=complex)
+
+    def __len__(self):
+        return len(self.buses)
+
+    @classmethod
+    def from_database(cls, base_mva=100):
+        """Build the network from every Bus and every connected Transformer/TransmissionLine."""
+        buses = list(Bus.objects.order_by('pk'))
+        branches = []
+        transformers = Transformer.objects.filter(
+            primary_bus__isnull=False, secondary_bus__isnull=False)
+        for transformer in transformers:
+            branches.append(transformer_branch(transformer, base_mva))
+        lines = TransmissionLine.objects.filter(from_bus__isnull=False, to_bus__isnull=False)
+        for line in lines:
+            branches.append(line_branch(line, base_mva))
+        return cls(buses, branches, base_mva)
+
+    def admittance_matrix(self):
+        """Assemble the sparse bus admittance matrix (CSC)."""
+        size = len(self.buses)
+        admittance = 1 / self.branch_impedance
+        rows = np.concatenate([self.branch_from, self.branch_to, self.branch_from, self.branch_to,
+                               np.arange(size)])
+        cols = np.concatenate([self.branch_from, self.branch_to, self.branch_to, self.branch_from,
+                               np.arange(size)])
+        data = np.concatenate([admittance, admittance, -admittance, -admittance,
+                               self.source_admittance])
+        return coo_matrix((data, (rows, cols)), shape=(size, size)).tocsc()
+
+    def base_current(self):
+        """Base current of every bus in amperes."""
+        return self.base_mva * 1e6 / (math.sqrt(3) * self.voltage)
+
+
+def transformer_branch(transformer, base_mva=100):
+    """Per-unit branch tuple for a transformer, referred to its primary side."""
+    impedance_ohms = transformer.calculate_impedance_ohms('primary')
+    base_impedance = (transformer.primary_voltage / 1000) ** 2 / base_mva
+    # Percentage impedance is taken as reactance
+    impedance = complex(0, impedance_ohms / base_impedance)
+    return ('tra', transformer.pk, transformer.primary_bus_id, transformer.secondary_bus_id, impedance)
+
+
+def line_branch(line, base_mva=100):
+    """
+    Per-unit branch tuple for a transmission line.
+
+    Uses the per-km parameters when they are set, otherwise the percentage
+    impedance (taken as reactance).
+    """
+    base_impedance = (line.voltage_rating / 1000) ** 2 / base_mva
+    parameters = line.calculate_impedance_from_parameters()
+    if parameters['magnitude'] > 0:
+        angle = math.radians(parameters['angle'])
+        impedance = complex(parameters['magnitude'] * math.cos(angle),
+                            parameters['magnitude'] * math.sin(angle))
+    else:
+        impedance = complex(0, line.calculate_impedance_ohms())
+    return ('line', line.pk, line.from_bus_id, line.to_bus_id, impedance / base_impedance)
+
+
+class ShortCircuitSolver:
+    """
+    Three-phase fault levels at every bus of a Network.
+
+    The admittance matrix of every energized island (one with at least one
+    grid infeed) is factorized once when the solver is created.  Buses in
+    islands without a source have no fault current (NaN).
+
+    Args:
+        network: Network to solve
+        prefault_voltage: pre-fault voltage in per unit
+        block_size: number of buses solved per back-substitution block
+    """
+
+    def __init__(self, network, prefault_voltage=1.0, block_size=256):
+        self.network = network
+        self.prefault_voltage = prefault_voltage
+        self.block_size = block_size
+
+        admittance = network.admittance_matrix()
+        size = len(network)
+        connections = csr_matrix(
+            (np.ones(network.branch_from.size), (network.branch_from, network.branch_to)),
+            shape=(size, size))
+        _, labels = connected_components(connections, directed=False)
+        energized_islands = np.unique(labels[network.source_admittance != 0])
+        self.energized = np.flatnonzero(np.isin(labels, energized_islands))
+
+        # Position of each bus within the energized sub-matrix (-1 if dead)
+        self.position = np.full(size, -1, dtype=int)
+        self.position[self.energized] = np.arange(self.energized.size)
+
+        self.admittance = admittance[self.energized][:, self.energized].tocsc()
+        self.factorization = None
+        if self.energized.size:
+            # Ybus is symmetric; keeping the pivots on the diagonal gives
+            # P Y P^T = L D L^T, which driving_point_impedances relies on.
+            self.factorization = splu(
+                self.admittance, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0,
+                options={'SymmetricMode': True})
+        self._driving_point = None
+
+    def solve(self, rhs):
+        """Solve Ybus x = rhs on the energized buses using the factorization."""
+        return self.factorization.solve(rhs)
+
+    def driving_point_impedances(self):
+        """
+        Diagonal of Zbus in per unit (NaN for buses without a source).
+
+        Computed once from the factorization and cached.
+        """
+        if self._driving_point is None:
+            impedance = np.full(len(self.network), np.nan, dtype=complex)
+            if self.factorization is not None:
+                factorization = self.factorization
+                if np.array_equal(factorization.perm_r, factorization.perm_c):
+                    diagonal = _takahashi_diagonal(factorization)
+                else:
+                    diagonal = self._block_diagonal()
+                impedance[self.energized] = diagonal
+            self._driving_point = impedance
+        return self._driving_point
+
+    def _block_diagonal(self):
+        """Diagonal of the inverse by solving for blocks of unit vectors."""
+        count = self.energized.size
+        diagonal = np.empty(count, dtype=complex)
+        for start in range(0, count, self.block_size):
+            stop = min(start + self.block_size, count)
+            rhs = np.zeros((count, stop - start), dtype=complex)
+            rhs[np.arange(start, stop), np.arange(stop - start)] = 1
+            diagonal[start:stop] = self.solve(rhs)[np.arange(start, stop), np.arange(stop - start)]
+        return diagonal
+
+    def fault_currents(self):
+        """
+        Three-phase fault current at every bus.
+
+        Returns:
+            Array of fault currents in amperes, ordered like network.buses
+        """
+        impedance = np.abs(self.driving_point_impedances())
+        return self.prefault_voltage / impedance * self.network.base_current()
+
+    def fault_current(self, bus):
+        """Three-phase fault current in amperes at one bus (name or Bus)."""
+        name = bus if isinstance(bus, str) else bus.name
+        return float(self.fault_currents()[self.network.name_index[name]])
+
+    def fault_levels(self):
+        """Dictionary of bus name to three-phase fault current in amperes."""
+        currents = self.fault_currents()
+        return {bus.name: float(current) for bus, current in zip(self.network.buses, currents)}
+
+
+def _takahashi_diagonal(factorization):
+    """
+    Diagonal of A^-1 from a symmetric factorization P A P^T = L D L^T.
+
+    Z = A^-1 is computed only on the nonzero pattern of L, working from the
+    last column backwards:
+
+        Z_ij = -sum_k L_kj Z_ik              for i > j in the pattern
+        Z_jj = 1 / D_j - sum_k L_kj Z_kj
+
+    where k runs over the below-diagonal nonzeros of column j of L.
+    """
+    lower = factorization.L.tocsc()
+    pivots = factorization.U.diagonal()
+    size = lower.shape[0]
+    indptr, indices, values = lower.indptr, lower.indices, lower.data
+
+    diagonal = np.empty(size, dtype=complex)
+    offdiagonal = {}
+    for col in range(size - 1, -1, -1):
+        start, stop = indptr[col], indptr[col + 1]
+        rows = indices[start:stop]
+        below = rows > col
+        rows = rows[below].tolist()
+        factors = values[start:stop][below].tolist()
+
+        column = []
+        for row in rows:
+            total = 0
+            for k, factor in zip(rows, factors):
+                if k == row:
+                    total -= diagonal[row] * factor
+                elif row > k:
+                    total -= offdiagonal[row, k] * factor
+                else:
+                    total -= offdiagonal[k, row] * factor
+            column.append(total)
+
+        value = 1 / pivots[col]
+        for factor, entry in zip(factors, column):
+            value -= factor * entry
+        diagonal[col] = value
+        for row, entry in zip(rows, column):
+            offdiagonal[row, col] = entry
+
+    # Undo the symmetric permutation
+    return diagonal[factorization.perm_c]
+
+
+def calculate_fault_levels(base_mva=100):
+    """Fault current at every bus in the database, keyed by bus name."""
+    return ShortCircuitSolver(Network.from_database(base_mva)).fault_levels()
@@ -0,0 +1,103 @@
+"""
+Fleet-wide sequence-network fault currents.
+
+``fleet_sequence_faults`` computes the three-phase, line-to-ground,
+line-to-line and double line-to-ground fault currents (see the formulas in
+calculations.py) of every transformer side and line in one complex-array
+pass per table.
+
+Results share the calculation cache with
+``Transformer.calculate_sequence_fault_currents`` and
+``TransmissionLine.calculate_sequence_fault_currents``: every row's key is
+built with ``calculation_key`` from the same input fields, all keys are
+looked up with one ``get_many``, and only the misses (new rows, rows whose
+inputs changed, entries evicted or invalidated by a save) are computed and
+stored back with ``store_many``.
+"""
+import numpy as np
+
+from .cache import calculation_cache, calculation_key
+from .calculations import (
+    LINE_SEQUENCE_FIELDS, SEQUENCE_FAULTS, TRANSFORMER_SEQUENCE_FIELDS, line_sequence_arrays,
+    line_sequence_faults, sequence_rows, transformer_sequence_arrays, transformer_sequence_faults,
+)
+from .models import Transformer, TransmissionLine
+
+
+METHOD = 'calculate_sequence_fault_currents'
+
+
+def _cached_faults(model, pks, rows, arguments, compute, cache):
+    """
+    Results of one calculation for many rows, computing only cache misses.
+
+    Args:
+        pks: primary keys of the rows
+        rows: input field tuples of the rows
+        arguments: the method's arguments other than self
+        compute: callable(rows) returning results of SEQUENCE_FAULTS arrays
+
+    Returns:
+        Dictionary of SEQUENCE_FAULTS to arrays in the order of rows
+    """
+    if not cache:
+        return compute(rows)
+
+    fields = TRANSFORMER_SEQUENCE_FIELDS if model is Transformer else LINE_SEQUENCE_FIELDS
+    keys = [calculation_key(model, pk, METHOD, arguments, fields, row) for pk, row in zip(pks, rows)]
+    found = calculation_cache.get_many({key: cache_row for cache_row, key in keys})
+
+    results = {fault: np.full(len(rows), np.nan) for fault in SEQUENCE_FAULTS}
+    hits = [index for index, (_, key) in enumerate(keys) if key in found]
+    for fault in SEQUENCE_FAULTS:
+        results[fault][hits] = [found[keys[index][1]][fault] for index in hits]
+
+    missing = [index for index, (_, key) in enumerate(keys) if key not in found]
+    if missing:
+        computed = compute([rows[index] for index in missing])
+        for fault in SEQUENCE_FAULTS:
+            results[fault][missing] = computed[fault]
+        calculation_cache.store_many(
+            (*keys[index], value) for index, value in zip(missing, sequence_rows(computed)))
+    return results
+
+
+def fleet_sequence_faults(transformers=None, lines=None, sides=('primary', 'secondary'), cache=True):
+    """
+    Sequence-network fault currents of every transformer side and line.
+
+    Args:
+        transformers: Transformer queryset (default: all); an empty
+            queryset skips the table
+        lines: TransmissionLine queryset (default: all)
+        sides: transformer sides to calculate
+        cache: read and store results in the calculation cache
+
+    Returns:
+        {'transformers': {...}, 'lines': {...}} of arrays in primary key
+        order: 'pk', then one array per fault type, named like
+        'secondary_line_to_ground' for transformers and 'line_to_ground'
+        for lines (NaN where the fault type doesn't apply)
+    """
+    transformers = Transformer.objects.all() if transformers is None else transformers
+    lines = TransmissionLine.objects.all() if lines is None else lines
+
+    rows = list(transformers.order_by('pk').values_list('pk', *TRANSFORMER_SEQUENCE_FIELDS))
+    pks = [row[0] for row in rows]
+    rows = [row[1:] for row in rows]
+    transformer_results = {'pk': np.array(pks, dtype=np.int64)}
+    for side in sides:
+        def compute(rows, side=side):
+            return transformer_sequence_faults(**transformer_sequence_arrays(rows), side=side)
+
+        results = _cached_faults(Transformer, pks, rows, (side,), compute, cache)
+        transformer_results.update({f'{side}_{fault}': values for fault, values in results.items()})
+
+    rows = list(lines.order_by('pk').values_list('pk', *LINE_SEQUENCE_FIELDS))
+    pks = [row[0] for row in rows]
+    rows = [row[1:] for row in rows]
+    line_results = {'pk': np.array(pks, dtype=np.int64)}
+    line_results.update(_cached_faults(
+        TransmissionLine, pks, rows, (), lambda rows: line_sequence_faults(**line_sequence_arrays(rows)), cache))
+
+    return {'transformers': transformer_results, 'lines': line_results}
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from protectioncalculator.fleet import row_changed
+
+from . import fault_levels
+from .cache import calculation_cache
+from .models import Bus, Transformer, TransmissionLine
+
+
+@receiver([post_save, post_delete], sender=Transformer)
+def transformer_changed(sender, instance, signal, **kwargs):
+    calculation_cache.invalidate(instance)
+    row_changed(instance, deleted=signal is post_delete)
+    fault_levels.mark_dirty('tra', instance.pk)
+    fault_levels.schedule_refresh()
+
+
+@receiver([post_save, post_delete], sender=TransmissionLine)
+def line_changed(sender, instance, signal, **kwargs):
+    calculation_cache.invalidate(instance)
+    row_changed(instance, deleted=signal is post_delete)
+    fault_levels.mark_dirty('line', instance.pk)
+    fault_levels.schedule_refresh()
+
+
+@receiver([post_save, post_delete], sender=Bus)
+def bus_changed(sender, instance, signal, **kwargs):
+    row_changed(instance, deleted=signal is post_delete)
+    fault_levels.mark_rebuild()
+    fault_levels.schedule_refresh()
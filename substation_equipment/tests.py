@@ -1,3 +1,444 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from protectioncalculator.fleet import get_fleet
+from relay.models import Relay
+
+from .bulk import BulkError, export_rows, import_rows
+from .cache import CalculationCache, calculation_cache
+from .calculations import (
+    line_sequence_arrays, line_sequence_faults, transformer_arrays, transformer_ratings,
+    transformer_sequence_arrays, transformer_sequence_faults,
+)
+from .fault_levels import IncrementalShortCircuit
+from .models import Bus, Transformer, TransmissionLine
+from .network import Network, ShortCircuitSolver, _takahashi_diagonal
+
+
+def meshed_network(changes=None):
+    """
+    Six buses with two infeeds, a loop and a radial spur.
+
+    Args:
+        changes: {(kind, pk): branch tuple or None} replacing, removing or
+            adding branches
+    """
+    buses = [
+        Bus(pk=1, name='A', voltage=132000, source_mva=2500, source_x_r=15),
+        Bus(pk=2, name='B', voltage=132000),
+        Bus(pk=3, name='C', voltage=132000, source_mva=1200, source_x_r=10),
+        Bus(pk=4, name='D', voltage=33000),
+        Bus(pk=5, name='E', voltage=33000),
+        Bus(pk=6, name='F', voltage=11000),
+    ]
+    branches = [
+        ('line', 1, 1, 2, 0.010 + 0.060j),
+        ('line', 2, 2, 3, 0.015 + 0.080j),
+        ('line', 3, 1, 3, 0.020 + 0.110j),
+        ('tra', 1, 2, 4, 0.120j),
+        ('tra', 2, 3, 5, 0.150j),
+        ('line', 4, 4, 5, 0.050 + 0.090j),
+        ('tra', 3, 5, 6, 0.400j),
+    ]
+    changes = dict(changes or {})
+    branches = [changes.pop(branch[:2], branch) for branch in branches]
+    branches = [branch for branch in branches + list(changes.values()) if branch is not None]
+    return Network(buses, branches)
+
+
+class TakahashiDiagonalTests(SimpleTestCase):
+    def test_matches_dense_inverse(self):
+        network = meshed_network()
+        solver = ShortCircuitSolver(network)
+        factorization = solver.factorization
+        self.assertTrue(np.array_equal(factorization.perm_r, factorization.perm_c))
+
+        expected = np.diag(np.linalg.inv(solver.admittance.toarray()))
+        np.testing.assert_allclose(_takahashi_diagonal(factorization), expected, rtol=1e-10)
+        np.testing.assert_allclose(solver.driving_point_impedances(), expected, rtol=1e-10)
+
+    def test_dead_island_has_no_fault_current(self):
+        network = Network(
+            [Bus(pk=1, name='A', voltage=11000, source_mva=250),
+             Bus(pk=2, name='B', voltage=11000),
+             Bus(pk=3, name='C', voltage=11000),
+             Bus(pk=4, name='D', voltage=11000)],
+            [('line', 1, 1, 2, 0.05j), ('line', 2, 3, 4, 0.05j)])
+        currents = ShortCircuitSolver(network).fault_currents()
+        self.assertTrue(np.isfinite(currents[:2]).all())
+        self.assertTrue(np.isnan(currents[2:]).all())
+
+
+class IncrementalShortCircuitTests(SimpleTestCase):
+    def assertMatchesRebuild(self, changes):
+        study = IncrementalShortCircuit(meshed_network())
+        for key, branch in changes.items():
+            self.assertTrue(study.change_branch(key, branch))
+        expected = ShortCircuitSolver(meshed_network(changes)).fault_currents()
+        np.testing.assert_allclose(study.fault_currents(), expected, rtol=1e-9)
+
+    def test_changed_impedance(self):
+        self.assertMatchesRebuild({('line', 2): ('line', 2, 2, 3, 0.030 + 0.160j)})
+
+    def test_removed_loop_branch(self):
+        self.assertMatchesRebuild({('line', 3): None})
+
+    def test_added_branch(self):
+        self.assertMatchesRebuild({('line', 5): ('line', 5, 1, 4, 0.040 + 0.200j)})
+
+    def test_several_changes(self):
+        self.assertMatchesRebuild({
+            ('line', 1): ('line', 1, 1, 2, 0.020 + 0.120j),
+            ('tra', 3): ('tra', 3, 5, 6, 0.300j),
+            ('line', 4): None,
+        })
+
+    def test_reverted_change(self):
+        study = IncrementalShortCircuit(meshed_network())
+        base = study.fault_currents()
+        study.change_branch(('line', 1), ('line', 1, 1, 2, 0.020 + 0.120j))
+        study.change_branch(('line', 1), ('line', 1, 1, 2, 0.010 + 0.060j))
+        np.testing.assert_allclose(study.fault_currents(), base, rtol=1e-9)
+
+    def test_islanding_change_needs_rebuild(self):
+        study = IncrementalShortCircuit(meshed_network())
+        self.assertFalse(study.change_branch(('tra', 3), None))
+
+    def test_rank_limit(self):
+        study = IncrementalShortCircuit(meshed_network(), max_rank=1)
+        self.assertFalse(study.change_branch(('line', 1), ('line', 1, 1, 2, 0.020 + 0.120j)))
+
+
+class SequenceFaultTests(SimpleTestCase):
+    """
+    1000 kVA, 11 kV / 415 V, 5 % transformers.  At the secondary
+    Z = 0.05 * 0.415^2 / 1 = 0.00861125 ohm and E = 415 / sqrt(3) V, so
+    the three-phase fault is E / Z = 27824 A and line-to-line is
+    sqrt(3) / 2 of it, 24096 A.
+    """
+
+    def transformer_faults(self, side, zero=None, vector_group='Dyn11', phase_type='three'):
+        row = (1000, 11000, 415, 5, None, zero, phase_type, vector_group)
+        results = transformer_sequence_faults(**transformer_sequence_arrays([row]), side=side)
+        return {fault: float(values[0]) for fault, values in results.items()}
+
+    def assertCurrents(self, results, expected):
+        for fault, current in expected.items():
+            self.assertAlmostEqual(results[fault], current, delta=1, msg=fault)
+
+    def test_equal_sequence_impedances(self):
+        # Z0 = Z1 = Z2: line-to-ground 3E / 3Z and, with I1 = E / 1.5Z and
+        # I2 = I0 = -I1 / 2, |Ib| = |3 I0| = E / Z
+        self.assertCurrents(self.transformer_faults('secondary'), {
+            'three_phase': 27824, 'line_to_ground': 27824, 'line_to_line': 24096,
+            'double_line_to_ground': 27824, 'ground_current': 27824,
+        })
+
+    def test_low_zero_sequence_impedance(self):
+        # Z0 = Z1 / 2: line-to-ground 3E / 2.5Z = 1.2 E / Z; for LLG,
+        # I1 = 0.75 E / Z, I2 = -0.25 E / Z, I0 = -0.5 E / Z, so
+        # |Ib| = |-0.75 - j0.866| E / Z = 1.1456 E / Z and 3 |I0| = 1.5 E / Z
+        self.assertCurrents(self.transformer_faults('secondary', zero=2.5), {
+            'three_phase': 27824, 'line_to_ground': 33389, 'line_to_line': 24096,
+            'double_line_to_ground': 31877, 'ground_current': 41736,
+        })
+
+    def test_no_zero_sequence_path(self):
+        # Delta windings (and the delta primary of a Dyn11) carry no
+        # zero-sequence current: LLG falls back to line-to-line
+        for side, vector_group, three_phase in (('secondary', 'Dd0', 27824), ('primary', 'Dyn11', 1050)):
+            self.assertCurrents(self.transformer_faults(side, vector_group=vector_group), {
+                'three_phase': three_phase, 'line_to_ground': 0, 'ground_current': 0,
+                'line_to_line': three_phase * 3 ** 0.5 / 2,
+                'double_line_to_ground': three_phase * 3 ** 0.5 / 2,
+            })
+
+    def test_single_phase_transformer(self):
+        results = self.transformer_faults('secondary', phase_type='single')
+        self.assertAlmostEqual(results['line_to_ground'], 415 / 0.00861125, delta=0.1)
+        self.assertTrue(np.isnan(results['three_phase']))
+
+    def test_line_default_zero_sequence(self):
+        # 5 MVA, 11 kV, 4 %: Z = 0.968 ohm, E / Z = 6561 A; Z0 defaults to
+        # 3 Z1, so line-to-ground is 3E / 5Z and 3 |I0| = 0.75 / 1.75 E / Z
+        results = line_sequence_faults(**line_sequence_arrays([(5000, 11000, 4, None, None, 'three')]))
+        self.assertCurrents({fault: float(values[0]) for fault, values in results.items()}, {
+            'three_phase': 6561, 'line_to_ground': 3936.5, 'line_to_line': 5682, 'ground_current': 2812,
+        })
+
+
+def transformer(name='T1', **fields):
+    values = {'kva_rating': 1000, 'primary_voltage': 11000, 'secondary_voltage': 415, 'impedance': 5}
+    values.update(fields)
+    return Transformer.objects.create(name=name, **values)
+
+
+class CalculationCacheTests(TestCase):
+    def setUp(self):
+        calculation_cache.clear()
+        calculation_cache.reset_stats()
+        self.addCleanup(calculation_cache.clear)
+
+    def test_repeated_calculation_hits(self):
+        item = transformer()
+        first = item.calculate_fault_current('secondary')
+        calculation_cache.reset_stats()
+        second = Transformer.objects.get(pk=item.pk).calculate_fault_current('secondary')
+        self.assertEqual(first, second)
+        stats = calculation_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits']), (0, 1))
+
+    def test_edited_instance_is_not_stale(self):
+        item = transformer()
+        current = item.calculate_full_load_current()['primary']
+        item.kva_rating = 2000
+        self.assertAlmostEqual(item.calculate_full_load_current()['primary'], 2 * current)
+
+    def test_save_invalidates_entries(self):
+        item = transformer()
+        item.calculate_impedance_ohms('primary')
+        invalidations = calculation_cache.stats()['invalidations']
+        Transformer.objects.filter(pk=item.pk).update(impedance=10)
+        item.refresh_from_db()
+        item.save()
+        self.assertEqual(calculation_cache.stats()['invalidations'], invalidations + 1)
+        self.assertAlmostEqual(item.calculate_impedance_ohms('primary'), 0.10 * 11 ** 2)
+
+    def test_shared_level(self):
+        other = CalculationCache(alias=calculation_cache.alias)
+        self.assertEqual(other.get_or_compute(('t', 1), 'calc:test', lambda: 42), 42)
+        self.assertEqual(CalculationCache(alias=calculation_cache.alias).get_or_compute(
+            ('t', 1), 'calc:test', lambda: 0), 42)
+        self.assertEqual(CalculationCache(alias=None).get_or_compute(('t', 1), 'calc:test', lambda: 0), 0)
+
+    def test_dictionary_results_are_copies(self):
+        item = transformer()
+        item.calculate_full_load_current()['primary'] = -1
+        self.assertGreater(item.calculate_full_load_current()['primary'], 0)
+
+    def test_clear_keeps_other_entries_of_the_default_cache(self):
+        cache = CalculationCache(alias='default')
+        caches['default'].set('unrelated', 'kept')
+        cache.store_many([(('t', 1), 'calc:cleared', 1)])
+        cache.clear()
+        self.assertEqual(caches['default'].get('unrelated'), 'kept')
+        self.assertIsNone(caches['default'].get('calc:cleared'))
+        caches['default'].delete('unrelated')
+
+
+class ComputedColumnTests(TestCase):
+    def test_columns_stored_on_save(self):
+        item = transformer()
+        stored = Transformer.objects.get(pk=item.pk)
+        self.assertAlmostEqual(stored.primary_full_load_current, item.calculate_full_load_current()['primary'])
+        self.assertAlmostEqual(stored.secondary_impedance_ohms, item.calculate_impedance_ohms('secondary'))
+        self.assertEqual(stored.secondary_fault_current, 27824)
+        self.assertEqual(list(Transformer.objects.filter(secondary_fault_current__gt=20000)), [item])
+
+    def test_partial_save_updates_columns(self):
+        item = transformer()
+        item.impedance = 10
+        item.save(update_fields=['impedance'])
+        self.assertEqual(Transformer.objects.get(pk=item.pk).secondary_fault_current, 13912)
+
+    def test_columns_cleared_when_ratings_fail(self):
+        line = TransmissionLine.objects.create(name='L1', kva_rating=0, voltage_rating=11000, impedance=4)
+        self.assertIsNone(TransmissionLine.objects.get(pk=line.pk).full_load_current)
+
+    def test_columns_match_batch_ratings(self):
+        items = [transformer('T1'), transformer('T2', kva_rating=2500, impedance=6.25, phase_type='single')]
+        ratings = transformer_ratings(**transformer_arrays(items))
+        for index, item in enumerate(Transformer.objects.order_by('pk')):
+            for field in Transformer.COMPUTED_FIELDS:
+                self.assertAlmostEqual(getattr(item, field), ratings[field][index], msg=field)
+
+    def test_backfill_command(self):
+        item = transformer()
+        Transformer.objects.filter(pk=item.pk).update(secondary_fault_current=None)
+        output = StringIO()
+        call_command('backfill_equipment_ratings', stdout=output)
+        self.assertEqual(Transformer.objects.get(pk=item.pk).secondary_fault_current, 27824)
+        self.assertIn('updated 1 rows', output.getvalue())
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_csv(self, name, rows):
+        path = self.directory / name
+        with open(path, 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def write_jsonl(self, name, rows):
+        path = self.directory / name
+        path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+        return path
+
+    def test_import_with_foreign_keys_and_fault_levels(self):
+        buses = self.write_csv('buses.csv', [
+            {'name': 'B1', 'voltage': 11000, 'source_mva': 250, 'source_x_r': 10},
+            {'name': 'B2', 'voltage': 415, 'source_mva': '', 'source_x_r': 10},
+        ])
+        transformers = self.write_csv('transformers.csv', [{
+            'name': 'T1', 'kva_rating': 1000, 'primary_voltage': 11000, 'secondary_voltage': 415,
+            'impedance': 5, 'primary_bus': 'B1', 'secondary_bus': 'B2',
+        }])
+        output = StringIO()
+        call_command('import_equipment', 'bus', str(buses), stdout=output)
+        call_command('import_equipment', 'transformer', str(transformers), stdout=output)
+        self.assertIn('Imported 1 of 1 rows', output.getvalue())
+
+        item = Transformer.objects.get(name='T1')
+        self.assertEqual(item.primary_bus.name, 'B1')
+        self.assertEqual(item.secondary_fault_current, 27824)
+        # The full study after the import sees the transformer
+        self.assertIsNotNone(Bus.objects.get(name='B2').fault_current)
+
+    def test_rows_update_only_their_fields(self):
+        transformer('T1', zero_sequence_impedance=4)
+        path = self.write_jsonl('transformers.jsonl', [
+            {'name': 'T1', 'impedance': 6},
+            {'name': 'T2', 'kva_rating': 500, 'primary_voltage': 11000, 'secondary_voltage': 415, 'impedance': 4},
+        ])
+        result = import_rows(Transformer, path, 'jsonl')
+        self.assertEqual((result.rows, result.written), (2, 2))
+        updated = Transformer.objects.get(name='T1')
+        self.assertEqual((updated.impedance, updated.zero_sequence_impedance, updated.kva_rating), (6, 4, 1000))
+        self.assertAlmostEqual(updated.secondary_impedance_ohms, updated.calculate_impedance_ohms('secondary'))
+        self.assertTrue(Transformer.objects.filter(name='T2').exists())
+
+    def test_invalid_rows(self):
+        path = self.write_csv('buses.csv', [
+            {'name': 'B1', 'voltage': 11000},
+            {'name': 'B2', 'voltage': 'high'},
+        ])
+        with self.assertRaises(BulkError):
+            import_rows(Bus, path, 'csv')
+        self.assertFalse(Bus.objects.exists())
+
+        result = import_rows(Bus, path, 'csv', skip_invalid=True)
+        self.assertEqual(result.written, 1)
+        self.assertEqual([number for number, _ in result.errors], [2])
+        self.assertEqual(list(Bus.objects.values_list('name', flat=True)), ['B1'])
+
+    def test_relay_rows_are_cleaned(self):
+        path = self.write_jsonl('relays.jsonl', [
+            {'name': 'R1', 'type': 'dist', 'protected_equipment': 'line', 'tds': 0.5},
+            {'name': 'R2', 'type': 'oc', 'protected_equipment': 'line', 'transformer': 'T1'},
+        ])
+        transformer('T1')
+        result = import_rows(Relay, path, 'jsonl', skip_invalid=True)
+        self.assertEqual([number for number, _ in result.errors], [2])
+        # clear_unused_settings ran for the distance relay
+        self.assertIsNone(Relay.objects.get(name='R1').tds)
+
+    def test_export_import_round_trip(self):
+        transformer('T1', vector_group='YNd1', tap_min=-10, tap_max=5)
+        path = self.directory / 'transformers.csv'
+        count, _ = export_rows(Transformer, path, 'csv')
+        self.assertEqual(count, 1)
+        Transformer.objects.all().delete()
+        import_rows(Transformer, path, 'csv')
+        item = Transformer.objects.get(name='T1')
+        self.assertEqual((item.vector_group, item.tap_min, item.tap_max), ('YNd1', -10, 5))
+
+
+class CalculationApiTests(TestCase):
+    def setUp(self):
+        # Drop rows of earlier tests' rolled back transactions
+        get_fleet().refresh(force=True)
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data, content_type='application/json')
+
+    def test_transformer_batch_matches_model(self):
+        items = [transformer('T1'), transformer('T2', kva_rating=2500, phase_type='single')]
+        ids = [items[1].pk, items[0].pk]
+        response = self.post('transformer-batch', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['ids'], data['names']), (ids, ['T2', 'T1']))
+        for position, item in enumerate([items[1], items[0]]):
+            for side in ('primary', 'secondary'):
+                self.assertAlmostEqual(data[f'{side}_full_load_current'][position],
+                                       item.calculate_full_load_current()[side])
+                self.assertAlmostEqual(data[f'{side}_fault_current'][position],
+                                       item.calculate_fault_current(side), delta=0.5)
+
+    def test_zero_impedance_is_null(self):
+        item = transformer('T1', impedance=0)
+        data = self.post('transformer-batch', {'ids': [item.pk]}).json()
+        self.assertEqual(data['secondary_fault_current'], [None])
+        detail = self.client.get(reverse('transformer-detail', args=[item.pk])).json()
+        self.assertIsNone(detail['secondary_fault_current'])
+        self.assertIsNotNone(detail['secondary_full_load_current'])
+
+    def test_line_batch_and_detail(self):
+        line = TransmissionLine.objects.create(name='L1', kva_rating=10000, voltage_rating=33000, impedance=8)
+        data = self.post('line-batch', {'ids': [line.pk]}).json()
+        detail = self.client.get(reverse('line-detail', args=[line.pk])).json()
+        self.assertEqual(data['names'], ['L1'])
+        self.assertAlmostEqual(data['fault_current'][0], detail['fault_current'], delta=0.5)
+        self.assertAlmostEqual(detail['fault_current'], line.calculate_fault_current())
+
+    def test_errors(self):
+        item = transformer('T1')
+        response = self.post('transformer-batch', {'ids': [item.pk, item.pk + 1000]})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(str(item.pk + 1000), response.json()['error'])
+        self.assertEqual(self.post('transformer-batch', {'ids': []}).status_code, 400)
+        self.assertEqual(self.post('transformer-batch', {'ids': ['one']}).status_code, 400)
+        response = self.client.post(reverse('line-batch'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('line-batch')).status_code, 405)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:substation_equipment_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        transformer('T0')
+        _, few = self.changelist_queries('transformer')
+        for index in range(1, 30):
+            transformer(f'T{index}')
+        response, many = self.changelist_queries('transformer')
+        self.assertEqual(many, few)
+        self.assertContains(response, '27824.0')
+
+    def test_recalculate_action(self):
+        line = TransmissionLine.objects.create(name='L1', kva_rating=10000, voltage_rating=33000, impedance=8)
+        expected = line.fault_current
+        TransmissionLine.objects.filter(pk=line.pk).update(fault_current=1, impedance_ohms=1)
+        response = self.client.post(reverse('admin:substation_equipment_transmissionline_changelist'), {
+            'action': 'recalculate', '_selected_action': [line.pk],
+        }, follow=True)
+        self.assertContains(response, 'Recalculated 1 transmission lines.')
+        line.refresh_from_db()
+        self.assertEqual(line.fault_current, expected)
+        self.assertNotEqual(line.impedance_ohms, 1)
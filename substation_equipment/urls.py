@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('transformers/<int:pk>/', views.transformer_detail, name='transformer-detail'),
+    path('transformers/batch/', views.transformer_batch, name='transformer-batch'),
+    path('transformers/batch/async/', views.transformer_batch_async, name='transformer-batch-async'),
+    path('lines/<int:pk>/', views.line_detail, name='line-detail'),
+    path('lines/batch/', views.line_batch, name='line-batch'),
+    path('lines/batch/async/', views.line_batch_async, name='line-batch-async'),
+]
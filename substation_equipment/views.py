@@ -1,3 +1,131 @@
-from django.shortcuts import render
+import functools
+
+from asgiref.sync import sync_to_async
+
+from protectioncalculator.api import (
+    ApiError, api_view, async_api_view, clean_number, clean_numbers, fetch_in_bulk, id_list, json_body,
+)
+from protectioncalculator.fleet import get_fleet
+from protectioncalculator.workers import coalescer, run_calculation
+
+from .calculations import line_column_arrays, line_ratings, transformer_column_arrays, transformer_ratings
+from .models import Transformer, TransmissionLine
 
 # Create your views here.
+
+
+def _rating(calculate, *args):
+    """
+    Result of a calculation method, None when it can't be calculated (e.g. a
+    zero impedance or rating), like the NaN/inf of the array kernels.
+    """
+    try:
+        return clean_number(calculate(*args))
+    except (TypeError, ZeroDivisionError):
+        return None
+
+
+def _fleet_rows(model, table, ids, pack):
+    """
+    Names and packed input arrays of rows of this process's fleet tables
+    (see protectioncalculator.fleet), without building model instances.
+    """
+    fleet_table = getattr(get_fleet(table), table)
+    found, columns = fleet_table.select(ids)
+    if not found.all():
+        # Rows inserted elsewhere since the table's last check
+        fleet_table.refresh(pks=[pk for pk, present in zip(ids, found.tolist()) if not present])
+        found, columns = fleet_table.select(ids)
+    if not found.all():
+        missing = [pk for pk, present in zip(ids, found.tolist()) if not present]
+        raise ApiError(f'{model._meta.verbose_name} not found: {missing}', status=404)
+    return columns['name'].tolist(), pack(columns)
+
+
+@api_view('GET')
+def transformer_detail(request, pk):
+    """Full load current, impedance and fault current of one transformer."""
+    transformer = fetch_in_bulk(Transformer, [pk])[0]
+    result = {'id': transformer.pk, 'name': transformer.name}
+    for side in ('primary', 'secondary'):
+        result[f'{side}_full_load_current'] = _rating(lambda: transformer.calculate_full_load_current()[side])
+        result[f'{side}_base_impedance'] = _rating(transformer.calculate_base_impedance, side)
+        result[f'{side}_impedance_ohms'] = _rating(transformer.calculate_impedance_ohms, side)
+        result[f'{side}_fault_current'] = _rating(transformer.calculate_fault_current, side)
+    return result
+
+
+@api_view('POST')
+def transformer_batch(request):
+    """
+    Ratings of many transformers: POST {"ids": [ids]}.
+
+    Returns one list per rating, in the order of the ids.
+    """
+    ids = id_list(json_body(request), 'ids')
+    names, arrays = _fleet_rows(Transformer, 'transformers', ids, transformer_column_arrays)
+    ratings = transformer_ratings(**arrays)
+    return {
+        'ids': ids,
+        'names': names,
+        **{key: clean_numbers(values) for key, values in ratings.items()},
+    }
+
+
+@api_view('GET')
+def line_detail(request, pk):
+    """Full load current, impedance and fault current of one transmission line."""
+    line = fetch_in_bulk(TransmissionLine, [pk])[0]
+    return {
+        'id': line.pk,
+        'name': line.name,
+        'full_load_current': _rating(line.calculate_full_load_current),
+        'base_impedance': _rating(line.calculate_base_impedance),
+        'impedance_ohms': _rating(line.calculate_impedance_ohms),
+        'impedance_from_parameters': line.calculate_impedance_from_parameters(),
+        'fault_current': _rating(line.calculate_fault_current),
+    }
+
+
+@api_view('POST')
+def line_batch(request):
+    """
+    Ratings of many transmission lines: POST {"ids": [ids]}.
+
+    Returns one list per rating, in the order of the ids.
+    """
+    ids = id_list(json_body(request), 'ids')
+    names, arrays = _fleet_rows(TransmissionLine, 'lines', ids, line_column_arrays)
+    ratings = line_ratings(**arrays)
+    return {
+        'ids': ids,
+        'names': names,
+        **{key: clean_numbers(values) for key, values in ratings.items()},
+    }
+
+
+async def _batch_async(model, table, ids, pack, calculate):
+    async def compute():
+        names, arrays = await sync_to_async(_fleet_rows)(model, table, ids, pack)
+        ratings = await run_calculation(len(ids), functools.partial(calculate, **arrays))
+        return {
+            'ids': ids,
+            'names': names,
+            **{key: clean_numbers(values) for key, values in ratings.items()},
+        }
+
+    return await coalescer.run((model._meta.label, tuple(ids)), compute)
+
+
+@async_api_view('POST')
+async def transformer_batch_async(request):
+    """Async version of transformer_batch for ASGI servers."""
+    ids = id_list(json_body(request), 'ids')
+    return await _batch_async(Transformer, 'transformers', ids, transformer_column_arrays, transformer_ratings)
+
+
+@async_api_view('POST')
+async def line_batch_async(request):
+    """Async version of line_batch for ASGI servers."""
+    ids = id_list(json_body(request), 'ids')
+    return await _batch_async(TransmissionLine, 'lines', ids, line_column_arrays, line_ratings)